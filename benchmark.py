@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# Copyright (c) 2009-2011 Nexedi SA and Contributors. All Rights Reserved.
+#                    Pelletier Vincent <vincent@nexedi.com>
+#
+# WARNING: This program as such is intended to be used by professional
+# programmers who take the whole responsability of assessing all potential
+# consequences resulting from its eventual inadequacies and bugs
+# End users who are looking for a ready-to-use solution with commercial
+# garantees and support are strongly adviced to contract a Free Software
+# Service Company
+#
+# This program is Free Software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+##############################################################################
+"""
+xfw benchmark suite.
+
+Each scenario parses or generates synthetic data following a given
+structure, and is run in its own process so its peak memory usage can be
+measured. Reports records/s, MB/s and peak memory per scenario, and can save
+results as JSON to compare runs:
+
+    python benchmark.py --output before.json
+    (change things)
+    python benchmark.py --compare before.json
+
+Run with --help for more options.
+"""
+from __future__ import print_function
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+try:
+    import resource
+except ImportError:
+    resource = None
+import xfw
+
+timer = getattr(time, 'perf_counter', time.time)
+
+def _getPeakMemory():
+    """
+    Peak resident set size of current process, in bytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    result = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux & BSD report kilobytes.
+        result *= 1024
+    return result
+
+# Structures.
+
+def getNarrowStructure(cast):
+    return xfw.FieldList([
+        (xfw.IntegerField(8, cast=cast), True, 'id'),
+        (xfw.StringField(20, cast=cast), False, 'name'),
+        (xfw.IntegerField(6, cast=cast), False, 'amount'),
+    ], 34)
+
+def getWideStructure(cast, field_count=120):
+    field_list = []
+    for index in range(field_count):
+        if index % 3 == 0:
+            field = xfw.IntegerField(6, cast=cast)
+        elif index % 3 == 1:
+            field = xfw.StringField(10, cast=cast)
+        else:
+            field = xfw.DateTimeField('%Y%m%d', cast=cast)
+        field_list.append((field, False, 'field_%i' % (index, )))
+    return xfw.FieldList(field_list, 8 * field_count)
+
+def getNestedStructure(cast):
+    """
+    Same layout as README example: a head giving the number of blocks, each
+    block having a head giving the type and number of its rows.
+    """
+    root_head = xfw.FieldList([
+        (xfw.StringField(5), True, 'header_id'),
+        (xfw.IntegerField(8, cast=True), True, 'block_count'),
+        (xfw.StringField(15, cast=cast), False, 'comment'),
+    ], 28, fixed_value_dict={
+        'header_id': b'HEAD1',
+    })
+    block_head = xfw.FieldList([
+        (xfw.DateTimeField('%Y%m%d', cast=cast), True, 'date'),
+        (xfw.IntegerField(2, cast=True), True, 'row_type'),
+        (xfw.IntegerField(4, cast=True), True, 'row_count'),
+    ], 14)
+    row_base = xfw.FieldList([
+        (xfw.DateTimeField('%H%M%S', cast=cast), True, 'time'),
+    ], 6)
+    row_type_dict = {
+        1: xfw.FieldList([
+            row_base,
+            (xfw.StringField(10, cast=cast), True, 'description'),
+        ], 16),
+        2: xfw.FieldList([
+            row_base,
+            (xfw.IntegerField(2, cast=cast), True, 'some_value'),
+            (xfw.StringField(8), False, None),
+            (xfw.IntegerField(1, cast=cast), True, 'another_value'),
+        ], 17),
+    }
+    def blockCallback(head, item_list=None):
+        if item_list is not None:
+            head['row_count'] = len(item_list)
+        return head['row_count'], row_type_dict[head['row_type']]
+    return xfw.ConstItemTypeFile(
+        root_head,
+        'block_count',
+        xfw.FieldListFile(block_head, blockCallback, separator=b'\n'),
+        separator=b'\n',
+    )
+
+# Synthetic data.
+
+BASE_DATE = datetime(2011, 12, 26)
+
+def iterNarrowRecords(record_count):
+    for index in range(record_count):
+        yield {
+            'id': index,
+            'name': b'name %i' % (index % 1000, ),
+            'amount': index % 999999,
+        }
+
+def iterWideRecords(record_count, field_count=120):
+    for index in range(record_count):
+        record = {}
+        for field_index in range(field_count):
+            if field_index % 3 == 0:
+                value = (index + field_index) % 999999
+            elif field_index % 3 == 1:
+                value = b'v%i' % (index % 100000, )
+            else:
+                value = BASE_DATE + timedelta(days=index % 3650)
+            record['field_%i' % (field_index, )] = value
+        yield record
+
+def getNestedData(record_count, block_row_count=100):
+    """
+    Returns the parsed value of a file containing about <record_count> rows,
+    in blocks of <block_row_count> rows alternating between row types.
+    """
+    block_list = []
+    remaining = record_count
+    while remaining > 0:
+        row_count = min(remaining, block_row_count)
+        row_type = len(block_list) % 2 + 1
+        if row_type == 1:
+            row_list = [
+                {
+                    'time': datetime(1900, 1, 1, index % 23 + 1, index % 60),
+                    'description': b'row %i' % (index, ),
+                }
+                for index in range(row_count)
+            ]
+        else:
+            row_list = [
+                {
+                    'time': datetime(1900, 1, 1, index % 23 + 1, index % 60),
+                    'some_value': index % 100,
+                    'another_value': index % 10,
+                }
+                for index in range(row_count)
+            ]
+        block_list.append((
+            {
+                'date': BASE_DATE + timedelta(days=len(block_list)),
+                'row_type': row_type,
+            },
+            row_list,
+        ))
+        remaining -= row_count
+    return {'comment': b'benchmark'}, block_list
+
+def generateFieldListData(structure, record_iterable):
+    stream = io.BytesIO()
+    structure.generateMany(stream, record_iterable, separator=b'\n')
+    return stream.getvalue()
+
+def generateNestedData(structure, record_count):
+    stream = io.BytesIO()
+    structure.generateStream(stream, getNestedData(record_count))
+    return stream.getvalue()
+
+# Scenarios: each one returns a callable running the measured operation and
+# returning the number of processed bytes.
+
+def _parseFieldList(structure, data):
+    def run():
+        parse = structure.parse
+        total_length = structure.total_length
+        stride = total_length + 1
+        for offset in range(0, len(data), stride):
+            parse(data[offset:offset + total_length])
+        return len(data)
+    return run
+
+def _generateFieldList(structure, record_list):
+    def run():
+        stream = io.BytesIO()
+        structure.generateMany(stream, record_list, separator=b'\n')
+        return len(stream.getvalue())
+    return run
+
+def _parseNested(structure, data, wrapper=None):
+    def run():
+        stream = io.BytesIO(data)
+        if wrapper is not None:
+            stream = wrapper(stream)
+        structure.parseStream(stream)
+        return len(data)
+    return run
+
+def _generateNested(structure, parsed, wrapper=None):
+    def run():
+        stream = raw_stream = io.BytesIO()
+        if wrapper is not None:
+            stream = wrapper(stream)
+        structure.generateStream(stream, parsed)
+        return len(raw_stream.getvalue())
+    return run
+
+def _sha1BlockReader(stream):
+    return xfw.BlockReader(xfw.SHA1ChecksumedFile(stream))
+
+def scenarioNarrowParseRaw(record_count):
+    structure = getNarrowStructure(False)
+    return _parseFieldList(structure, generateFieldListData(structure,
+        iterNarrowRecords(record_count)))
+
+def scenarioNarrowParseCast(record_count):
+    structure = getNarrowStructure(True)
+    return _parseFieldList(structure, generateFieldListData(structure,
+        iterNarrowRecords(record_count)))
+
+def scenarioNarrowGenerate(record_count):
+    return _generateFieldList(getNarrowStructure(False),
+        list(iterNarrowRecords(record_count)))
+
+def scenarioWideParseRaw(record_count):
+    structure = getWideStructure(False)
+    return _parseFieldList(structure, generateFieldListData(structure,
+        iterWideRecords(record_count)))
+
+def scenarioWideParseCast(record_count):
+    structure = getWideStructure(True)
+    return _parseFieldList(structure, generateFieldListData(structure,
+        iterWideRecords(record_count)))
+
+def scenarioWideGenerate(record_count):
+    return _generateFieldList(getWideStructure(False),
+        list(iterWideRecords(record_count)))
+
+def scenarioNestedParseRaw(record_count):
+    structure = getNestedStructure(False)
+    return _parseNested(structure, generateNestedData(structure, record_count))
+
+def scenarioNestedParseCast(record_count):
+    structure = getNestedStructure(True)
+    return _parseNested(structure, generateNestedData(structure, record_count))
+
+def scenarioNestedParseSHA1(record_count):
+    structure = getNestedStructure(True)
+    return _parseNested(structure, generateNestedData(structure, record_count),
+        xfw.SHA1ChecksumedFile)
+
+def scenarioNestedParseSHA1BlockReader(record_count):
+    structure = getNestedStructure(True)
+    return _parseNested(structure, generateNestedData(structure, record_count),
+        _sha1BlockReader)
+
+def scenarioNestedGenerate(record_count):
+    return _generateNested(getNestedStructure(True),
+        getNestedData(record_count))
+
+def scenarioNestedGenerateSHA1(record_count):
+    return _generateNested(getNestedStructure(True),
+        getNestedData(record_count), xfw.SHA1ChecksumedFile)
+
+# Name: (scenario factory, record count divisor). Wide records are about 30
+# times bigger than narrow ones, so fewer are processed.
+SCENARIO_DICT = {
+    'narrow-parse-raw': (scenarioNarrowParseRaw, 1),
+    'narrow-parse-cast': (scenarioNarrowParseCast, 1),
+    'narrow-generate': (scenarioNarrowGenerate, 1),
+    'wide-parse-raw': (scenarioWideParseRaw, 20),
+    'wide-parse-cast': (scenarioWideParseCast, 20),
+    'wide-generate': (scenarioWideGenerate, 20),
+    'nested-parse-raw': (scenarioNestedParseRaw, 1),
+    'nested-parse-cast': (scenarioNestedParseCast, 1),
+    'nested-parse-sha1': (scenarioNestedParseSHA1, 1),
+    'nested-parse-sha1-blockreader': (scenarioNestedParseSHA1BlockReader, 1),
+    'nested-generate': (scenarioNestedGenerate, 1),
+    'nested-generate-sha1': (scenarioNestedGenerateSHA1, 1),
+}
+
+def runScenario(name, record_count, repeat):
+    """
+    Run given scenario in current process, returning its result as a dict.
+    Best time of <repeat> runs is kept.
+    """
+    factory, divisor = SCENARIO_DICT[name]
+    record_count = max(1, record_count // divisor)
+    run = factory(record_count)
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        byte_count = run()
+        duration = timer() - start
+        if best is None or duration < best:
+            best = duration
+    best = max(best, 1e-9)
+    return {
+        'name': name,
+        'records': record_count,
+        'bytes': byte_count,
+        'seconds': best,
+        'records_per_second': record_count / best,
+        'mb_per_second': byte_count / best / 1e6,
+        'peak_memory': _getPeakMemory(),
+    }
+
+def runScenarioProcess(name, record_count, repeat):
+    """
+    Run given scenario in a new process, so peak memory is its own.
+    """
+    output = subprocess.check_output([
+        sys.executable, __file__,
+        '--run-scenario', name,
+        '--records', str(record_count),
+        '--repeat', str(repeat),
+    ])
+    return json.loads(output.decode('ascii'))
+
+def _formatMemory(value):
+    if value is None:
+        return '?'
+    return '%.1f' % (value / 1e6, )
+
+def printResultList(result_list, reference_dict=None):
+    header = '%-32s %10s %12s %9s %9s' % ('scenario', 'records', 'records/s',
+        'MB/s', 'peak MB')
+    if reference_dict is not None:
+        header += ' %9s' % ('speedup', )
+    print(header)
+    for result in result_list:
+        line = '%-32s %10i %12.0f %9.2f %9s' % (result['name'],
+            result['records'], result['records_per_second'],
+            result['mb_per_second'], _formatMemory(result['peak_memory']))
+        if reference_dict is not None:
+            reference = reference_dict.get(result['name'])
+            if reference is None:
+                line += ' %9s' % ('-', )
+            else:
+                line += ' %8.2fx' % (result['records_per_second'] /
+                    reference['records_per_second'], )
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='xfw benchmark suite.')
+    parser.add_argument('-s', '--scenario', action='append',
+        choices=sorted(SCENARIO_DICT),
+        help='Scenario to run (can be repeated). Default: all.')
+    parser.add_argument('-n', '--records', type=int, default=100000,
+        help='Number of records per scenario (wide record scenarios '
+        'process fewer). Default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+        help='Number of runs per scenario, the fastest is kept. '
+        'Default: %(default)s')
+    parser.add_argument('-o', '--output',
+        help='Save results to this file, as JSON.')
+    parser.add_argument('-c', '--compare',
+        help='Compare results with the ones saved in this file.')
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_scenario:
+        json.dump(runScenario(args.run_scenario, args.records, args.repeat),
+            sys.stdout)
+        return
+    result_list = []
+    for name in args.scenario or sorted(SCENARIO_DICT):
+        result_list.append(runScenarioProcess(name, args.records,
+            args.repeat))
+    if args.compare:
+        with open(args.compare) as reference_file:
+            reference_dict = dict((x['name'], x)
+                for x in json.load(reference_file)['results'])
+    else:
+        reference_dict = None
+    printResultList(result_list, reference_dict)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'python': sys.version,
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'numpy': xfw.numpy is not None and xfw.numpy.__version__,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'records': args.records,
+                'repeat': args.repeat,
+                'results': result_list,
+            }, output_file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 from setuptools import setup
 from os.path import join, dirname
+import sys
 
 description = open(join(dirname(__file__), 'README.rst')).read()
+py_modules = ['xfw']
+if sys.version_info >= (3, 6):
+    py_modules.append('xfw_asyncio')
 
 setup(
     name='xfw',
@@ -14,12 +18,13 @@ setup(
     url='http://git.erp5.org/gitweb/xfw.git',
     license='GPL 2+',
     platforms=["any"],
-    py_modules=['xfw'],
+    py_modules=py_modules,
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: GNU General Public License (GPL)',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: Implementation :: PyPy',
         'Programming Language :: Python :: Implementation :: CPython',
     ],
@@ -0,0 +1,1868 @@
+"""
+Tests not fitting README.rst examples, which only run on Python 2: these run
+on Python 2 and 3.
+Run with: python -m unittest discover -p 'test_*.py'
+"""
+import hashlib
+import io
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from decimal import Decimal
+try:
+    import numpy
+except ImportError:
+    numpy = None
+import xfw
+
+ROOT_HEADER = xfw.FieldList([
+    (xfw.StringField(5), True, 'header_id'),
+    (xfw.IntegerField(3, cast=True), True, 'block_count'),
+    (xfw.StringField(15, cast=True), False, 'comment'),
+], 23, fixed_value_dict={'header_id': b'HEAD1'})
+BLOCK_HEADER = xfw.FieldList([
+    (xfw.DateTimeField('%Y%m%d', cast=True), True, 'date'),
+    (xfw.IntegerField(2, cast=True), True, 'row_type'),
+    (xfw.IntegerField(2, cast=True), True, 'row_count'),
+], 12)
+ROW_BASE = xfw.FieldList([
+    (xfw.DateTimeField('%H%M%S', cast=True), True, 'time'),
+], 6)
+ROW_TYPE_DICT = {
+    1: xfw.FieldList([
+        ROW_BASE,
+        (xfw.StringField(10), True, 'description'),
+    ], 16),
+    2: xfw.FieldList([
+        ROW_BASE,
+        (xfw.IntegerField(2, cast=True), True, 'some_value'),
+        (xfw.StringField(8), False, None),
+        (xfw.IntegerField(1, cast=True), True, 'another_value'),
+    ], 17),
+}
+
+def blockCallback(head, item_list=None):
+    if item_list is None:
+        row_count = head['row_count']
+    else:
+        row_count = len(item_list)
+    return row_count, ROW_TYPE_DICT[head['row_type']]
+
+def getFileStructure(**kw):
+    """
+    Returns the structure of sample files, block items being given kw.
+    """
+    return xfw.ConstItemTypeFile(
+        ROOT_HEADER,
+        'block_count',
+        xfw.FieldListFile(BLOCK_HEADER, blockCallback, separator=b'\n',
+            **kw),
+        separator=b'\n',
+    )
+
+FILE_STRUCTURE = getFileStructure()
+SAMPLE_DATA = (
+    b'HEAD1002blah           \n'
+    b'201112260101\n'
+    b'115500other str \n'
+    b'201112260201\n'
+    b'11550099        8'
+)
+SAMPLE_PARSED = (
+    {'header_id': b'HEAD1', 'block_count': 2, 'comment': 'blah'},
+    [
+        (
+            {'date': datetime(2011, 12, 26), 'row_type': 1, 'row_count': 1},
+            [
+                {
+                    'time': datetime(1900, 1, 1, 11, 55),
+                    'description': b'other str',
+                },
+            ],
+        ),
+        (
+            {'date': datetime(2011, 12, 26), 'row_type': 2, 'row_count': 1},
+            [
+                {
+                    'time': datetime(1900, 1, 1, 11, 55),
+                    'some_value': 99,
+                    'another_value': 8,
+                },
+            ],
+        ),
+    ],
+)
+
+def getBlockList(block_count, row_count=3):
+    """
+    Returns parsed blocks of sample file structure, of various types and
+    lengths.
+    """
+    result = []
+    for block_index in range(block_count):
+        row_type = block_index % 2 + 1
+        item_list = []
+        for index in range(block_index % row_count + 1):
+            if row_type == 1:
+                item = {'description': b'row %i' % (index, )}
+            else:
+                item = {'some_value': index, 'another_value': block_index % 10}
+            item['time'] = datetime(1900, 1, 1, index % 23 + 1, 55)
+            item_list.append(item)
+        result.append(({
+            'date': datetime(2011, 12, block_index % 28 + 1),
+            'row_type': row_type,
+            'row_count': len(item_list),
+        }, item_list))
+    return result
+
+class NonSeekableStream(object):
+    """
+    Read-only stream without seek nor tell, recording the largest read.
+    """
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+        self.max_read_length = 0
+
+    def read(self, *args):
+        result = self._stream.read(*args)
+        self.max_read_length = max(self.max_read_length, len(result))
+        return result
+
+def generate(structure, parsed):
+    stream = io.BytesIO()
+    structure.generateStream(stream, parsed)
+    return stream.getvalue()
+
+class SampleFileTests(unittest.TestCase):
+    def testParse(self):
+        self.assertEqual(FILE_STRUCTURE.parseStream(io.BytesIO(SAMPLE_DATA)),
+            SAMPLE_PARSED)
+
+    def testGenerate(self):
+        self.assertEqual(generate(FILE_STRUCTURE, SAMPLE_PARSED), SAMPLE_DATA)
+
+    @unittest.skipIf(sys.version_info < (3, ), 'Python 3 only')
+    def testParseView(self):
+        parsed = ROW_TYPE_DICT[1].parse(memoryview(b'115500other str '))
+        self.assertEqual(parsed['description'], b'other str')
+        self.assertEqual(type(parsed['description']), bytes)
+
+    def testChecksum(self):
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(SAMPLE_DATA))
+        self.assertEqual(FILE_STRUCTURE.parseStream(stream), SAMPLE_PARSED)
+        self.assertEqual(stream.getHexDigest(),
+            hashlib.sha1(SAMPLE_DATA).hexdigest())
+
+    def testTextFixedValue(self):
+        # Non-casting StringField parses into bytes on Python 3.
+        field_list = xfw.FieldList([
+            (xfw.StringField(5), True, 'header_id'),
+            (xfw.IntegerField(3, cast=True), True, 'block_count'),
+        ], 8, fixed_value_dict={'header_id': u'HEAD1'})
+        rendered = field_list.generate({'block_count': 2})
+        self.assertEqual(rendered, b'HEAD1002')
+        self.assertEqual(field_list.parse(rendered),
+            {'header_id': b'HEAD1', 'block_count': 2})
+        self.assertEqual(field_list.validate(b'HEAD1002'), [])
+        self.assertRaises(ValueError, field_list.parse, b'HEAD2002')
+
+    def testTextFixedValueCast(self):
+        field_list = xfw.FieldList([
+            (xfw.StringField(5, cast=True), True, 'header_id'),
+        ], 5, fixed_value_dict={'header_id': u'HEAD1'})
+        self.assertEqual(field_list.parse(b'HEAD1'), {'header_id': u'HEAD1'})
+
+class GenerateStreamFromIterableTests(unittest.TestCase):
+    def _generate(self, structure, args, **kw):
+        stream = io.BytesIO()
+        structure.generateStreamFromIterable(stream, args, **kw)
+        return stream.getvalue()
+
+    def testHeadFile(self):
+        structure = xfw.HeadFile(BLOCK_HEADER)
+        head = {'date': datetime(2011, 12, 26), 'row_type': 1, 'row_count': 0}
+        expected = generate(structure, (head, ))
+        self.assertEqual(expected, b'201112260100')
+        for two_pass in (False, True):
+            self.assertEqual(self._generate(structure, (head, ),
+                two_pass=two_pass), expected)
+
+    def testIterable(self):
+        item_list = SAMPLE_PARSED[1]
+        self.assertEqual(self._generate(FILE_STRUCTURE,
+            ({'comment': 'blah'}, iter(item_list))), SAMPLE_DATA)
+        # Iterated over twice.
+        self.assertEqual(self._generate(FILE_STRUCTURE,
+            ({'comment': 'blah'}, item_list), two_pass=True), SAMPLE_DATA)
+
+    def testNoItem(self):
+        expected = b'HEAD1000blah           '
+        for two_pass in (False, True):
+            for item_iterable in ([], ()):
+                self.assertEqual(self._generate(FILE_STRUCTURE,
+                    ({'comment': 'blah'}, item_iterable), two_pass=two_pass),
+                    expected)
+            # Like generateStream, head must then provide item count.
+            self.assertEqual(self._generate(FILE_STRUCTURE,
+                ({'comment': 'blah', 'block_count': 0}, ), two_pass=two_pass),
+                expected)
+
+def keepRowType2(head):
+    return head['row_type'] == 2
+
+def getFilteredParsed(parsed):
+    """
+    Returns given parsed sample file, as parsed with keepRowType2 filter.
+    """
+    return (parsed[0], [
+        (head, item_list if keepRowType2(head) else None)
+        for head, item_list in parsed[1]
+    ])
+
+class ItemFilterTests(unittest.TestCase):
+    structure = getFileStructure(item_filter=keepRowType2)
+
+    def setUp(self):
+        self.parsed = ({'header_id': b'HEAD1', 'block_count': 30,
+            'comment': 'filtered'}, getBlockList(30, 20))
+        self.data = generate(FILE_STRUCTURE, self.parsed)
+        self.expected = getFilteredParsed(self.parsed)
+
+    def testParse(self):
+        for stream in (
+                    io.BytesIO(self.data),
+                    NonSeekableStream(self.data),
+                    xfw.BlockReader(io.BytesIO(self.data), 16),
+                ):
+            self.assertEqual(self.structure.parseStream(stream),
+                self.expected)
+
+    def testIterParse(self):
+        expected = []
+        for event in FILE_STRUCTURE.iterParseStream(io.BytesIO(self.data)):
+            if event[1] == xfw.PARSED_HEAD:
+                head = event[2]
+            elif event[0] == 1 and not keepRowType2(head):
+                continue
+            expected.append(event)
+        self.assertEqual(list(self.structure.iterParseStream(
+            io.BytesIO(self.data))), expected)
+
+    def testChecksum(self):
+        expected = hashlib.sha1(self.data).hexdigest()
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(self.data))
+        self.assertEqual(self.structure.parseStream(stream), self.expected)
+        self.assertEqual(stream.getHexDigest(), expected)
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(self.data))
+        with xfw.BlockReader(stream, 16) as reader:
+            self.assertEqual(self.structure.parseStream(reader),
+                self.expected)
+        self.assertEqual(stream.getHexDigest(), expected)
+
+    def testNestedSkip(self):
+        # Blocks themselves are skipped: only their heads are parsed.
+        structure = xfw.ConstItemTypeFile(ROOT_HEADER, 'block_count',
+            xfw.FieldListFile(BLOCK_HEADER, blockCallback, separator=b'\n'),
+            separator=b'\n', item_filter=lambda head: False)
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(self.data))
+        self.assertEqual(structure.parseStream(stream), (self.parsed[0], None))
+        self.assertEqual(stream.tell(), len(self.data))
+        self.assertEqual(stream.getHexDigest(),
+            hashlib.sha1(self.data).hexdigest())
+
+    def testTruncated(self):
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            ROW_TYPE_DICT[1], separator=b'\n', item_filter=lambda head: False)
+        data = b'201112260105\n115500other str '
+        for stream in (
+                    io.BytesIO(data),
+                    NonSeekableStream(data),
+                    xfw.BlockReader(io.BytesIO(data), 16),
+                    xfw.SHA1ChecksumedFile(io.BytesIO(data)),
+                ):
+            self.assertRaises(ValueError, structure.parseStream, stream)
+        for length in range(len(self.data) - 1, 0, -97):
+            self.assertRaises(ValueError, self.structure.parseStream,
+                io.BytesIO(self.data[:length]))
+
+def validateWithoutNumpy(field_list, data, separator=b''):
+    """
+    Returns what field_list.validate returns when numpy is not available.
+    """
+    xfw_numpy = xfw.numpy
+    xfw.numpy = None
+    try:
+        return field_list.validate(data, separator)
+    finally:
+        xfw.numpy = xfw_numpy
+
+class ValidateTests(unittest.TestCase):
+    def setUp(self):
+        self.block_size = xfw.BLOCK_SIZE
+        parsed = ({'comment': 'validated'}, getBlockList(10, 50))
+        data = bytearray(generate(FILE_STRUCTURE, parsed))
+        # Corrupt one row in some blocks: time of type 1 rows, some_value of
+        # type 2 rows.
+        self.expected = []
+        position = 24
+        for block_index, (head, item_list) in enumerate(parsed[1]):
+            position += 13
+            if block_index % 3 == 0:
+                row_index = len(item_list) - 1
+                item_length = ROW_TYPE_DICT[head['row_type']].total_length
+                row_offset = position + row_index * (item_length + 1)
+                if head['row_type'] == 1:
+                    data[row_offset:row_offset + 2] = b'XX'
+                    self.expected.append((row_offset, row_index, 'time'))
+                else:
+                    data[row_offset + 6:row_offset + 8] = b'X1'
+                    self.expected.append((row_offset + 6, row_index,
+                        'some_value'))
+            position += len(item_list) * (ROW_TYPE_DICT[
+                head['row_type']].total_length + 1)
+        self.data = bytes(data)
+
+    def tearDown(self):
+        xfw.BLOCK_SIZE = self.block_size
+
+    def _getSummary(self, error_list):
+        return [(x, y, z) for x, y, z, _ in error_list]
+
+    def testValid(self):
+        self.assertEqual(FILE_STRUCTURE.validate(SAMPLE_DATA), [])
+        self.assertEqual(FILE_STRUCTURE.validate(SAMPLE_DATA + b'\n'), [])
+
+    def testErrors(self):
+        error_list = FILE_STRUCTURE.validate(self.data)
+        self.assertEqual(self._getSummary(error_list), self.expected)
+        self.assertEqual(FILE_STRUCTURE.validateStream(
+            io.BytesIO(self.data)), error_list)
+        self.assertEqual(FILE_STRUCTURE.validateStream(
+            NonSeekableStream(self.data)), error_list)
+        stream = io.BytesIO(b'garbage' + self.data)
+        stream.seek(7)
+        self.assertEqual(FILE_STRUCTURE.validateStream(stream),
+            [(x + 7, y, z, t) for x, y, z, t in error_list])
+
+    def testChunks(self):
+        error_list = FILE_STRUCTURE.validate(self.data)
+        # Items are validated by chunks of a few items.
+        xfw.BLOCK_SIZE = 64
+        stream = NonSeekableStream(self.data)
+        self.assertEqual(FILE_STRUCTURE.validateStream(stream), error_list)
+        self.assertTrue(stream.max_read_length <= 64, stream.max_read_length)
+
+    def testTruncated(self):
+        xfw.BLOCK_SIZE = 64
+        for length in (len(self.data) - 1, len(self.data) - 20):
+            error_list = FILE_STRUCTURE.validate(self.data[:length])
+            # Last block's corrupted row is truncated, so not validated.
+            self.assertEqual(self._getSummary(error_list[:-1]),
+                self.expected[:-1])
+            self.assertEqual(error_list[-1][0], length)
+            self.assertTrue(error_list[-1][3].startswith('Data too short '),
+                error_list)
+        self.assertEqual(FILE_STRUCTURE.validate(SAMPLE_DATA[:-2]), [
+            (len(SAMPLE_DATA) - 2, None, None, 'Data too short for 1 items'),
+        ])
+        self.assertEqual(FILE_STRUCTURE.validate(SAMPLE_DATA[:30]), [
+            (24, None, None, 'Truncated head: got 6 bytes, expected 12'),
+        ])
+
+    @unittest.skipIf(numpy is None, 'numpy required')
+    def testNullBytes(self):
+        # numpy strips trailing null bytes from string values, vectorised
+        # validation must still find the same errors.
+        field_list = xfw.FieldList([
+            (xfw.IntegerField(3, cast=True), True, 'number'),
+            (xfw.IntegerField(3), False, 'raw_number'),
+            (xfw.DateTimeField('%H:%M', cast=True), True, 'time'),
+            (xfw.DateTimeField('%b %d', cast=True), False, 'month_day'),
+            (xfw.StringField(3, cast=True), False, 'text'),
+            (xfw.StringField(2), True, 'kind'),
+        ], 27, separator=b'|', fixed_value_dict={'kind': b'K1'})
+        record_list = [
+            b'012|012|23:59|Dec 26|abc|K1',
+            b'12\x00|12\x00|23:5\x00|Dec 2\x00|ab\x00|K\x00',
+            b'\x00\x00\x00|\x00\x00\x00|\x00\x00\x00\x00\x00|'
+                b'\x00\x00\x00\x00\x00\x00|\x00\x00\x00|\x00\x00',
+            b'012|012|23:59|Dec 26|abc|K1',
+        ]
+        for separator in (b'\n', b'\x00'):
+            data = separator.join(record_list)
+            error_list = field_list.validate(data, separator)
+            self.assertEqual(error_list, validateWithoutNumpy(field_list,
+                data, separator))
+            self.assertEqual(sorted(set((x[1], x[2]) for x in error_list)),
+                [(index, field_id) for index in (1, 2) for field_id in (
+                'kind', 'month_day', 'number', 'raw_number', 'time')])
+            for index in (1, 2):
+                self.assertRaises(ValueError, field_list.parse,
+                    record_list[index])
+        data = b'|'.join(record_list)
+        self.assertEqual(field_list.validate(data, b'\x00'),
+            validateWithoutNumpy(field_list, data, b'\x00'))
+
+    def testTrailingData(self):
+        self.assertEqual(FILE_STRUCTURE.validate(SAMPLE_DATA + b'\nabc'), [
+            (len(SAMPLE_DATA) + 1, None, None,
+                'Unexpected trailing data: 3 bytes'),
+        ])
+
+COLUMN_FIELD_LIST = xfw.FieldList([
+    (xfw.DateTimeField('%Y%m%d', cast=True), False, 'date'),
+    (xfw.DateTimeField('%H:%M', cast=True), False, 'time'),
+    (xfw.DateTimeField('%b %d', cast=True), False, 'month_day'),
+    (xfw.DateTimeField('%Y%m%d'), False, 'raw_date'),
+    (xfw.IntegerField(4, cast=True), False, 'number'),
+    (xfw.IntegerField(4), False, 'raw_number'),
+    (xfw.StringField(4, cast=True, encoding='utf-8'), False, 'text'),
+    (xfw.StringField(4), False, 'raw_text'),
+    (xfw.StringField(1), True, 'kind'),
+], 52, separator=b'|', fixed_value_dict={'kind': b'K'})
+
+def getColumnRecord(date=b'20111226', time=b'11:55', month_day=b'Dec 26',
+        raw_date=b'20111226', number=b'0012', raw_number=b'0012',
+        text=b'\xc3\xa9t ', raw_text=b'ab  ', kind=b'K'):
+    """
+    Returns a raw record of COLUMN_FIELD_LIST.
+    """
+    return b'|'.join((date, time, month_day, raw_date, number, raw_number,
+        text, raw_text, kind))
+
+@unittest.skipIf(numpy is None, 'numpy required')
+class ColumnTests(unittest.TestCase):
+    def _check(self, record_list, separator=b'\n', field_list=COLUMN_FIELD_LIST):
+        """
+        Check parseColumns gives the same values as parsing records one by
+        one.
+        """
+        expected = [field_list.parse(x) for x in record_list]
+        data = separator.join(record_list)
+        for tail in (b'', separator):
+            column_dict = field_list.parseColumns(data + tail, separator)
+            self.assertEqual(sorted(column_dict), sorted(expected[0]))
+            for field_id, column in column_dict.items():
+                # datetime64 values convert to datetime, NaT to None.
+                self.assertEqual(column.tolist(),
+                    [x[field_id] for x in expected], field_id)
+        return column_dict
+
+    def _checkError(self, record_list, separator=b'\n',
+            field_list=COLUMN_FIELD_LIST):
+        """
+        Check parseColumns fails like parsing records one by one.
+        """
+        try:
+            for record in record_list:
+                field_list.parse(record)
+        except ValueError:
+            expected = str(sys.exc_info()[1])
+        else:
+            raise AssertionError('parse did not fail')
+        try:
+            field_list.parseColumns(separator.join(record_list), separator)
+        except ValueError:
+            return expected, str(sys.exc_info()[1])
+        raise AssertionError('parseColumns did not fail')
+
+    def testValid(self):
+        column_dict = self._check([getColumnRecord(), getColumnRecord(
+            date=b'20000229', time=b'00:00', month_day=b'Jan 01',
+            number=b'9999', raw_number=b'0000', text=b'abcd',
+            raw_text=b'    ')] * 3)
+        self.assertEqual(column_dict['date'].dtype.kind, 'M')
+        self.assertEqual(column_dict['number'].dtype.kind, 'i')
+        self.assertEqual(self._check([getColumnRecord()], separator=b''
+            )['number'].tolist(), [12])
+
+    def testNullDate(self):
+        column_dict = self._check([
+            getColumnRecord(),
+            getColumnRecord(date=b'        ', time=b'     ',
+                month_day=b'      ', raw_date=b'        '),
+            getColumnRecord(date=b'00000000', time=b'00000',
+                raw_date=b'00000000'),
+        ])
+        self.assertEqual(column_dict['date'].tolist(),
+            [datetime(2011, 12, 26), None, None])
+
+    def testInvalidDate(self):
+        # Values the vectorised parser does not accept are given to strptime,
+        # which fails the same way.
+        for kw in (
+                    {'date': b'20110230'},
+                    {'date': b'20111326'},
+                    {'date': b'2011122 '},
+                    {'date': b'2011-226'},
+                    {'time': b'24:00'},
+                    {'time': b'11-55'},
+                    {'month_day': b'Foo 26'},
+                ):
+            expected, error = self._checkError([getColumnRecord(),
+                getColumnRecord(**kw)])
+            self.assertEqual(error, expected, kw)
+
+    def testStrptimeFallback(self):
+        # strptime accepts a space instead of the leading zero of days.
+        field_list = xfw.FieldList([
+            (xfw.DateTimeField('%Y%m%d', cast=True), True, 'date'),
+        ], 8)
+        column_dict = self._check([b'20111226', b'201101 2', b'20110102'],
+            field_list=field_list)
+        self.assertEqual(column_dict['date'].tolist()[1], datetime(2011, 1, 2))
+
+    def testInteger(self):
+        column_dict = self._check([
+            getColumnRecord(number=b'    ', raw_number=b'    '),
+            getColumnRecord(number=b'  12', raw_number=b'  12'),
+            getColumnRecord(number=b'-012', raw_number=b'-012'),
+            getColumnRecord(number=b'+012', raw_number=b'+012'),
+            getColumnRecord(number=b' -12', raw_number=b' -12'),
+            getColumnRecord(number=b'12  ', raw_number=b'12  '),
+        ])
+        self.assertEqual(column_dict['number'].tolist(),
+            [0, 12, -12, 12, -12, 12])
+        for number in (b'1 2 ', b'12a4', b'--12'):
+            expected, error = self._checkError([getColumnRecord(),
+                getColumnRecord(number=number)])
+            self.assertEqual(error, expected, number)
+
+    def testNullBytes(self):
+        # numpy strips trailing null bytes from string values: such values
+        # must still be parsed like records are.
+        column_dict = self._check([
+            getColumnRecord(),
+            getColumnRecord(raw_number=b'12\x00\x00', raw_date=b'2011122\x00',
+                text=b'ab\x00\x00', raw_text=b'a\x00\x00\x00'),
+            getColumnRecord(raw_number=b'\x00\x00\x00\x00',
+                raw_text=b'\x00\x00\x00\x00'),
+        ])
+        self.assertEqual(column_dict['raw_text'].tolist(),
+            [b'ab', b'a\x00\x00\x00', b'\x00\x00\x00\x00'])
+        for kw in (
+                    {'number': b'012\x00'},
+                    {'number': b'\x00\x00\x00\x00'},
+                    {'date': b'2011122\x00'},
+                    {'time': b'23:5\x00'},
+                    {'month_day': b'Dec 2\x00'},
+                    {'kind': b'\x00'},
+                ):
+            expected, error = self._checkError([getColumnRecord(),
+                getColumnRecord(**kw)])
+            if 'kind' not in kw:
+                self.assertEqual(error, expected, kw)
+        field_list = xfw.FieldList([
+            (xfw.IntegerField(20, cast=True), True, 'number'),
+        ], 20)
+        self._checkError([b'1' * 19 + b'\x00'], field_list=field_list)
+
+    def testLargeInteger(self):
+        field_list = xfw.FieldList([
+            (xfw.IntegerField(20, cast=True), True, 'number'),
+        ], 20)
+        self._check([b'1' * 20, b'0' * 19 + b'7', b' ' * 20],
+            field_list=field_list)
+
+    def testSeparatorError(self):
+        record = getColumnRecord()
+        # Field separator.
+        self._checkError([record, record[:8] + b'#' + record[9:]])
+        # Record separator, and record length.
+        self.assertRaises(ValueError, COLUMN_FIELD_LIST.parseColumns,
+            record + b'#' + record, b'\n')
+        self.assertRaises(ValueError, COLUMN_FIELD_LIST.parseColumns,
+            record + b'\n' + record[:-1], b'\n')
+
+    def testFixedValueError(self):
+        expected, error = self._checkError([getColumnRecord(),
+            getColumnRecord(kind=b'X')])
+        self.assertTrue(repr(b'K') in error and repr(b'X') in error, error)
+
+    def testMandatoryError(self):
+        self._checkError([getColumnRecord(), getColumnRecord(kind=b' ')])
+
+class PlainStringField(xfw.StringField):
+    """
+    Not taking StringField rendering fast path.
+    """
+
+class RightAlignedStringField(xfw.StringField):
+    def _pad(self, data, pad_length):
+        return b' ' * pad_length + data
+
+class PlainIntegerField(xfw.IntegerField):
+    """
+    Not taking IntegerField rendering fast path.
+    """
+
+class SpacePaddedIntegerField(xfw.IntegerField):
+    def _pad(self, data, pad_length):
+        return b' ' * pad_length + data
+
+class RenderTests(unittest.TestCase):
+    def testString(self):
+        for kw in ({}, {'truncate': True}, {'encoding': 'utf-8'}):
+            field = xfw.StringField(4, **kw)
+            plain = PlainStringField(4, **kw)
+            for data in (b'', b'ab', b'abcd', u'ab'):
+                self.assertEqual(field.render(data), plain.render(data))
+                self.assertEqual(type(field.render(data)),
+                    type(plain.render(data)))
+        self.assertEqual(xfw.StringField(4).render(b'ab'), b'ab  ')
+        self.assertRaises(ValueError, xfw.StringField(4).render, b'abcde')
+        self.assertEqual(xfw.StringField(4, truncate=True).render(b'abcde'),
+            b'abcd')
+        self.assertRaises(TypeError, xfw.StringField(4).render, 12)
+        self.assertEqual(RightAlignedStringField(4).render(b'ab'), b'  ab')
+        self.assertEqual(RightAlignedStringField(4).render(b'abcd'), b'abcd')
+
+    def testInteger(self):
+        for kw in ({}, {'truncate': True}, {'cast': True}):
+            field = xfw.IntegerField(4, **kw)
+            plain = PlainIntegerField(4, **kw)
+            for data in (0, 5, 255, 256, 999, 1000, 9999, -5, b'12', u'12'):
+                self.assertEqual(field.render(data), plain.render(data), data)
+        self.assertEqual(xfw.IntegerField(4).render(5), b'0005')
+        self.assertEqual(xfw.IntegerField(4).render(4321), b'4321')
+        self.assertRaises(ValueError, xfw.IntegerField(4).render, 12345)
+        self.assertEqual(xfw.IntegerField(4, truncate=True).render(12345),
+            b'1234')
+        self.assertEqual(SpacePaddedIntegerField(4).render(5), b'   5')
+        self.assertEqual(SpacePaddedIntegerField(4).render(300), b' 300')
+        self.assertEqual(SpacePaddedIntegerField(4).render(1234), b'1234')
+
+    def testIntegerRenderTable(self):
+        # Shared by fields of the same length, and not pickled.
+        field = xfw.IntegerField(4)
+        self.assertTrue(field._render_table is
+            xfw.IntegerField(4, cast=True)._render_table)
+        loaded = pickle.loads(pickle.dumps(field))
+        self.assertTrue(loaded._render_table is field._render_table)
+        self.assertEqual(loaded.render(7), b'0007')
+        # Short fields cannot render all table values.
+        field = xfw.IntegerField(1)
+        self.assertEqual(field.render(9), b'9')
+        self.assertRaises(ValueError, field.render, 10)
+
+class MainframeFieldTests(unittest.TestCase):
+    def _checkValues(self, field, value_dict):
+        """
+        Check field renders each value into its key, and parses it back.
+        """
+        for rendered, value in value_dict.items():
+            self.assertEqual(field.render(value), rendered, value)
+            parsed = field.parse(rendered)
+            self.assertEqual(parsed, value, rendered)
+            self.assertEqual(type(parsed), type(value), rendered)
+
+    def _checkColumn(self, field, data_list):
+        """
+        Check column parsing and validation of given raw values give the same
+        results as parsing and validating them one by one.
+        """
+        field_list = xfw.FieldList([(field, False, 'value')], field.length)
+        data = b''.join(data_list)
+        self.assertEqual(field_list.validate(data),
+            validateWithoutNumpy(field_list, data))
+        expected = []
+        for raw in data_list:
+            try:
+                expected.append(field.parse(raw))
+            except ValueError:
+                error = str(sys.exc_info()[1])
+                try:
+                    field_list.parseColumns(data)
+                except ValueError:
+                    self.assertEqual(str(sys.exc_info()[1]), error)
+                else:
+                    raise AssertionError('parseColumns did not fail')
+                return
+        self.assertEqual(field_list.parseColumns(data)['value'].tolist(),
+            expected)
+
+    def testBinaryInteger(self):
+        self._checkValues(xfw.BinaryIntegerField(2, cast=True), {
+            b'\x00\x00': 0,
+            b'\x01\x02': 258,
+            b'\xff\xff': 65535,
+        })
+        self._checkValues(xfw.BinaryIntegerField(2, signed=True,
+                byteorder='little', cast=True), {
+            b'\x02\x01': 258,
+            b'\xfe\xff': -2,
+            b'\x00\x80': -32768,
+        })
+        field = xfw.BinaryIntegerField(2, signed=True)
+        self.assertRaises(ValueError, field.render, 32768)
+        self.assertRaises(ValueError, field.render, -32769)
+        self.assertRaises(TypeError, field.render, 1.5)
+        self.assertEqual(field.parse(b'\x01\x02'), b'\x01\x02')
+        self.assertEqual(field.render(b'\x01\x02'), b'\x01\x02')
+        self.assertEqual(xfw.BinaryIntegerField(1, truncate=True).render(258),
+            b'\x02')
+        self.assertRaises(ValueError, xfw.BinaryIntegerField, 2,
+            byteorder='middle')
+
+    def testPackedDecimal(self):
+        self._checkValues(xfw.PackedDecimalField(3, cast=True), {
+            b'\x00\x00\x0c': 0,
+            b'\x01\x23\x4c': 1234,
+            b'\x01\x23\x4d': -1234,
+        })
+        self._checkValues(xfw.PackedDecimalField(3, scale=2, cast=True), {
+            b'\x01\x23\x4c': Decimal('12.34'),
+            b'\x00\x00\x5d': Decimal('-0.05'),
+        })
+        field = xfw.PackedDecimalField(2, signed=False, cast=True)
+        self.assertEqual(field.render(123), b'\x12\x3f')
+        self.assertRaises(ValueError, field.render, -1)
+        self.assertEqual(field.parse(b'\x12\x3a'), 123)
+        self.assertEqual(field.parse(b'\x12\x3b'), -123)
+        for data in (b'\x12\x34', b'\x1a\x3c', b'\x00\x00'):
+            self.assertRaises(ValueError, field.parse, data)
+        self.assertRaises(ValueError, field.render, 1000)
+        self.assertEqual(xfw.PackedDecimalField(2, truncate=True).render(
+            1234), b'\x23\x4c')
+        field = xfw.PackedDecimalField(2, scale=1)
+        self.assertRaises(ValueError, field.render, Decimal('1.25'))
+        self.assertEqual(field.parse(b'\x12\x3c'), b'\x12\x3c')
+        self.assertEqual(field.validateValue(b'\x12\x34'),
+            "Invalid packed decimal: %r" % (b'\x12\x34', ))
+
+    def testOverpunch(self):
+        self._checkValues(xfw.OverpunchField(4, cast=True), {
+            b'000{': 0,
+            b'012C': 123,
+            b'012L': -123,
+            b'012}': -120,
+        })
+        self._checkValues(xfw.OverpunchField(4, scale=2, cast=True), {
+            b'012C': Decimal('1.23'),
+            b'000R': Decimal('-0.09'),
+        })
+        field = xfw.OverpunchField(4, cast=True)
+        self.assertEqual(field.parse(b'0123'), 123)
+        self.assertEqual(field.parse(b'    '), 0)
+        for data in (b'012X', b'0 2C', b'-12C', b'\x00\x00\x00\x00'):
+            self.assertRaises(ValueError, field.parse, data)
+            self.assertNotEqual(field.validateValue(data), None)
+        self.assertRaises(ValueError, field.render, 10000)
+        self.assertEqual(xfw.OverpunchField(2, truncate=True).render(-123),
+            b'2L')
+
+    @unittest.skipIf(numpy is None, 'numpy required')
+    def testBinaryIntegerColumn(self):
+        data_list = [b'\x00\x00', b'\x01\x00', b'\xff\xfe', b'\x80\x00']
+        for kw in (
+                    {},
+                    {'signed': True},
+                    {'byteorder': 'little'},
+                    {'signed': True, 'byteorder': 'little'},
+                ):
+            self._checkColumn(xfw.BinaryIntegerField(2, cast=True, **kw),
+                data_list)
+            self._checkColumn(xfw.BinaryIntegerField(2, **kw), data_list)
+        for length in (8, 9):
+            for signed in (False, True):
+                self._checkColumn(xfw.BinaryIntegerField(length,
+                    signed=signed, cast=True), [b'\xff' * length,
+                    b'\x00' * length, b'\x7f' + b'\x00' * (length - 1)])
+
+    @unittest.skipIf(numpy is None, 'numpy required')
+    def testPackedDecimalColumn(self):
+        data_list = [b'\x00\x00\x0c', b'\x01\x23\x4d', b'\x99\x99\x9f',
+            b'\x01\x00\x0b']
+        for scale in (0, 2):
+            self._checkColumn(xfw.PackedDecimalField(3, scale=scale,
+                cast=True), data_list)
+        self._checkColumn(xfw.PackedDecimalField(3), data_list)
+        self._checkColumn(xfw.PackedDecimalField(10, cast=True),
+            [b'\x00' * 9 + b'\x1c', b'\x99' * 9 + b'\x9d'])
+        for invalid in (b'\x12\x34\x00', b'\x00\x00\x00', b'\x1a\x00\x0c'):
+            for field in (xfw.PackedDecimalField(3, cast=True),
+                    xfw.PackedDecimalField(3)):
+                self._checkColumn(field, data_list + [invalid])
+
+    @unittest.skipIf(numpy is None, 'numpy required')
+    def testOverpunchColumn(self):
+        data_list = [b'000{', b'012C', b'012L', b'9999', b'    ']
+        for scale in (0, 2):
+            self._checkColumn(xfw.OverpunchField(4, scale=scale, cast=True),
+                data_list)
+        self._checkColumn(xfw.OverpunchField(4), data_list)
+        self._checkColumn(xfw.OverpunchField(20, cast=True),
+            [b'0' * 19 + b'C', b'9' * 19 + b'R'])
+        for invalid in (b'\x00\x00\x00\x00', b'012\x00', b'\x0012C',
+                b'012X', b' 12C'):
+            for field in (xfw.OverpunchField(4, cast=True),
+                    xfw.OverpunchField(4, scale=2, cast=True),
+                    xfw.OverpunchField(4)):
+                self._checkColumn(field, data_list + [invalid])
+
+RECORD_HEADER = xfw.FieldList([BLOCK_HEADER], 12, record_class=True)
+RECORD_ROW = xfw.FieldList([
+    ROW_BASE,
+    (xfw.StringField(10, cast=True, encoding='utf-8'), True, 'description'),
+], 16, record_class=True)
+
+class RecordClassTests(unittest.TestCase):
+    row_data = b'115500\xc3\xa9t\xc3\xa9     '
+
+    def testParse(self):
+        record = RECORD_ROW.parse(self.row_data)
+        self.assertTrue(isinstance(record, RECORD_ROW.record_class))
+        self.assertEqual(record._fields, ('time', 'description'))
+        self.assertEqual(record.description, u'\xe9t\xe9')
+        self.assertEqual(record.time, datetime(1900, 1, 1, 11, 55))
+        self.assertEqual(record._asdict(), xfw.FieldList(RECORD_ROW.field_list,
+            16).parse(self.row_data))
+        # Field lists with the same field names share their record class.
+        self.assertTrue(xfw.FieldList(RECORD_ROW.field_list, 16,
+            record_class=True).record_class is RECORD_ROW.record_class)
+
+    def testGenerate(self):
+        record = RECORD_ROW.parse(self.row_data)
+        self.assertEqual(RECORD_ROW.generate(record), self.row_data)
+        self.assertEqual(RECORD_ROW.generate(record._asdict()), self.row_data)
+        self.assertEqual(RECORD_ROW.generate(record._replace(
+            description=u'abc')), b'115500abc       ')
+
+    def testPaddingId(self):
+        field_list = xfw.FieldList([ROW_BASE], 10, padding_id='padding',
+            record_class=True)
+        self.assertEqual(field_list.record_class._fields,
+            ('time', 'padding'))
+        record = field_list.parse(b'115500pad ')
+        self.assertEqual(record.padding, b'pad')
+        self.assertEqual(record, field_list.record_class(
+            datetime(1900, 1, 1, 11, 55), b'pad'))
+        self.assertEqual(field_list.generate(record), b'115500pad ')
+
+    def testFixedValues(self):
+        nested = xfw.FieldList([
+            (xfw.StringField(2), True, 'kind'),
+        ], 2, fixed_value_dict={'kind': b'R1', 'version': 3})
+        field_list = xfw.FieldList([
+            nested,
+            ROW_BASE,
+        ], 10, fixed_value_dict={'source': 'test'}, record_class=True)
+        # Fixed values without a field are available as attributes, after
+        # fields.
+        self.assertEqual(field_list.record_class._fields[:2],
+            ('kind', 'time'))
+        self.assertEqual(sorted(field_list.record_class._fields[2:]),
+            ['source', 'version'])
+        record = field_list.parse(b'R1115500  ')
+        self.assertEqual(record._asdict(), {
+            'kind': b'R1',
+            'time': datetime(1900, 1, 1, 11, 55),
+            'version': 3,
+            'source': 'test',
+        })
+        self.assertEqual(field_list.generate(record), b'R1115500  ')
+        self.assertRaises(ValueError, field_list.parse, b'R2115500  ')
+
+    def testPickle(self):
+        record = RECORD_ROW.parse(self.row_data)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(record, protocol))
+            self.assertEqual(loaded, record)
+            self.assertTrue(type(loaded) is RECORD_ROW.record_class)
+            field_list = pickle.loads(pickle.dumps(RECORD_ROW, protocol))
+            self.assertTrue(field_list.record_class is
+                RECORD_ROW.record_class)
+            self.assertEqual(field_list.parse(self.row_data), record)
+
+    def testConstItemTypeFile(self):
+        structure = xfw.ConstItemTypeFile(RECORD_HEADER, 'row_count',
+            RECORD_ROW, separator=b'\n')
+        item_list = [
+            RECORD_ROW.record_class(datetime(1900, 1, 1, 11, 55), u'row %i' % x)
+            for x in range(3)
+        ]
+        head = RECORD_HEADER.record_class(datetime(2011, 12, 26), 1, 0)
+        data = generate(structure, (head, item_list))
+        self.assertEqual(data[:12], b'201112260103')
+        parsed = structure.parseStream(io.BytesIO(data))
+        self.assertEqual(parsed, (head._replace(row_count=3), item_list))
+        self.assertTrue(isinstance(parsed[0], RECORD_HEADER.record_class))
+        self.assertEqual(generate(structure, parsed), data)
+        self.assertEqual([x[2] for x in structure.iterParseStream(
+            io.BytesIO(data))], [parsed[0]] + item_list)
+        stream = io.BytesIO()
+        self.assertEqual(structure.generateStreamFromIterable(stream,
+            (head, iter(item_list))), 3)
+        self.assertEqual(stream.getvalue(), data)
+
+LAZY_FIELD_LIST = xfw.FieldList([
+    (xfw.StringField(2), True, 'kind'),
+    (xfw.IntegerField(3, cast=True), False, 'number'),
+    (xfw.DateTimeField('%Y%m%d', cast=True), True, 'date'),
+], 15, separator=b'|', fixed_value_dict={'kind': b'R1', 'version': 2})
+LAZY_DATA = b'R1|012|20111226'
+
+class LazyFieldListTests(unittest.TestCase):
+    def testParse(self):
+        record = xfw.LazyFieldList(LAZY_FIELD_LIST).parse(LAZY_DATA)
+        self.assertTrue(isinstance(record, xfw.LazyRecord))
+        self.assertEqual(sorted(record), ['date', 'kind', 'number',
+            'version'])
+        self.assertEqual(len(record), 4)
+        self.assertTrue('version' in record)
+        self.assertFalse('other' in record)
+        self.assertEqual(dict(record), LAZY_FIELD_LIST.parse(LAZY_DATA))
+        self.assertEqual(repr(record), '<LazyRecord %r>' % (LAZY_DATA, ))
+        self.assertRaises(ValueError, xfw.LazyFieldList(LAZY_FIELD_LIST,
+            validate=None).parse, LAZY_DATA[:-1])
+        self.assertRaises(KeyError, lambda: record['other'])
+
+    @unittest.skipIf(sys.version_info < (3, ), 'Python 3 only')
+    def testParseView(self):
+        data = bytearray(b'xx' + LAZY_DATA)
+        record = xfw.LazyFieldList(LAZY_FIELD_LIST).parse(
+            memoryview(data)[2:])
+        self.assertEqual(dict(record), LAZY_FIELD_LIST.parse(LAZY_DATA))
+
+    def testLazy(self):
+        # Optional fields are only parsed when accessed.
+        for validate in (xfw.VALIDATE_ON_PARSE, xfw.VALIDATE_ON_ACCESS, None):
+            record = xfw.LazyFieldList(LAZY_FIELD_LIST,
+                validate=validate).parse(b'R1|0x2|20111226')
+            self.assertEqual(record['date'], datetime(2011, 12, 26))
+            self.assertRaises(ValueError, lambda: record['number'])
+
+    def testProjection(self):
+        lazy = xfw.LazyFieldList(LAZY_FIELD_LIST, ['number', 'version'])
+        # Fields which are not available are neither parsed nor validated.
+        record = lazy.parse(b'R2|012|        ')
+        self.assertEqual(dict(record), {'number': 12, 'version': 2})
+        self.assertRaises(KeyError, lambda: record['kind'])
+        self.assertFalse('date' in record)
+        # Separators still are.
+        self.assertRaises(ValueError, lazy.parse, b'R2|012#20111226')
+        self.assertRaises(ValueError, xfw.LazyFieldList, LAZY_FIELD_LIST,
+            ['number', 'other'])
+
+    def testValidateOnParse(self):
+        lazy = xfw.LazyFieldList(LAZY_FIELD_LIST)
+        for data in (
+                    b'R2|012|20111226',
+                    b'R1|012|        ',
+                    b'R1#012|20111226',
+                ):
+            self.assertRaises(ValueError, LAZY_FIELD_LIST.parse, data)
+            self.assertRaises(ValueError, lazy.parse, data)
+
+    def testValidateOnAccess(self):
+        lazy = xfw.LazyFieldList(LAZY_FIELD_LIST,
+            validate=xfw.VALIDATE_ON_ACCESS)
+        record = lazy.parse(b'R2|012|        ')
+        self.assertEqual(record['number'], 12)
+        self.assertRaises(ValueError, lambda: record['kind'])
+        self.assertRaises(ValueError, lambda: record['date'])
+        self.assertRaises(ValueError, lazy.parse, b'R1#012|20111226')
+
+    def testNoValidation(self):
+        lazy = xfw.LazyFieldList(LAZY_FIELD_LIST, validate=None)
+        record = lazy.parse(b'R2#012#        ')
+        self.assertEqual(dict(record), {
+            'kind': b'R2',
+            'number': 12,
+            'date': None,
+            'version': 2,
+        })
+
+    def testFieldListFile(self):
+        lazy = xfw.LazyFieldList(LAZY_FIELD_LIST)
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count', lazy,
+            separator=b'\n')
+        expected_structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            LAZY_FIELD_LIST, separator=b'\n')
+        parsed = ({'date': datetime(2011, 12, 26), 'row_type': 1}, [
+            {
+                'kind': b'R1',
+                'number': x,
+                'date': datetime(2011, 12, x % 28 + 1),
+            }
+            for x in range(10)
+        ])
+        data = generate(expected_structure, parsed)
+        expected = expected_structure.parseStream(io.BytesIO(data))
+        head, item_list = structure.parseStream(io.BytesIO(data))
+        self.assertEqual(head, expected[0])
+        self.assertTrue(all(isinstance(x, xfw.LazyRecord) for x in item_list))
+        self.assertEqual([dict(x) for x in item_list], expected[1])
+        self.assertEqual([dict(x[2]) for x in structure.iterParseStream(
+            xfw.BlockReader(io.BytesIO(data), 7))], [expected[0]] + expected[1])
+        self.assertEqual(generate(structure, (head, item_list)), data)
+        # Only available fields are generated.
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            xfw.LazyFieldList(LAZY_FIELD_LIST, ['kind', 'date']),
+            separator=b'\n')
+        head, item_list = structure.parseStream(io.BytesIO(data))
+        for item in parsed[1]:
+            del item['number']
+        self.assertEqual(generate(structure, (head, item_list)),
+            generate(expected_structure, parsed))
+
+DISPATCHED_TYPE_DICT = {
+    1: xfw.FieldList([
+        (xfw.IntegerField(2, cast=True), True, 'row_type'),
+        (xfw.StringField(3), True, 'code'),
+    ], 5),
+    2: xfw.FieldList([
+        (xfw.IntegerField(2, cast=True), True, 'row_type'),
+        (xfw.IntegerField(4, cast=True), True, 'amount'),
+    ], 6),
+}
+DISPATCHED_PARSED = [
+    {'row_type': 1, 'code': b'abc'},
+    {'row_type': 2, 'amount': 42},
+    {'row_type': 1, 'code': b'def'},
+]
+DISPATCHED_DATA = b'01abc\n020042\n01def'
+
+def getDispatcher(**kw):
+    return xfw.FieldListDispatcher(xfw.IntegerField(2), 0,
+        DISPATCHED_TYPE_DICT, **kw)
+
+class FieldListDispatcherTests(unittest.TestCase):
+    def testParse(self):
+        dispatcher = getDispatcher()
+        self.assertEqual(dispatcher.parse(b'020042'), DISPATCHED_PARSED[1])
+        self.assertEqual(dispatcher.parseStream(io.BytesIO(b'01abc')),
+            DISPATCHED_PARSED[0])
+        self.assertEqual(list(dispatcher.iterParseStream(
+            io.BytesIO(DISPATCHED_DATA), separator=b'\n')), DISPATCHED_PARSED)
+        # Trailing separator is optional.
+        self.assertEqual(list(dispatcher.iterParseStream(
+            io.BytesIO(DISPATCHED_DATA + b'\n'), separator=b'\n')),
+            DISPATCHED_PARSED)
+        self.assertEqual(list(dispatcher.iterParseStream(io.BytesIO(b''))),
+            [])
+        self.assertRaises(ValueError, dispatcher.parse, b'03abc')
+        self.assertRaises(ValueError, list, dispatcher.iterParseStream(
+            io.BytesIO(b'01abc|020042'), separator=b'\n'))
+
+    def testTruncated(self):
+        dispatcher = getDispatcher()
+        for data in (b'0', DISPATCHED_DATA + b'\n0'):
+            try:
+                list(dispatcher.iterParseStream(io.BytesIO(data),
+                    separator=b'\n'))
+            except ValueError as exc:
+                self.assertTrue(str(exc).startswith('Truncated record'), exc)
+            else:
+                self.fail(data)
+        for stream in (io.BytesIO(b''), io.BytesIO(b'0')):
+            self.assertRaises(ValueError, dispatcher.parseStream, stream)
+        # Truncated after discriminator.
+        self.assertRaises(ValueError, list, dispatcher.iterParseStream(
+            io.BytesIO(DISPATCHED_DATA[:-1]), separator=b'\n'))
+
+    def testGenerate(self):
+        dispatcher = getDispatcher(field_id='row_type')
+        stream = io.BytesIO()
+        for index, item in enumerate(DISPATCHED_PARSED):
+            if index:
+                stream.write(b'\n')
+            dispatcher.generateStream(stream, item)
+        self.assertEqual(stream.getvalue(), DISPATCHED_DATA)
+        self.assertRaises(ValueError, dispatcher.generateStream, stream,
+            {'row_type': 3, 'code': b'abc'})
+        self.assertRaises(ValueError, getDispatcher().generateStream, stream,
+            DISPATCHED_PARSED[0])
+
+    def testFieldListFileItem(self):
+        dispatcher = getDispatcher(field_id='row_type')
+        head = {'date': datetime(2011, 12, 26), 'row_type': 0, 'row_count': 3}
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            dispatcher, separator=b'\n')
+        data = generate(structure, (head, DISPATCHED_PARSED))
+        self.assertEqual(data, b'20111226' b'0003\n' + DISPATCHED_DATA)
+        self.assertEqual(structure.parseStream(io.BytesIO(data)),
+            (head, DISPATCHED_PARSED))
+
+    def testTooShortType(self):
+        self.assertRaises(ValueError, xfw.FieldListDispatcher,
+            xfw.StringField(6), 0, DISPATCHED_TYPE_DICT)
+
+class TemporaryFileTestCase(unittest.TestCase):
+    def _getPath(self, data):
+        """
+        Returns the path of a temporary file containing given data, deleted
+        after test.
+        """
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(data)
+        return path
+
+class ParallelTests(TemporaryFileTestCase):
+    structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+        ROW_TYPE_DICT[2], separator=b'\n')
+
+    def setUp(self):
+        self.parsed = ({'date': datetime(2011, 12, 26), 'row_type': 2}, [
+            {
+                'time': datetime(1900, 1, 1, x % 23 + 1, 55),
+                'some_value': x,
+                'another_value': x % 10,
+            }
+            for x in range(50)
+        ])
+        self.data = generate(self.structure, self.parsed)
+        self.expected = self.structure.parseStream(io.BytesIO(self.data))
+
+    def testParse(self):
+        path = self._getPath(self.data)
+        # Several chunks, with a short last chunk or not, and a single chunk.
+        for chunk_item_count in (7, 10, 1, 49, 50, 100):
+            self.assertEqual(self.structure.parseFileParallel(path,
+                process_count=2, chunk_item_count=chunk_item_count),
+                self.expected, chunk_item_count)
+
+    def testOffset(self):
+        path = self._getPath(b'garbage' + self.data + b'\nmore garbage')
+        self.assertEqual(self.structure.parseFileParallel(path,
+            process_count=2, chunk_item_count=7, offset=7), self.expected)
+
+    def testIterParse(self):
+        path = self._getPath(self.data)
+        head, item_iterator = self.structure.iterParseFileParallel(path,
+            process_count=2, chunk_item_count=3)
+        self.assertEqual(head, self.expected[0])
+        self.assertEqual([next(item_iterator) for _ in range(10)],
+            self.expected[1][:10])
+        # Closing before the end stops workers.
+        item_iterator.close()
+        self.assertRaises(StopIteration, next, item_iterator)
+
+    def testNoItems(self):
+        parsed = ({'date': datetime(2011, 12, 26), 'row_type': 2}, [])
+        path = self._getPath(generate(self.structure, parsed))
+        self.assertEqual(self.structure.parseFileParallel(path,
+            process_count=2), self.structure.parseStream(io.BytesIO(
+            generate(self.structure, parsed))))
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            ROW_TYPE_DICT[2], separator=b'\n', item_filter=lambda head: False)
+        path = self._getPath(self.data)
+        self.assertEqual(structure.parseFileParallel(path, process_count=2),
+            structure.parseStream(io.BytesIO(self.data)))
+
+    def testBadSeparator(self):
+        item_stride = ROW_TYPE_DICT[2].total_length + 1
+        # Inside a chunk, and between chunks.
+        for item_index in (3, 7, 48):
+            offset = 12 + item_index * item_stride
+            self.assertEqual(self.data[offset:offset + 1], b'\n')
+            path = self._getPath(self.data[:offset] + b'X' +
+                self.data[offset + 1:])
+            self.assertRaises(ValueError, self.structure.parseFileParallel,
+                path, process_count=2, chunk_item_count=7)
+
+    def testTruncated(self):
+        item_stride = ROW_TYPE_DICT[2].total_length + 1
+        for length in (
+                    len(self.data) - 1,
+                    len(self.data) - item_stride,
+                    len(self.data) - 8 * item_stride,
+                    13,
+                ):
+            path = self._getPath(self.data[:length])
+            self.assertRaises(ValueError, self.structure.parseFileParallel,
+                path, process_count=2, chunk_item_count=7)
+
+    def testUnsupportedItem(self):
+        path = self._getPath(SAMPLE_DATA)
+        self.assertRaises(TypeError, FILE_STRUCTURE.parseFileParallel, path,
+            process_count=2)
+
+MAPPED_STRUCTURE = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+    ROW_TYPE_DICT[1], separator=b'\n')
+
+def getMappedParsed(row_count):
+    return ({'date': datetime(2011, 12, 26), 'row_type': 1}, [
+        {
+            'time': datetime(1900, 1, 1, x % 23 + 1, 55),
+            'description': b'row %i' % (x, ),
+        }
+        for x in range(row_count)
+    ])
+
+class MappedFileTests(TemporaryFileTestCase):
+    def _open(self, data, structure=MAPPED_STRUCTURE, offset=0):
+        stream = open(self._getPath(data), 'rb')
+        self.addCleanup(stream.close)
+        return xfw.MappedFile(stream, structure, offset=offset)
+
+    def testParse(self):
+        data = generate(MAPPED_STRUCTURE, getMappedParsed(10))
+        head, expected = MAPPED_STRUCTURE.parseStream(io.BytesIO(data))
+        with self._open(b'garbage' + data + b'\nmore garbage',
+                offset=7) as mapped_file:
+            self.assertEqual(mapped_file.getHead(), head)
+            item_list = mapped_file.getItemList()
+            self.assertEqual(len(item_list), 10)
+            self.assertEqual(list(item_list), expected)
+            self.assertEqual(item_list[0], expected[0])
+            self.assertEqual(item_list[-1], expected[-1])
+            self.assertRaises(IndexError, item_list.__getitem__, 10)
+            self.assertRaises(IndexError, item_list.__getitem__, -11)
+            for item_slice in (slice(2, 8, 3), slice(None, None, -1),
+                    slice(8, 20), slice(5, 2)):
+                sliced = item_list[item_slice]
+                self.assertEqual(len(sliced), len(expected[item_slice]))
+                self.assertEqual(list(sliced), expected[item_slice])
+            self.assertEqual(item_list[1:][1:][0], expected[2])
+
+    def testEmpty(self):
+        with self._open(generate(MAPPED_STRUCTURE, getMappedParsed(0))) as \
+                mapped_file:
+            self.assertEqual(mapped_file.getHead()['row_count'], 0)
+            self.assertEqual(len(mapped_file.getItemList()), 0)
+            self.assertEqual(list(mapped_file.getItemList()), [])
+
+    def testTruncated(self):
+        data = generate(MAPPED_STRUCTURE, getMappedParsed(3))
+        self.assertRaises(ValueError, self._open, data[:-1])
+
+    def testBadSeparator(self):
+        data = generate(MAPPED_STRUCTURE, getMappedParsed(3))
+        offset = BLOCK_HEADER.total_length + ROW_TYPE_DICT[1].total_length + 1
+        self.assertEqual(data[offset:offset + 1], b'\n')
+        with self._open(data[:offset] + b'X' + data[offset + 1:]) as \
+                mapped_file:
+            item_list = mapped_file.getItemList()
+            self.assertRaises(ValueError, item_list.__getitem__, 0)
+            # Last item has no separator to check.
+            self.assertEqual(item_list[2]['description'], b'row 2')
+
+    def testUnsupportedItem(self):
+        self.assertRaises(TypeError, self._open, SAMPLE_DATA, FILE_STRUCTURE)
+
+    def testClose(self):
+        mapped_file = self._open(generate(MAPPED_STRUCTURE,
+            getMappedParsed(3)))
+        item_list = mapped_file.getItemList()
+        sliced = item_list[1:]
+        item = item_list[0]
+        # Views of the mapping are still referenced by item lists.
+        mapped_file.close()
+        self.assertEqual(item['description'], b'row 0')
+        self.assertRaises(ValueError, item_list.__getitem__, 0)
+        self.assertRaises(ValueError, sliced.__getitem__, 0)
+
+class BlockIndexTests(TemporaryFileTestCase):
+    def _getData(self, block_count):
+        return generate(FILE_STRUCTURE, ({'comment': 'indexed'},
+            getBlockList(block_count)))
+
+    def _checkIndex(self, block_index, data):
+        head, block_list = FILE_STRUCTURE.parseStream(io.BytesIO(data))
+        self.assertEqual(len(block_index), len(block_list))
+        for index, block in enumerate(block_list):
+            self.assertEqual(block_index.parseBlock(index), block)
+            self.assertEqual(block_index.parseBlockHead(index), block[0])
+            self.assertEqual(block_index.getKey(index),
+                (block[0]['row_type'], block[0]['date']))
+        self.assertEqual(block_index.find(row_type=2),
+            [x for x, y in enumerate(block_list) if y[0]['row_type'] == 2])
+        self.assertEqual(block_index.find(row_type=1, date=datetime(2011, 12,
+            3)), [2])
+
+    def testUpdate(self):
+        stream = io.BytesIO(self._getData(4))
+        block_index = xfw.BlockIndex(stream, FILE_STRUCTURE,
+            ['row_type', 'date'])
+        self.assertEqual(len(block_index), 0)
+        self.assertEqual(block_index.update(), 4)
+        self.assertEqual(block_index.update(), 0)
+        self._checkIndex(block_index, stream.getvalue())
+        # File grows.
+        data = self._getData(7)
+        stream.seek(0)
+        stream.write(data)
+        self.assertEqual(block_index.update(), 3)
+        self._checkIndex(block_index, data)
+        self.assertRaises(ValueError, block_index.find, comment='indexed')
+        self.assertRaises(ValueError, xfw.BlockIndex, stream, FILE_STRUCTURE,
+            ['comment'])
+
+    def testSaveLoad(self):
+        stream = io.BytesIO(self._getData(4))
+        block_index = xfw.BlockIndex(stream, FILE_STRUCTURE,
+            ['row_type', 'date'])
+        block_index.update()
+        # Empty sidecar files are overwritten.
+        path = self._getPath(b'')
+        block_index.save(path)
+        size = os.path.getsize(path)
+        loaded = xfw.BlockIndex(stream, FILE_STRUCTURE, ['row_type', 'date'])
+        loaded.load(path)
+        self._checkIndex(loaded, stream.getvalue())
+        # File grows: loaded index is updated, and saving it appends to
+        # sidecar.
+        data = self._getData(7)
+        stream.seek(0)
+        stream.write(data)
+        self.assertEqual(loaded.update(), 3)
+        loaded.save(path)
+        self.assertEqual(os.path.getsize(path), size + 3 * (size - 12) // 4)
+        block_index.update()
+        block_index.save(path)
+        reloaded = xfw.BlockIndex(stream, FILE_STRUCTURE, ['row_type', 'date'])
+        reloaded.load(path)
+        self.assertEqual(reloaded.update(), 0)
+        self._checkIndex(reloaded, data)
+        for index in range(7):
+            self.assertEqual(reloaded.getOffset(index),
+                block_index.getOffset(index))
+        # Sidecar of an index of other fields.
+        self.assertRaises(ValueError, xfw.BlockIndex(stream, FILE_STRUCTURE,
+            ['row_type']).load, path)
+        # Sidecar of an older, longer index.
+        self.assertRaises(ValueError, xfw.BlockIndex(stream, FILE_STRUCTURE,
+            ['row_type', 'date']).save, path)
+        with open(path, 'wb') as sidecar:
+            sidecar.write(b'garbage')
+        self.assertRaises(ValueError, loaded.load, path)
+
+    def testFile(self):
+        path = self._getPath(self._getData(5))
+        with open(path, 'rb') as stream:
+            block_index = xfw.BlockIndex(stream, FILE_STRUCTURE,
+                ['row_type', 'date'])
+            block_index.update()
+            self._checkIndex(block_index, self._getData(5))
+
+    def testFieldListBlocks(self):
+        # Blocks without items.
+        structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            ROW_TYPE_DICT[2], separator=b'\n')
+        parsed = ({'date': datetime(2011, 12, 26), 'row_type': 2}, [
+            {
+                'time': datetime(1900, 1, 1, 11, 55),
+                'some_value': x,
+                'another_value': x % 3,
+            }
+            for x in range(6)
+        ])
+        stream = io.BytesIO(generate(structure, parsed))
+        block_index = xfw.BlockIndex(stream, structure, ['another_value'])
+        self.assertEqual(block_index.update(), 6)
+        self.assertEqual(block_index.find(another_value=1), [1, 4])
+        self.assertEqual(block_index.getKey(5), (2, ))
+        self.assertEqual(block_index.parseBlock(4), parsed[1][4])
+        self.assertEqual(block_index.parseBlockHead(3), parsed[1][3])
+        self.assertEqual(block_index.getOffset(1), 12 + 1 + 17 + 1)
+        stream = io.BytesIO(generate(structure, parsed)[:-1])
+        self.assertRaises(ValueError, xfw.BlockIndex(stream, structure).update)
+
+class DateTimeFieldTests(unittest.TestCase):
+    def _check(self, fmt, data_list):
+        """
+        Check field parses given values like datetime.strptime, including
+        errors.
+        """
+        field = xfw.DateTimeField(fmt, cast=True)
+        # Generated fast path is used.
+        self.assertNotEqual(field._numeric_format, None)
+        for data in data_list:
+            self.assertEqual(len(data), field.getLength(), data)
+            try:
+                expected = datetime.strptime(data.decode('ascii'), fmt)
+            except ValueError:
+                expected = str(sys.exc_info()[1])
+                try:
+                    field.parse(data)
+                except ValueError:
+                    self.assertEqual(str(sys.exc_info()[1]), expected, data)
+                else:
+                    raise AssertionError('%r did not fail' % (data, ))
+            else:
+                self.assertEqual(field.parse(data), expected, data)
+
+    def testValid(self):
+        self._check('%Y%m%d', [b'20111226', b'00010101', b'99991231',
+            b'20000229'])
+        self._check('%Y-%m-%d %H:%M:%S', [b'2011-12-26 11:55:00',
+            b'2011-12-26 23:59:59', b'2011-12-26 00:00:00'])
+        self._check('%Y%%%m', [b'2011%12'])
+
+    def testOutOfRange(self):
+        self._check('%Y%m%d', [b'20111326', b'20111200', b'20111232',
+            b'20110230', b'20110229', b'00001226'])
+        self._check('%H%M%S', [b'240000', b'236000', b'235960', b'235961',
+            b'235999'])
+
+    def testNotDigit(self):
+        self._check('%Y%m%d', [b'2011122a', b'2011-226', b'+0111226',
+            b'-0111226', b'2011 226'])
+        self._check('%Y-%m-%d', [b'2011/12/26', b'2011-1-226', b'2011--1-26',
+            b'20111226  '])
+        self._check('%Y%%%m', [b'2011-12', b'2011%1a'])
+
+    def testStrptimeOnly(self):
+        # Values rejected by the fast path, but accepted by strptime.
+        self._check('%Y%m%d', [b'201112 5'])
+        self._check('%H:%M', [b'1:055'])
+
+    def testCache(self):
+        field = xfw.DateTimeField('%Y%m%d', cast=True, cache_size=2)
+        first = field.parse(b'20111226')
+        self.assertEqual(first, datetime(2011, 12, 26))
+        self.assertTrue(field.parse(b'20111226') is first)
+        second = field.parse(b'20111227')
+        self.assertTrue(field.parse(b'20111226') is first)
+        self.assertTrue(field.parse(b'20111227') is second)
+        # Errors are not cached.
+        for _ in range(2):
+            self.assertRaises(ValueError, field.parse, b'20111232')
+        self.assertTrue(field.parse(b'20111226') is first)
+        # Cache is emptied when full.
+        self.assertEqual(field.parse(b'20111228'), datetime(2011, 12, 28))
+        self.assertTrue(len(field._cache) <= 2)
+        again = field.parse(b'20111226')
+        self.assertEqual(again, first)
+        self.assertFalse(again is first)
+        # Null values do not use the cache.
+        self.assertEqual(field.parse(b'00000000'), None)
+        self.assertEqual(field.parse(b'        '), None)
+        self.assertTrue(field.parse(b'20111226') is again)
+
+    def testNoCache(self):
+        field = xfw.DateTimeField('%Y%m%d', cast=True)
+        self.assertFalse(field.parse(b'20111226') is
+            field.parse(b'20111226'))
+        self.assertEqual(field._cache, {})
+
+    def testCachePickle(self):
+        field = xfw.DateTimeField('%Y%m%d', cast=True, cache_size=2)
+        field.parse(b'20111226')
+        loaded = pickle.loads(pickle.dumps(field))
+        self.assertEqual(loaded.parse(b'20111226'), datetime(2011, 12, 26))
+        self.assertEqual(loaded.parse(b'20111227'),
+            datetime(2011, 12, 27))
+
+class CheckpointTests(unittest.TestCase):
+    def setUp(self):
+        self.parsed = ({'comment': 'checkpoints'}, getBlockList(12, 4))
+        self.data = generate(FILE_STRUCTURE, self.parsed)
+        self.flat_structure = xfw.ConstItemTypeFile(BLOCK_HEADER, 'row_count',
+            ROW_TYPE_DICT[2], separator=b'\n')
+        self.flat_data = generate(self.flat_structure, (
+            {'date': datetime(2011, 12, 26), 'row_type': 2},
+            [
+                {
+                    'time': datetime(1900, 1, 1, 11, 55),
+                    'some_value': x,
+                    'another_value': x % 10,
+                }
+                for x in range(30)
+            ],
+        ))
+
+    def _checkResume(self, structure, data, newStream, interval=3,
+            checkpointFilter=lambda x: x):
+        """
+        Parse data with checkpoints, then resume from each of them on a new
+        stream returned by newStream(data). Returns the list of
+        (checkpoint index, stream used to resume) for further checks.
+        """
+        event_list = list(structure.iterParseStream(newStream(data),
+            checkpoint_interval=interval))
+        expected = list(structure.iterParseStream(io.BytesIO(data)))
+        self.assertEqual([x for x in event_list if x[1] != xfw.CHECKPOINT],
+            expected)
+        result = []
+        checkpoint_count = 0
+        for index, (_, event_type, checkpoint) in enumerate(event_list):
+            if event_type != xfw.CHECKPOINT:
+                continue
+            checkpoint_count += 1
+            stream = newStream(data)
+            self.assertEqual(list(structure.iterParseStream(stream,
+                    checkpoint=checkpointFilter(checkpoint))),
+                [x for x in event_list[index:] if x[1] != xfw.CHECKPOINT])
+            result.append((index, stream))
+        self.assertEqual(checkpoint_count, sum(
+            1 for x in expected if x[1] == xfw.PARSED_ITEM) // interval)
+        return result
+
+    def testFlat(self):
+        self._checkResume(self.flat_structure, self.flat_data, io.BytesIO)
+        self._checkResume(self.flat_structure, self.flat_data, io.BytesIO,
+            interval=30)
+
+    def testNested(self):
+        for interval in (1, 4, 7):
+            self._checkResume(FILE_STRUCTURE, self.data, io.BytesIO,
+                interval)
+
+    def testItemFilter(self):
+        structure = getFileStructure(item_filter=keepRowType2)
+        digest = hashlib.sha1(self.data).hexdigest()
+        for _, stream in self._checkResume(structure, self.data,
+                lambda data: xfw.SHA1ChecksumedFile(io.BytesIO(data)),
+                interval=2):
+            self.assertEqual(stream.getHexDigest(), digest)
+
+    def testChecksumedFile(self):
+        digest = hashlib.sha1(self.data).hexdigest()
+        for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                lambda data: xfw.SHA1ChecksumedFile(io.BytesIO(data))):
+            self.assertEqual(stream.getHexDigest(), digest)
+
+    def testBlockReader(self):
+        digest = hashlib.sha1(self.data).hexdigest()
+        for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                lambda data: xfw.BlockReader(xfw.SHA1ChecksumedFile(
+                    io.BytesIO(data)), 7)):
+            self.assertEqual(stream.detach().getHexDigest(), digest)
+        # Without checksum, state is the position.
+        for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                lambda data: xfw.BlockReader(io.BytesIO(data), 7)):
+            self.assertEqual(stream.detach().tell(), len(self.data))
+
+    def testMultiChecksumedFile(self):
+        expected = (hashlib.md5(self.data).hexdigest(),
+            hashlib.sha1(self.data).hexdigest())
+        for threaded in (False, True):
+            stream_list = []
+            def newStream(data):
+                stream = xfw.MultiChecksumedFile(io.BytesIO(data),
+                    ['md5', 'sha1'], threaded=threaded)
+                stream_list.append(stream)
+                return stream
+            for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                    newStream, interval=5):
+                self.assertEqual((stream.getHexDigest('md5'),
+                    stream.getHexDigest('sha1')), expected)
+            for stream in stream_list:
+                stream.close()
+
+    def testPickled(self):
+        digest = hashlib.sha1(self.data).hexdigest()
+        def reload(checkpoint):
+            checkpoint = pickle.loads(pickle.dumps(checkpoint))
+            # Checksum state is lost, and recomputed when resuming.
+            self.assertEqual(checkpoint.stream_state.hash, None)
+            return checkpoint
+        for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                lambda data: xfw.SHA1ChecksumedFile(io.BytesIO(data)),
+                checkpointFilter=reload):
+            self.assertEqual(stream.getHexDigest(), digest)
+        for _, stream in self._checkResume(FILE_STRUCTURE, self.data,
+                lambda data: xfw.BlockReader(xfw.SHA1ChecksumedFile(
+                    io.BytesIO(data)), 7), checkpointFilter=reload):
+            self.assertEqual(stream.detach().getHexDigest(), digest)
+        self._checkResume(self.flat_structure, self.flat_data, io.BytesIO,
+            checkpointFilter=lambda x: pickle.loads(pickle.dumps(x)))
+
+    def testPickledTruncated(self):
+        event_list = list(FILE_STRUCTURE.iterParseStream(
+            xfw.SHA1ChecksumedFile(io.BytesIO(self.data)),
+            checkpoint_interval=3))
+        checkpoint = pickle.loads(pickle.dumps(
+            [x for x in event_list if x[1] == xfw.CHECKPOINT][-1][2]))
+        # Checksum cannot be recomputed from too short data.
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(self.data[:30]))
+        self.assertRaises(ValueError, FILE_STRUCTURE.iterParseStream, stream,
+            checkpoint=checkpoint)
+
+class ChecksumedFileStateTests(unittest.TestCase):
+    data = bytes(bytearray(range(256))) * 10
+
+    def _check(self, newStream, getDigest, state_filter=lambda x: x):
+        stream = newStream(io.BytesIO(self.data))
+        self.assertEqual(stream.read(1000), self.data[:1000])
+        state = stream.getState()
+        self.assertEqual(stream.read(500), self.data[1000:1500])
+        # Restore on the same instance.
+        stream.setState(state_filter(state))
+        self.assertEqual(stream.read(), self.data[1000:])
+        self.assertEqual(getDigest(stream),
+            hashlib.sha1(self.data).hexdigest())
+        # Restore on another instance over the same data.
+        other = newStream(io.BytesIO(self.data))
+        other.setState(state_filter(state))
+        self.assertEqual(other.read(), self.data[1000:])
+        self.assertEqual(getDigest(other), hashlib.sha1(self.data).hexdigest())
+        # State can be reused.
+        other.setState(state_filter(state))
+        self.assertEqual(other.read(1), self.data[1000:1001])
+        return stream, other
+
+    def testSHA1(self):
+        self._check(xfw.SHA1ChecksumedFile, lambda x: x.getHexDigest())
+
+    def testPickled(self):
+        self._check(xfw.SHA1ChecksumedFile, lambda x: x.getHexDigest(),
+            lambda x: pickle.loads(pickle.dumps(x)))
+
+    def testStart(self):
+        # Recomputed checksum only covers data from where the ChecksumedFile
+        # was created.
+        prefixed = io.BytesIO(b'prefix' + self.data)
+        prefixed.seek(6)
+        stream = xfw.SHA1ChecksumedFile(prefixed)
+        stream.read(1000)
+        state = pickle.loads(pickle.dumps(stream.getState()))
+        stream.read(10)
+        stream.setState(state)
+        self.assertEqual(stream.read(), self.data[1000:])
+        self.assertEqual(stream.getHexDigest(),
+            hashlib.sha1(self.data).hexdigest())
+
+    def testMulti(self):
+        for threaded in (False, True):
+            stream, other = self._check(
+                lambda x: xfw.MultiChecksumedFile(x, ['sha1', 'md5'],
+                    threaded=threaded),
+                lambda x: x.getHexDigest('sha1'),
+                lambda x: pickle.loads(pickle.dumps(x)))
+            self.assertEqual(stream.getHexDigest('md5'),
+                hashlib.md5(self.data).hexdigest())
+            stream.close()
+            other.close()
+
+    def testBlockReader(self):
+        self._check(lambda x: xfw.BlockReader(xfw.SHA1ChecksumedFile(x), 64),
+            lambda x: x.detach().getHexDigest())
+
+class SlowHash(object):
+    """
+    Hash object taking its time, so background hashing lags behind updates.
+    """
+    def __init__(self):
+        self._hash = hashlib.sha1()
+
+    def update(self, data):
+        time.sleep(.01)
+        self._hash.update(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+class HashPipelineTests(unittest.TestCase):
+    def _runScript(self, source):
+        # Interpreter exit is what is tested, so use a separate process.
+        process = subprocess.Popen([sys.executable, '-c', source],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        timer = threading.Timer(30, process.kill)
+        timer.start()
+        try:
+            output = process.communicate()[0]
+        finally:
+            timer.cancel()
+        self.assertEqual(process.returncode, 0, output)
+        self.assertEqual(output, b'')
+
+    def testExitWithPendingData(self):
+        self._runScript(
+            'import io, xfw\n'
+            'f = xfw.MultiChecksumedFile(io.BytesIO(b"x" * 100000),\n'
+            '    ["md5", "sha1"], chunk_size=16)\n'
+            'f.read(10)\n'
+        )
+
+    def testExitAfterParseError(self):
+        self._runScript(
+            'import io, test_xfw, xfw\n'
+            'f = xfw.MultiChecksumedFile(io.BytesIO(\n'
+            '    test_xfw.SAMPLE_DATA[:-3] + b"XYZ"), ["md5", "sha1"])\n'
+            'try:\n'
+            '    test_xfw.FILE_STRUCTURE.parseStream(f)\n'
+            'except ValueError:\n'
+            '    pass\n'
+        )
+
+    def testAbort(self):
+        pipeline = xfw.HashPipeline([hashlib.md5()], chunk_size=1)
+        thread = pipeline._thread
+        pipeline.update(b'x')
+        pipeline.abort()
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+
+    def testReusedBuffer(self):
+        data = bytes(bytearray(range(256))) * 4
+        expected = hashlib.sha1(data * 8).hexdigest()
+        # Single chunks given to background thread, and pending chunks.
+        for chunk_size, threaded in ((1, True), (1024, True), (4096, True),
+                (4096, False)):
+            buf = bytearray(len(data))
+            for getChunk in (lambda: buf, lambda: memoryview(buf)):
+                pipeline = xfw.HashPipeline([SlowHash()], chunk_size,
+                    threaded)
+                for index in range(8):
+                    buf[:] = data
+                    pipeline.update(getChunk())
+                    buf[:] = b'x' * len(data)
+                self.assertEqual(pipeline.hexdigest(), expected)
+                pipeline.close()
+        stream = xfw.MultiChecksumedFile(io.BytesIO(), ['sha1'],
+            chunk_size=1024)
+        buf = bytearray(len(data))
+        for index in range(8):
+            buf[:] = data
+            stream.write(buf)
+            buf[:] = b'x' * len(data)
+        self.assertEqual(stream.getHexDigest(), expected)
+        stream.close()
+
+    def testSetStateStopsReplacedPipeline(self):
+        stream = xfw.MultiChecksumedFile(io.BytesIO(SAMPLE_DATA),
+            ['md5', 'sha1'])
+        state = stream.getState()
+        state.hash = None
+        FILE_STRUCTURE.parseStream(stream)
+        thread = stream._hash._thread
+        stream.setState(state)
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(FILE_STRUCTURE.parseStream(stream), SAMPLE_PARSED)
+        self.assertEqual(stream.getHexDigest('sha1'),
+            hashlib.sha1(SAMPLE_DATA).hexdigest())
+        stream.close()
+
+class ProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.call_list = []
+        self.profiler = xfw.Profiler(callback=lambda *args:
+            self.call_list.append(args))
+
+    def _getStat(self, kind, name, action):
+        stat = self.profiler.getStats()[(kind, name, action)]
+        return stat['count'], stat['failed'], stat['bytes']
+
+    def testWrap(self):
+        wrapped = self.profiler.wrap('kind', 'name', 'action', int)
+        self.assertEqual(wrapped(b'12'), 12)
+        self.assertRaises(ValueError, wrapped, b'1X3')
+        self.assertEqual(self._getStat('kind', 'name', 'action'), (2, 1, 5))
+        self.assertEqual([x[:4] + x[5:] for x in self.call_list], [
+            ('kind', 'name', 'action', 2, False),
+            ('kind', 'name', 'action', 3, True),
+        ])
+        wrapped = self.profiler.wrap('kind', 'other', 'action', int,
+            byte_count=4)
+        wrapped(b'1')
+        self.assertEqual(self._getStat('kind', 'other', 'action'), (1, 0, 4))
+        # Statistics are copies.
+        self.profiler.getStats()[('kind', 'other', 'action')]['count'] = 5
+        self.assertEqual(self._getStat('kind', 'other', 'action'), (1, 0, 4))
+        self.profiler.reset()
+        self.assertEqual(self.profiler.getStats(), {})
+
+    def testWrapStream(self):
+        read = lambda stream, length: stream.read(length)
+        wrapped = self.profiler.wrapStream('kind', 'name', 'action', read)
+        stream = io.BytesIO(b'abcdef')
+        stream.read(1)
+        self.assertEqual(wrapped(stream, 3), b'bcd')
+        # Streams without tell do not count bytes.
+        self.assertEqual(wrapped(NonSeekableStream(b'abcdef'), 2), b'ab')
+        self.assertEqual(self._getStat('kind', 'name', 'action'), (2, 0, 3))
+        self.assertEqual([x[3] for x in self.call_list], [3, None])
+
+    def testFieldList(self):
+        field_list = xfw.FieldList(ROW_TYPE_DICT[2].field_list, 17)
+        field_list.setProfiler(self.profiler, 'row')
+        row = {
+            'time': datetime(1900, 1, 1, 11, 55),
+            'some_value': 99,
+            'another_value': 8,
+        }
+        self.assertEqual(field_list.parse(b'11550099        8'), row)
+        self.assertRaises(ValueError, field_list.parse, b'11550099        X')
+        self.assertEqual(field_list.generate(row), b'11550099        8')
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE, 'row', 'parse'),
+            (2, 1, 34))
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE, 'row',
+            'generate'), (1, 0, 17))
+        self.assertEqual(self._getStat(xfw.PROFILE_FIELD, 'IntegerField',
+            'parse'), (4, 1, 6))
+        self.assertEqual(self._getStat(xfw.PROFILE_FIELD, 'DateTimeField',
+            'generate'), (1, 0, 6))
+        # Profiler is not pickled.
+        self.assertEqual(pickle.loads(pickle.dumps(field_list)).parse(
+            b'11550099        8'), row)
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE, 'row', 'parse'),
+            (2, 1, 34))
+        field_list.setProfiler(None)
+        self.assertEqual(field_list.parse(b'11550099        8'), row)
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE, 'row', 'parse'),
+            (2, 1, 34))
+        # Default name.
+        field_list.setProfiler(self.profiler)
+        field_list.parse(b'11550099        8')
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE,
+            'time,some_value,another_value', 'parse'), (1, 0, 17))
+
+    def testFieldListFile(self):
+        structure = getFileStructure()
+        structure.setProfiler(self.profiler)
+        self.assertEqual(structure.parseStream(io.BytesIO(SAMPLE_DATA)),
+            SAMPLE_PARSED)
+        self.assertEqual(structure.parseStream(NonSeekableStream(SAMPLE_DATA)),
+            SAMPLE_PARSED)
+        self.assertEqual(generate(structure, SAMPLE_PARSED), SAMPLE_DATA)
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE,
+            'ConstItemTypeFile', 'parse'), (2, 0, len(SAMPLE_DATA)))
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE,
+            'ConstItemTypeFile', 'generate'), (1, 0, len(SAMPLE_DATA)))
+        # Nested structures are not instrumented.
+        self.assertEqual(len(self.profiler.getStats()), 2)
+        structure.setProfiler(None)
+        self.assertFalse('parseStream' in vars(structure))
+        structure.parseStream(io.BytesIO(SAMPLE_DATA))
+        self.assertEqual(self._getStat(xfw.PROFILE_STRUCTURE,
+            'ConstItemTypeFile', 'parse'), (2, 0, len(SAMPLE_DATA)))
+
+    def testChecksumedFile(self):
+        stream = xfw.SHA1ChecksumedFile(io.BytesIO(SAMPLE_DATA))
+        stream.setProfiler(self.profiler, 'sample')
+        FILE_STRUCTURE.parseStream(stream)
+        self.assertEqual(stream.getHexDigest(),
+            hashlib.sha1(SAMPLE_DATA).hexdigest())
+        count, failed, byte_count = self._getStat(xfw.PROFILE_HASH, 'sample',
+            'update')
+        self.assertTrue(count)
+        self.assertEqual((failed, byte_count), (0, len(SAMPLE_DATA)))
+        stream.setProfiler(None)
+        self.assertFalse('update' in vars(stream))
+
+class GetFieldTypeTests(unittest.TestCase):
+    def testShared(self):
+        field = xfw.getFieldType(xfw.IntegerField, 2, cast=True)
+        self.assertTrue(isinstance(field, xfw.IntegerField))
+        self.assertEqual(field.getLength(), 2)
+        self.assertEqual(field.parse(b'42'), 42)
+        self.assertTrue(xfw.getFieldType(xfw.IntegerField, 2, cast=True) is
+            field)
+        # Keyword argument order does not matter.
+        self.assertTrue(xfw.getFieldType(xfw.DateTimeField, '%Y%m%d',
+            cast=True, cache_size=8) is xfw.getFieldType(xfw.DateTimeField,
+            '%Y%m%d', cache_size=8, cast=True))
+        for other in (
+                    xfw.getFieldType(xfw.IntegerField, 2),
+                    xfw.getFieldType(xfw.IntegerField, 3, cast=True),
+                    xfw.getFieldType(xfw.StringField, 2, cast=True),
+                    xfw.getFieldType(PlainIntegerField, 2, cast=True),
+                ):
+            self.assertFalse(other is field, other)
+
+if __name__ == '__main__':
+    unittest.main()
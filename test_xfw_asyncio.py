@@ -0,0 +1,187 @@
+"""
+Tests of xfw_asyncio, which requires Python 3.6 or later.
+This module avoids coroutine syntax, so it can be collected on any version.
+"""
+import hashlib
+import io
+import unittest
+try:
+    import asyncio
+    import xfw_asyncio
+except (ImportError, SyntaxError):
+    xfw_asyncio = None
+import xfw
+from test_xfw import FILE_STRUCTURE, SAMPLE_DATA, SAMPLE_PARSED, \
+    ROOT_HEADER, BLOCK_HEADER, blockCallback, getBlockList, generate, \
+    getFileStructure, getFilteredParsed, keepRowType2
+
+class FakeStreamWriter(object):
+    """
+    Minimal asyncio.StreamWriter, accumulating written data in memory.
+    """
+    def __init__(self, loop):
+        self._loop = loop
+        self.write_list = []
+
+    def write(self, data):
+        self.write_list.append(data)
+
+    def drain(self):
+        result = self._loop.create_future()
+        result.set_result(None)
+        return result
+
+    def getvalue(self):
+        return b''.join(self.write_list)
+
+@unittest.skipIf(xfw_asyncio is None, 'Python 3.6 or later required')
+class AsyncTests(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def _getReader(self, data, hash_object=None, block_size=7,
+            piece_size=5, eof=True):
+        """
+        Returns an AsyncReader over a StreamReader receiving given data by
+        small pieces, so reads span several of them.
+        If eof is false, the StreamReader is left open, as over a connection
+        the peer keeps open.
+        """
+        reader = asyncio.StreamReader()
+        for offset in range(0, len(data), piece_size):
+            reader.feed_data(data[offset:offset + piece_size])
+        if eof:
+            reader.feed_eof()
+        return xfw_asyncio.AsyncReader(reader, hash_object,
+            block_size=block_size)
+
+    def _parse(self, data, structure=FILE_STRUCTURE, **kw):
+        # Fail rather than hang when waiting for data which never comes.
+        return self._run(asyncio.wait_for(xfw_asyncio.parseStream(structure,
+            self._getReader(data, **kw)), 10))
+
+    def _iterParse(self, data, structure=FILE_STRUCTURE, **kw):
+        event_iterator = xfw_asyncio.iterParseStream(structure,
+            self._getReader(data, **kw))
+        result = []
+        while True:
+            try:
+                result.append(self._run(asyncio.wait_for(
+                    event_iterator.__anext__(), 10)))
+            except StopAsyncIteration:
+                return result
+
+    def _generate(self, parsed, structure=FILE_STRUCTURE, hash_object=None):
+        writer = FakeStreamWriter(self.loop)
+        self._run(xfw_asyncio.generateStream(structure,
+            xfw_asyncio.AsyncWriter(writer, hash_object, block_size=16),
+            parsed))
+        return writer.getvalue()
+
+    def testParse(self):
+        self.assertEqual(self._parse(SAMPLE_DATA), SAMPLE_PARSED)
+
+    def testIterParse(self):
+        self.assertEqual(self._iterParse(SAMPLE_DATA),
+            list(FILE_STRUCTURE.iterParseStream(io.BytesIO(SAMPLE_DATA))))
+
+    def testGenerate(self):
+        self.assertEqual(self._generate(SAMPLE_PARSED), SAMPLE_DATA)
+
+    def testRoundTrip(self):
+        parsed = ({'header_id': b'HEAD1', 'comment': 'many blocks'},
+            getBlockList(40))
+        data = self._generate(parsed)
+        self.assertEqual(data, generate(FILE_STRUCTURE, parsed))
+        parsed[0]['block_count'] = 40
+        self.assertEqual(self._parse(data), parsed)
+        self.assertEqual(self._parse(data, block_size=4096, piece_size=4096),
+            parsed)
+        self.assertEqual(self._iterParse(data),
+            list(FILE_STRUCTURE.iterParseStream(io.BytesIO(data))))
+
+    def testDigest(self):
+        parsed = ({'comment': 'many blocks'}, getBlockList(20))
+        expected = hashlib.sha1(generate(FILE_STRUCTURE, parsed)).hexdigest()
+        hash_object = hashlib.sha1()
+        data = self._generate(parsed, hash_object=hash_object)
+        self.assertEqual(hash_object.hexdigest(), expected)
+        hash_object = hashlib.sha1()
+        self._parse(data, hash_object=hash_object)
+        self.assertEqual(hash_object.hexdigest(), expected)
+        hash_pipeline = xfw.HashPipeline([hashlib.sha1(), hashlib.md5()])
+        self._iterParse(data, hash_object=hash_pipeline)
+        self.assertEqual(hash_pipeline.hexdigest(), expected)
+        self.assertEqual(hash_pipeline.getHashList()[1].hexdigest(),
+            hashlib.md5(data).hexdigest())
+        hash_pipeline.close()
+
+    def testTruncated(self):
+        for length in (0, 10, 30, 42, len(SAMPLE_DATA) - 1):
+            self.assertRaises(ValueError, self._parse, SAMPLE_DATA[:length])
+            self.assertRaises(ValueError, self._iterParse,
+                SAMPLE_DATA[:length])
+
+    def testItemFilter(self):
+        structure = getFileStructure(item_filter=keepRowType2)
+        parsed = ({'comment': 'filtered'}, getBlockList(30, 20))
+        data = generate(FILE_STRUCTURE, parsed)
+        hash_object = hashlib.sha1()
+        result = self._parse(data, structure, hash_object=hash_object)
+        self.assertEqual(result, structure.parseStream(io.BytesIO(data)))
+        self.assertEqual(result[1], getFilteredParsed(parsed)[1])
+        self.assertEqual(hash_object.hexdigest(),
+            hashlib.sha1(data).hexdigest())
+        self.assertEqual(self._iterParse(data, structure),
+            list(structure.iterParseStream(io.BytesIO(data))))
+        for length in range(len(data) - 1, 0, -97):
+            self.assertRaises(ValueError, self._parse, data[:length],
+                structure)
+        # Nested structures are skipped too.
+        structure = xfw.ConstItemTypeFile(ROOT_HEADER, 'block_count',
+            xfw.FieldListFile(BLOCK_HEADER, blockCallback, separator=b'\n'),
+            separator=b'\n', item_filter=lambda head: False)
+        hash_object = hashlib.sha1()
+        self.assertEqual(self._parse(data, structure, hash_object=hash_object),
+            structure.parseStream(io.BytesIO(data)))
+        self.assertEqual(hash_object.hexdigest(),
+            hashlib.sha1(data).hexdigest())
+
+    def testOpenStream(self):
+        # Parsing only waits for data which is part of the structure.
+        structure = xfw.ConstItemTypeFile(
+            xfw.FieldList([(xfw.IntegerField(2, cast=True), True, 'count')],
+                2),
+            'count',
+            xfw.FieldList([(xfw.StringField(3), True, 'value')], 3),
+            separator=b'\n',
+        )
+        for data in (b'01\nabc', b'02\nabc\ndef', b'00'):
+            self.assertEqual(self._parse(data, structure, eof=False),
+                structure.parseStream(io.BytesIO(data)))
+            self.assertEqual(self._iterParse(data, structure, eof=False),
+                list(structure.iterParseStream(io.BytesIO(data))))
+        for block_size in (7, 4096):
+            self.assertEqual(self._parse(SAMPLE_DATA, eof=False,
+                block_size=block_size), SAMPLE_PARSED)
+            self.assertEqual(self._iterParse(SAMPLE_DATA, eof=False,
+                block_size=block_size),
+                list(FILE_STRUCTURE.iterParseStream(io.BytesIO(SAMPLE_DATA))))
+        structure = getFileStructure(item_filter=keepRowType2)
+        self.assertEqual(self._parse(SAMPLE_DATA, structure, eof=False),
+            structure.parseStream(io.BytesIO(SAMPLE_DATA)))
+
+    def testBadSeparator(self):
+        data = SAMPLE_DATA.replace(b'\n1155', b'X1155', 1)
+        self.assertRaises(ValueError, self._parse, data)
+
+if __name__ == '__main__':
+    unittest.main()
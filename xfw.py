@@ -25,19 +25,467 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 ##############################################################################
+import atexit
 import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from binascii import hexlify, unhexlify
+from collections import namedtuple
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+try:
+    import numpy
+except ImportError:
+    numpy = None
 strptime = datetime.strptime
 dummy_datetime = datetime(1900, 1, 1) # Any date will do
 
+# Python 2/3 compatibility.
+# On Python 3, rendered data is bytes: parsers accept bytes, bytearray and
+# memoryview instances (the latter allowing to slice records without copying
+# them), and generators produce bytes.
+if sys.version_info < (3, ):
+    _PY3 = False
+    _text_type = unicode
+    _integer_type_tuple = (int, long)
+    _rendered_type_tuple = (str, unicode)
+    def _strptime(data, fmt):
+        if '\0' in data:
+            # strptime raises TypeError, make it an invalid value as on
+            # Python 3.
+            raise ValueError('time data %r does not match format %r' % (
+                data, fmt))
+        return strptime(data, fmt)
+    def _toBytes(data):
+        return data
+    _getView = _toBytes
+    def _copyBytes(data):
+        if isinstance(data, memoryview):
+            return data.tobytes()
+        return bytes(data)
+    def _intFromBytes(data, byteorder, signed=False):
+        if byteorder == 'little':
+            data = data[::-1]
+        if not data:
+            return 0
+        result = int(hexlify(data), 16)
+        if signed and ord(data[0]) & 0x80:
+            result -= 1 << len(data) * 8
+        return result
+    def _intToBytes(value, length, byteorder):
+        result = unhexlify('%0*x' % (length * 2, value))
+        if byteorder == 'little':
+            result = result[::-1]
+        return result
+else:
+    _PY3 = True
+    xrange = range
+    _text_type = str
+    _integer_type_tuple = (int, )
+    _rendered_type_tuple = (bytes, bytearray, memoryview)
+    def _strptime(data, fmt):
+        return strptime(bytes(data).decode('ascii'), fmt)
+    _toBytes = bytes
+    _copyBytes = bytes
+    _getView = memoryview
+    _intFromBytes = int.from_bytes
+    def _intToBytes(value, length, byteorder):
+        return value.to_bytes(length, byteorder)
+# Values accepted by string-ish field renderers.
+_string_type_tuple = (bytes, _text_type)
+
 __all__ = [
     'BaseField', 'PaddedField',
     'StringField', 'IntegerField', 'DateTimeField',
+    'BinaryField', 'BinaryIntegerField', 'PackedDecimalField',
+    'OverpunchField',
+    'getFieldType',
     'FieldList',
     'FieldListFile', 'HeadFile', 'ConstItemTypeFile',
-    'ChecksumedFile',
+    'ChecksumedFile', 'ChecksumedFileState', 'MultiChecksumedFile',
+    'HashPipeline', 'BlockReader',
+    'MappedFile', 'BlockIndex',
+    'LazyFieldList', 'LazyRecord',
+    'FieldListDispatcher',
+    'PARSED_HEAD', 'PARSED_ITEM', 'CHECKPOINT', 'Checkpoint',
+    'VALIDATE_ON_PARSE', 'VALIDATE_ON_ACCESS',
+    'Profiler', 'PROFILE_FIELD', 'PROFILE_STRUCTURE', 'PROFILE_HASH',
 ]
 
+# Event types produced by FieldListFile.iterParseStream .
+PARSED_HEAD = 'head'
+PARSED_ITEM = 'item'
+CHECKPOINT = 'checkpoint'
+
+# Validation modes of LazyFieldList.
+VALIDATE_ON_PARSE = 'parse'
+VALIDATE_ON_ACCESS = 'access'
+
+# Kinds of statistics collected by Profiler.
+PROFILE_FIELD = 'field'
+PROFILE_STRUCTURE = 'structure'
+PROFILE_HASH = 'hash'
+
+# Default size of reads done by BlockReader.
+BLOCK_SIZE = 1 << 20
+
+# array typecode for file offsets.
+try:
+    array('Q')
+except ValueError:
+    # Python 2: no 64-bits typecode, use native long.
+    _OFFSET_TYPECODE = 'L'
+else:
+    _OFFSET_TYPECODE = 'Q'
+
+def _compileFunction(name, source_list, namespace):
+    """
+    For internal use only.
+    Compile given source lines, which must define a function named <name>, in
+    given namespace and return that function.
+    """
+    exec(compile('\n'.join(source_list), '<xfw %s>' % (name, ), 'exec'),
+        namespace)
+    return namespace[name]
+
+# Fixed-width numeric strftime directives, and their width.
+_NUMERIC_DIRECTIVE_DICT = {
+    'Y': 4,
+    'm': 2,
+    'd': 2,
+    'H': 2,
+    'M': 2,
+    'S': 2,
+}
+
+# Number of small non-negative integers whose rendered value is precomputed.
+_INTEGER_RENDER_TABLE_SIZE = 256
+
+# Rendered small non-negative integers, by IntegerField length.
+_integer_render_table_dict = {}
+
+def _getIntegerRenderTable(length):
+    """
+    For internal use only.
+    Returns the list of rendered values of the first non-negative integers
+    fitting in given length, shared by all fields having that length.
+    """
+    try:
+        return _integer_render_table_dict[length]
+    except KeyError:
+        pass
+    if length:
+        count = min(_INTEGER_RENDER_TABLE_SIZE, 10 ** length)
+    else:
+        count = 0
+    result = _integer_render_table_dict[length] = [
+        b'%0*i' % (length, x) for x in xrange(count)
+    ]
+    return result
+
+# Parsed format and generated strptime, by DateTimeField format.
+_strptime_dict = {}
+
+def _parseNumericFormat(fmt):
+    """
+    For internal use only.
+    If given strftime format only contains fixed-width numeric directives
+    (see _NUMERIC_DIRECTIVE_DICT), each at most once, and literal chars, return
+    2 lists:
+    - (directive, offset, length) 3-tuples
+    - (offset, literal char) 2-tuples
+    Otherwise, return None.
+    """
+    directive_list = []
+    literal_list = []
+    offset = 0
+    index = 0
+    while index < len(fmt):
+        char = fmt[index]
+        index += 1
+        if char == '%':
+            char = fmt[index:index + 1]
+            index += 1
+            if char in _NUMERIC_DIRECTIVE_DICT:
+                if char in [x[0] for x in directive_list]:
+                    return None
+                length = _NUMERIC_DIRECTIVE_DICT[char]
+                directive_list.append((char, offset, length))
+                offset += length
+                continue
+            elif char != '%':
+                return None
+        if ord(char) > 127:
+            # Would not be a single byte once encoded.
+            return None
+        literal_list.append((offset, char))
+        offset += 1
+    return directive_list, literal_list
+
+def _getColumnBytes(column):
+    """
+    For internal use only.
+    Returns given numpy array of strings as a 2-dimensions array of bytes.
+    """
+    return numpy.ascontiguousarray(column).view(numpy.uint8).reshape(
+        len(column), column.dtype.itemsize)
+
+def _getRawValueList(column):
+    """
+    For internal use only.
+    Returns the values of given numpy array of strings as a list of strings,
+    including the trailing null bytes numpy strips from its values.
+    """
+    return [x.tobytes() for x in _getColumnBytes(column)]
+
+def _getNumberColumn(byte_column):
+    """
+    For internal use only.
+    Returns the integer value of each row of given 2-dimensions array of
+    ASCII digits, and wether each row is only composed of digits.
+    """
+    digit_column = byte_column - numpy.uint8(ord('0'))
+    length = byte_column.shape[1]
+    return (
+        numpy.dot(digit_column.astype(numpy.int64),
+            10 ** numpy.arange(length - 1, -1, -1, dtype=numpy.int64)),
+        (digit_column < 10).all(axis=1),
+    )
+
+def _getUnscaledValue(data, scale, digit_count, truncate):
+    """
+    For internal use only.
+    Returns given number (integer or Decimal) multiplied by 10 ** scale, as
+    an integer of at most digit_count digits. When truncate is true, extra
+    decimal places are dropped and so are high-order digits (as COBOL does),
+    otherwise ValueError is raised.
+    """
+    if isinstance(data, Decimal):
+        scaled = data.scaleb(scale)
+        result = int(scaled)
+        if result != scaled and not truncate:
+            raise ValueError('Too many decimal places for scale %i: %r' % (
+                scale, data))
+    elif isinstance(data, _integer_type_tuple):
+        result = data * 10 ** scale
+    else:
+        raise TypeError('Expected integer or Decimal, got %s' % (
+            type(data), ))
+    limit = 10 ** digit_count
+    if not -limit < result < limit:
+        if not truncate:
+            raise ValueError('Data too long to fit %i digits: %r' % (
+                digit_count, data))
+        if result < 0:
+            result = -(-result % limit)
+        else:
+            result %= limit
+    return result
+
+def _getRenderedValue(data, length):
+    """
+    For internal use only.
+    Returns given already rendered value (ex: parsed without casting) after
+    checking its length, for fields which cannot render strings otherwise.
+    """
+    if len(data) != length:
+        raise ValueError('Invalid length %r, expected %r' % (len(data),
+            length))
+    if isinstance(data, _text_type):
+        data = data.encode('ascii')
+    return data
+
+def _getDecimalValue(value, scale):
+    """
+    For internal use only.
+    Returns given integer divided by 10 ** scale: unchanged if scale is 0, as
+    a Decimal otherwise.
+    """
+    if scale:
+        return Decimal(value).scaleb(-scale)
+    return value
+
+def _getDecimalColumn(column, scale):
+    """
+    For internal use only.
+    Returns given numpy array of integers divided by 10 ** scale (see
+    _getDecimalValue).
+    """
+    if not scale:
+        return column
+    result = numpy.empty(len(column), dtype=object)
+    result[:] = [Decimal(x).scaleb(-scale) for x in column.tolist()]
+    return result
+
+# Last char of signed overpunch numbers, by digit, for positive and negative
+# numbers.
+_OVERPUNCH_POSITIVE = b'{ABCDEFGHI'
+_OVERPUNCH_NEGATIVE = b'}JKLMNOPQR'
+# Digit and sign of last char of signed overpunch numbers. Plain digits are
+# positive.
+_OVERPUNCH_DICT = {}
+for _digit in xrange(10):
+    _OVERPUNCH_DICT[_OVERPUNCH_POSITIVE[_digit:_digit + 1]] = (_digit, 1)
+    _OVERPUNCH_DICT[_OVERPUNCH_NEGATIVE[_digit:_digit + 1]] = (_digit, -1)
+    _OVERPUNCH_DICT[b'0123456789'[_digit:_digit + 1]] = (_digit, 1)
+del _digit
+
+# Record classes, by field names.
+_record_class_dict = {}
+
+def _getRecordClass(field_name_tuple):
+    """
+    For internal use only.
+    Returns a namedtuple subclass with given field names, shared by all field
+    lists having the same field names.
+    """
+    try:
+        return _record_class_dict[field_name_tuple]
+    except KeyError:
+        pass
+    result = _record_class_dict[field_name_tuple] = type('Record', (
+        namedtuple('Record', field_name_tuple), ), {
+        '__slots__': (),
+        # Dynamic classes are not reachable by name, so pickle by field names.
+        '__reduce__': lambda self: (_makeRecord, (self._fields, tuple(self))),
+    })
+    return result
+
+def _makeRecord(field_name_tuple, value_tuple):
+    """
+    For internal use only.
+    """
+    return _getRecordClass(field_name_tuple)._make(value_tuple)
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+class Profiler(object):
+    """
+    Collects statistics on instances it is given to (see setProfiler methods
+    of FieldList, FieldListFile and ChecksumedFile).
+
+    Statistics are accumulated by (kind, name, action) key, where:
+    - kind is PROFILE_FIELD (name being the field class name), or
+      PROFILE_STRUCTURE (name being the one given to setProfiler, action being
+      'parse' or 'generate'), or PROFILE_HASH (action being 'update')
+    - values are dicts with the following keys:
+      - count: number of calls (parsed/generated fields or records, hash
+        updates)
+      - failed: number of calls which raised (ex: cast failures)
+      - bytes: number of parsed/generated/hashed bytes (structures only
+        count bytes when their stream implements tell())
+      - seconds: time spent in these calls, including nested ones
+
+    Instrumentation only happens on instances given a profiler: others run
+    unchanged code.
+    """
+    def __init__(self, callback=None):
+        """
+        callback (callable)
+            Called on every instrumented call, with kind, name, action, byte
+            count, duration (in seconds) and wether the call raised, to feed
+            metrics to another system.
+        """
+        self._callback = callback
+        self.reset()
+
+    def reset(self):
+        self._stat_dict = {}
+
+    def getStats(self):
+        """
+        Returns a copy of accumulated statistics.
+        """
+        return dict((x, dict(y)) for x, y in self._stat_dict.items())
+
+    def add(self, kind, name, action, byte_count, duration, failed):
+        """
+        Account for one call. Can be overloaded in subclasses to customise
+        accumulation.
+        """
+        key = (kind, name, action)
+        try:
+            stat = self._stat_dict[key]
+        except KeyError:
+            stat = self._stat_dict[key] = {
+                'count': 0,
+                'failed': 0,
+                'bytes': 0,
+                'seconds': 0,
+            }
+        stat['count'] += 1
+        stat['failed'] += failed
+        stat['bytes'] += byte_count or 0
+        stat['seconds'] += duration
+        if self._callback is not None:
+            self._callback(kind, name, action, byte_count, duration, failed)
+
+    def wrap(self, kind, name, action, function, byte_count=None):
+        """
+        Returns a callable calling given function and accounting for each
+        call. If byte_count is None, the length of first argument is used.
+        """
+        add = self.add
+        def wrapper(*args, **kw):
+            start = _timer()
+            failed = True
+            try:
+                result = function(*args, **kw)
+                failed = False
+            finally:
+                add(kind, name, action,
+                    len(args[0]) if byte_count is None else byte_count,
+                    _timer() - start, failed)
+            return result
+        return wrapper
+
+    def wrapStream(self, kind, name, action, function):
+        """
+        Same as wrap, for functions receiving a stream as first argument:
+        byte count is given by the position of stream after the call, relative
+        to its position before the call.
+        """
+        add = self.add
+        def wrapper(stream, *args, **kw):
+            try:
+                position = stream.tell()
+            except (AttributeError, IOError, OSError, ValueError):
+                position = None
+            start = _timer()
+            failed = True
+            try:
+                result = function(stream, *args, **kw)
+                failed = False
+            finally:
+                duration = _timer() - start
+                if position is None:
+                    byte_count = None
+                else:
+                    try:
+                        byte_count = stream.tell() - position
+                    except (IOError, OSError, ValueError):
+                        byte_count = None
+                add(kind, name, action, byte_count, duration, failed)
+            return result
+        return wrapper
+
 class BaseField(object):
     """
     Virtual class.
@@ -46,7 +494,7 @@ class BaseField(object):
     """
     # Char to ignore when probing data presence.
     # Overload in subclass to customise.
-    _blank_char = ' '
+    _blank_char = b' '
 
     def __init__(self, length, truncate=False, cast=False):
         """
@@ -80,9 +528,87 @@ class BaseField(object):
     def _cast(self, data):
         raise NotImplementedError
 
+    def parseColumn(self, column):
+        """
+        Parse a numpy array of raw values (of dtype S<length>) into a numpy
+        array of parsed values, where None is represented as None in object
+        arrays and as NaT in datetime64 arrays.
+
+        This implementation parses values one by one into an object array.
+        Overload in subclass to use vectorised operations.
+        """
+        result = numpy.empty(len(column), dtype=object)
+        result[:] = [self.parse(x) for x in _getRawValueList(column)]
+        return result
+
+    def _parseValueList(self, result, column, index_list):
+        """
+        For internal use only.
+        Parse values of column found at given indexes one by one into result,
+        so they get the same value or error as when parsing records. Values
+        are converted with their trailing null bytes, see _getRawValueList.
+        """
+        parse = self.parse
+        for index, data in zip(index_list.tolist(),
+                _getRawValueList(column[index_list])):
+            result[index] = parse(data)
+
+    def _parseNullPaddedList(self, result, column):
+        """
+        For internal use only.
+        Returns result, where values of column ending with a null byte, which
+        numpy strips, are parsed one by one (see _parseValueList). Result is
+        then converted to an object array, as numpy strings cannot end with
+        null bytes.
+        """
+        index_list = numpy.flatnonzero(_getColumnBytes(column)[:, -1] == 0)
+        if len(index_list):
+            result = result.astype(object)
+            self._parseValueList(result, column, index_list)
+        return result
+
     def probe(self, data):
         return bool(data.strip(self._blank_char))
 
+    def validateValue(self, data, mandatory=False):
+        """
+        Returns the reason why parsing given raw value would fail (as a
+        string), or None if it would not.
+        """
+        try:
+            value = self.parse(data)
+        except Exception:
+            return str(sys.exc_info()[1])
+        if value is None and mandatory:
+            return 'Mandatory field empty'
+        return None
+
+    def validateColumn(self, column, mandatory=False):
+        """
+        Validate a numpy array of raw values (of dtype S<length>).
+        Returns a list of (index, reason) 2-tuples, see validateValue.
+
+        This implementation validates values one by one.
+        Overload in subclass to use vectorised operations.
+        """
+        return self._validateValueList(_getRawValueList(column), mandatory)
+
+    def _validateValueList(self, value_list, mandatory, index_list=None):
+        """
+        For internal use only.
+        Validate given values, found at given indexes (by default, their
+        position in value_list).
+        """
+        validateValue = self.validateValue
+        if index_list is None:
+            index_list = xrange(len(value_list))
+        result = []
+        for index, data in zip(index_list, value_list):
+            reason = validateValue(data, mandatory)
+            if reason is not None:
+                result.append((index, reason))
+        return result
+
 class PaddedField(BaseField):
     """
     Virtual class.
@@ -100,9 +626,9 @@ class PaddedField(BaseField):
             if self.truncate:
                 data = data[:self.length]
             else:
-                raise ValueError, 'Data too long to fit type width: ' \
+                raise ValueError('Data too long to fit type width: '
                     '%r, %r available. Data: %r' % (data_len, self.length,
-                        data)
+                        data))
         elif data_len < self.length:
             data = self._pad(data, self.length - data_len)
         return data
@@ -111,65 +637,250 @@ class PaddedField(BaseField):
         return super(PaddedField, self).parse(self._strip(data))
 
 class StringField(PaddedField):
+    def __init__(self, length, truncate=False, cast=False, encoding=None):
+        """
+        encoding (string)
+            Encoding used to decode parsed values when casting, and to encode
+            text values when rendering.
+            Defaults to ASCII on Python 3. On Python 2, values are by default
+            neither decoded nor encoded.
+        """
+        super(StringField, self).__init__(length, truncate=truncate, cast=cast)
+        if encoding is None and _PY3:
+            encoding = 'ascii'
+        self.encoding = encoding
+
     def _pad(self, data, pad_length):
-        return data + ' ' * pad_length
+        return data + b' ' * pad_length
 
     def _strip(self, data):
-        return data.rstrip(' ')
-
-    def render(self, data=''):
-        if not isinstance(data, basestring):
-            raise TypeError, 'Expected data of string type, got %s' % (
-                type(data), )
+        return data.rstrip(b' ')
+
+    def render(self, data=b''):
+        length = self.length
+        if data.__class__ is bytes and len(data) <= length and \
+                self.__class__ is StringField:
+            # Fast path for the most common case. Subclasses may pad values
+            # differently.
+            return data.ljust(length)
+        if not isinstance(data, _string_type_tuple):
+            raise TypeError('Expected data of string type, got %s' % (
+                type(data), ))
+        if isinstance(data, _text_type) and self.encoding is not None:
+            data = data.encode(self.encoding)
         return self._render(data)
 
     def _cast(self, data):
-        return data
+        if self.encoding is None:
+            return data
+        return data.decode(self.encoding)
+
+    def parseColumn(self, column):
+        result = numpy.char.rstrip(column, b' ')
+        if self.cast and self.encoding is not None:
+            result = numpy.char.decode(result, self.encoding)
+        return self._parseNullPaddedList(result, column)
+
+    def validateColumn(self, column, mandatory=False):
+        # Only decoding can fail.
+        if not self.cast or self.encoding is None:
+            return []
+        if self.encoding == 'ascii':
+            index_list = numpy.flatnonzero(
+                (_getColumnBytes(column) > 127).any(axis=1))
+            return self._validateValueList(
+                _getRawValueList(column[index_list]), mandatory,
+                index_list.tolist())
+        return super(StringField, self).validateColumn(column, mandatory)
 
 class IntegerField(PaddedField):
+    def __init__(self, length, truncate=False, cast=False):
+        super(IntegerField, self).__init__(length, truncate=truncate,
+            cast=cast)
+        self._render_table = _getIntegerRenderTable(length)
+
+    def __getstate__(self):
+        # Render table is shared, do not duplicate it.
+        state = self.__dict__.copy()
+        del state['_render_table']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._render_table = _getIntegerRenderTable(self.length)
+
     def _pad(self, data, pad_length):
-        return '0' * pad_length + data
+        return b'0' * pad_length + data
 
     def _strip(self, data):
-        return data.lstrip('0') or '0'
+        return data.lstrip(b'0') or b'0'
 
     def render(self, data=0):
-        if isinstance(data, basestring):
+        if data.__class__ is int and data >= 0 and \
+                self.__class__ is IntegerField:
+            # Fast paths for the most common cases. Negative values are left
+            # to the generic code, as they are padded after their sign.
+            # Subclasses may pad values differently.
+            render_table = self._render_table
+            if data < len(render_table):
+                return render_table[data]
+            return self._render(b'%0*i' % (self.length, data))
+        if isinstance(data, _string_type_tuple):
             # Duplicates work, but this ensures we receive a valid integer
             # representation.
             data = int(data)
-        assert isinstance(data, (int, long)) or \
+        assert isinstance(data, _integer_type_tuple) or \
             (self.truncate and isinstance(data, float)), repr(data)
-        data = str(int(data))
+        data = b'%i' % (int(data), )
         return self._render(data)
 
     def parse(self, data):
         if not self.probe(data):
-            data = '0'
+            data = b'0'
         return super(IntegerField, self).parse(data)
 
     def _cast(self, data):
         return int(data)
 
+    def parseColumn(self, column):
+        byte_column = _getColumnBytes(column)
+        blank_column = (byte_column == ord(' ')).all(axis=1)
+        if not self.cast:
+            result = numpy.char.lstrip(column, b'0')
+            result[blank_column | (result == b'')] = b'0'
+            return self._parseNullPaddedList(result, column)
+        if self.length > 18:
+            # Would not fit in int64.
+            return super(IntegerField, self).parseColumn(column)
+        result, valid_column = _getNumberColumn(byte_column)
+        result[blank_column] = 0
+        # Leave anything else (signs, inner blanks...) to the generic parser,
+        # so it gets the same result or error.
+        self._parseValueList(result, column,
+            numpy.flatnonzero(~(valid_column | blank_column)))
+        return result
+
+    def validateValue(self, data, mandatory=False):
+        # Not casting never fails, but still check values are integers.
+        if self.probe(data):
+            try:
+                int(self._strip(data))
+            except ValueError:
+                return 'Invalid integer: %r' % (data, )
+        return None
+
+    def validateColumn(self, column, mandatory=False):
+        byte_column = _getColumnBytes(column)
+        digit_column = byte_column - numpy.uint8(ord('0'))
+        index_list = numpy.flatnonzero(~(
+            (digit_column < 10).all(axis=1) |
+            (byte_column == ord(' ')).all(axis=1)
+        ))
+        return self._validateValueList(_getRawValueList(column[index_list]),
+            mandatory, index_list.tolist())
+
 class DateTimeField(BaseField):
-    def __init__(self, fmt, truncate=False, cast=False):
+    def __init__(self, fmt, truncate=False, cast=False, cache_size=0):
+        """
+        fmt (string)
+            strftime format of values.
+        cache_size (int)
+            When casting, maximum number of parsed values to keep, to save
+            parsing values repeated in a file (ex: same date on every row).
+            Disabled by default.
+        """
         assert not truncate
         # Computing our length has the advantage of validating given format
         super(DateTimeField, self).__init__(len(dummy_datetime.strftime(fmt)),
             cast=cast)
         self.fmt = fmt
-        self.null = '0' * self.length
+        self.null = b'0' * self.length
+        self._cache_size = cache_size
+        self._cache = {}
+        self._setStrptime()
+
+    def __getstate__(self):
+        # Generated functions cannot be pickled.
+        state = self.__dict__.copy()
+        del state['_strptime']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setStrptime()
+
+    def _setStrptime(self):
+        """
+        For internal use only.
+        Set parsed format and generated strptime, shared by all instances
+        having the same format.
+        """
+        fmt = self.fmt
+        try:
+            self._numeric_format, self._strptime = _strptime_dict[fmt]
+        except KeyError:
+            self._numeric_format = _parseNumericFormat(fmt)
+            self._strptime = self._compileStrptime()
+            _strptime_dict[fmt] = self._numeric_format, self._strptime
+
+    def _compileStrptime(self):
+        """
+        Generate a strptime equivalent for this field's format.
+        When format only contains fixed-width numeric directives, digits are
+        picked by position and datetime is instanciated directly, otherwise
+        (and whenever value does not look valid) datetime.strptime is used.
+        """
+        if self._numeric_format is None:
+            fmt = self.fmt
+            return lambda data: _strptime(data, fmt)
+        directive_list, literal_list = self._numeric_format
+        condition_list = ['len(data) == %i' % (self.length, )]
+        if literal_list:
+            condition_list.extend(
+                'data[%i:%i].isdigit()' % (offset, offset + length)
+                for _, offset, length in directive_list
+            )
+            condition_list.extend(
+                'data[%i:%i] == %r' % (offset, offset + 1,
+                    char.encode('ascii'))
+                for offset, char in literal_list
+            )
+        else:
+            condition_list.append('data.isdigit()')
+        value_dict = {'Y': '1900', 'm': '1', 'd': '1', 'H': '0', 'M': '0',
+            'S': '0'}
+        for directive, offset, length in directive_list:
+            value_dict[directive] = 'int(data[%i:%i])' % (offset,
+                offset + length)
+        return _compileFunction('strptime', [
+            'def strptime(data):',
+            '    if %s:' % (' and '.join(condition_list), ),
+            '        try:',
+            '            return datetime(%s)' % (', '.join(value_dict[x]
+                for x in 'YmdHMS'), ),
+            '        except ValueError:',
+            '            pass',
+            '    return _strptime(data, fmt)',
+        ], {
+            'datetime': datetime,
+            '_strptime': _strptime,
+            'fmt': self.fmt,
+        })
 
     def render(self, data=None):
         if data is None:
             result = self.null
-        elif isinstance(data, basestring):
+        elif isinstance(data, _string_type_tuple):
             if len(data) != self.length:
                 raise ValueError('Invalid length %r for format %r' % (
                     len(data), self.fmt))
             result = data
+            if _PY3 and isinstance(result, str):
+                result = result.encode('ascii')
         else:
             result = data.strftime(self.fmt)
+            if _PY3:
+                result = result.encode('ascii')
         return result
 
     def parse(self, data):
@@ -180,15 +891,398 @@ class DateTimeField(BaseField):
     def _cast(self, data):
         if data == self.null:
             return None
-        return strptime(data, self.fmt)
+        if not self._cache_size:
+            return self._strptime(data)
+        cache = self._cache
+        try:
+            return cache[data]
+        except KeyError:
+            pass
+        result = self._strptime(data)
+        if len(cache) >= self._cache_size:
+            cache.clear()
+        cache[data] = result
+        return result
+
+    def parseColumn(self, column):
+        """
+        When casting, returns a datetime64[us] array.
+        """
+        if not self.cast:
+            return super(DateTimeField, self).parseColumn(column)
+        if self._numeric_format is None:
+            return numpy.array([self.parse(x)
+                for x in _getRawValueList(column)], dtype='datetime64[us]')
+        result, valid_column, null_column = self._parseNumericColumn(column)
+        # Leave anything else to the generic parser, so it gets the same result
+        # or error.
+        self._parseValueList(result, column,
+            numpy.flatnonzero(~(valid_column | null_column)))
+        return result
+
+    def _parseNumericColumn(self, column):
+        """
+        For internal use only.
+        Vectorised parsing of values in a format only containing fixed-width
+        numeric directives.
+        Returns parsed values (NaT for null values, undefined for invalid
+        values), whether each value is valid and whether each value is null.
+        """
+        directive_list, literal_list = self._numeric_format
+        byte_column = _getColumnBytes(column)
+        null_column = (byte_column == ord(' ')).all(axis=1) | \
+            (byte_column == ord('0')).all(axis=1)
+        valid_column = ~null_column
+        for offset, char in literal_list:
+            valid_column &= byte_column[:, offset] == ord(char)
+        value_dict = {'Y': 1900, 'm': 1, 'd': 1, 'H': 0, 'M': 0, 'S': 0}
+        for directive, offset, length in directive_list:
+            value_dict[directive], digit_column = _getNumberColumn(
+                byte_column[:, offset:offset + length])
+            valid_column &= digit_column
+        month = (value_dict['Y'] - 1970) * 12 + value_dict['m'] - 1
+        month = numpy.asarray(month).astype('datetime64[M]')
+        day = month.astype('datetime64[D]') + (numpy.asarray(value_dict['d']) -
+            1).astype('timedelta64[D]')
+        valid_column &= (
+            (value_dict['Y'] >= 1) &
+            (value_dict['m'] >= 1) & (value_dict['m'] <= 12) &
+            (value_dict['d'] >= 1) & (day.astype('datetime64[M]') == month) &
+            (value_dict['H'] < 24) & (value_dict['M'] < 60) &
+            (value_dict['S'] < 60)
+        )
+        result = numpy.empty(len(column), dtype='datetime64[us]')
+        result[:] = day + (numpy.asarray(
+            value_dict['H'] * 3600 + value_dict['M'] * 60 + value_dict['S']
+        ).astype('timedelta64[s]'))
+        result[null_column] = numpy.datetime64('NaT')
+        return result, valid_column, null_column
+
+    def validateColumn(self, column, mandatory=False):
+        if not self.cast:
+            # Only blank values can fail, when mandatory.
+            if not mandatory:
+                return []
+            index_list = numpy.flatnonzero(
+                (_getColumnBytes(column) == ord(' ')).all(axis=1))
+            return self._validateValueList(
+                _getRawValueList(column[index_list]), mandatory,
+                index_list.tolist())
+        if self._numeric_format is None:
+            return super(DateTimeField, self).validateColumn(column,
+                mandatory)
+        _, valid_column, null_column = self._parseNumericColumn(column)
+        if mandatory:
+            check_column = ~valid_column
+        else:
+            check_column = ~(valid_column | null_column)
+        index_list = numpy.flatnonzero(check_column)
+        return self._validateValueList(_getRawValueList(column[index_list]),
+            mandatory, index_list.tolist())
+
+class BinaryField(BaseField):
+    """
+    Virtual class.
+
+    A field holding binary data, in which any byte value may appear.
+    """
+    _blank_char = b'\x00'
+
+class BinaryIntegerField(BinaryField):
+    """
+    Binary integer (ex: COBOL BINARY/COMP, C integer types).
+    """
+    def __init__(self, length, signed=False, byteorder='big',
+            truncate=False, cast=False):
+        """
+        signed (bool)
+            Wether values are two's complement signed integers.
+        byteorder ('big' or 'little')
+            Byte order of values.
+        """
+        if byteorder not in ('big', 'little'):
+            raise ValueError('Invalid byte order: %r' % (byteorder, ))
+        super(BinaryIntegerField, self).__init__(length, truncate=truncate,
+            cast=cast)
+        self.signed = signed
+        self.byteorder = byteorder
+        bit_count = length * 8
+        if signed:
+            self._min = -(1 << bit_count - 1)
+            self._max = (1 << bit_count - 1) - 1
+        else:
+            self._min = 0
+            self._max = (1 << bit_count) - 1
+
+    def render(self, data=0):
+        if isinstance(data, _string_type_tuple):
+            return _getRenderedValue(data, self.length)
+        if not isinstance(data, _integer_type_tuple):
+            raise TypeError('Expected data of integer type, got %s' % (
+                type(data), ))
+        if not self._min <= data <= self._max:
+            if not self.truncate:
+                raise ValueError('Data too long to fit %i bytes: %r' % (
+                    self.length, data))
+            # High-order bytes are dropped below.
+        # Two's complement representation of negative values.
+        return _intToBytes(data & (1 << self.length * 8) - 1, self.length,
+            self.byteorder)
+
+    def _cast(self, data):
+        return _intFromBytes(data, self.byteorder, signed=self.signed)
+
+    def parseColumn(self, column):
+        """
+        When casting values of at most 8 bytes, returns an int64 array (uint64
+        for unsigned 8 bytes values).
+        """
+        length = self.length
+        if not self.cast or length > 8:
+            return super(BinaryIntegerField, self).parseColumn(column)
+        byte_column = _getColumnBytes(column)
+        if self.byteorder == 'little':
+            byte_column = byte_column[:, ::-1]
+        # Extend values to 8 bytes, to view them as 64 bits integers.
+        padded_column = numpy.zeros((len(column), 8), dtype=numpy.uint8)
+        padded_column[:, 8 - length:] = byte_column
+        if self.signed:
+            padded_column[byte_column[:, 0] >= 0x80, :8 - length] = 0xff
+            dtype = numpy.int64
+        elif length == 8:
+            dtype = numpy.uint64
+        else:
+            dtype = numpy.int64
+        return padded_column.view(numpy.dtype(dtype).newbyteorder('>'))[
+            :, 0].astype(dtype)
+
+    def validateColumn(self, column, mandatory=False):
+        # Any value is valid.
+        return []
+
+class PackedDecimalField(BinaryField):
+    """
+    Packed decimal (ex: COBOL COMP-3): 2 digits per byte, the last half-byte
+    holding the sign (C, A, E or F for positive, D or B for negative).
+    """
+    def __init__(self, length, scale=0, signed=True, truncate=False,
+            cast=False):
+        """
+        scale (int)
+            Number of implied decimal places. When casting, values are
+            integers if scale is 0, Decimal instances otherwise.
+        signed (bool)
+            Wether values are rendered with a sign (C or D), or unsigned (F).
+        """
+        super(PackedDecimalField, self).__init__(length, truncate=truncate,
+            cast=cast)
+        self.scale = scale
+        self.signed = signed
+        self._digit_count = length * 2 - 1
+
+    def render(self, data=0):
+        if isinstance(data, _string_type_tuple):
+            return _getRenderedValue(data, self.length)
+        value = _getUnscaledValue(data, self.scale, self._digit_count,
+            self.truncate)
+        if value < 0:
+            if not self.signed:
+                raise ValueError('Negative value for unsigned field: %r' % (
+                    data, ))
+            sign = b'd'
+        elif self.signed:
+            sign = b'c'
+        else:
+            sign = b'f'
+        return unhexlify(b'%0*i%s' % (self._digit_count, abs(value), sign))
+
+    def _cast(self, data):
+        hex_data = hexlify(data)
+        digits = hex_data[:-1]
+        sign = hex_data[-1:]
+        if not digits.isdigit() or sign not in b'abcdef':
+            raise ValueError('Invalid packed decimal: %r' % (data, ))
+        value = int(digits)
+        if sign in b'bd':
+            value = -value
+        return _getDecimalValue(value, self.scale)
+
+    def parseColumn(self, column):
+        """
+        When casting with a scale of 0, returns an int64 array.
+        """
+        if not self.cast or self._digit_count > 18:
+            return super(PackedDecimalField, self).parseColumn(column)
+        result, valid_column = self._parsePackedColumn(column)
+        result = _getDecimalColumn(result, self.scale)
+        # Leave anything else to the generic parser, so it gets the same result
+        # or error.
+        self._parseValueList(result, column, numpy.flatnonzero(~valid_column))
+        return result
+
+    def _parsePackedColumn(self, column):
+        """
+        For internal use only.
+        Vectorised parsing of values, ignoring scale.
+        Returns parsed values (undefined for invalid values) and whether each
+        value is valid.
+        """
+        byte_column = _getColumnBytes(column)
+        nibble_column = numpy.empty((len(column), self.length * 2),
+            dtype=numpy.uint8)
+        nibble_column[:, 0::2] = byte_column >> 4
+        nibble_column[:, 1::2] = byte_column & 0xf
+        digit_column = nibble_column[:, :-1]
+        sign_column = nibble_column[:, -1]
+        result = numpy.dot(digit_column.astype(numpy.int64),
+            10 ** numpy.arange(self._digit_count - 1, -1, -1,
+            dtype=numpy.int64))
+        numpy.negative(result, out=result,
+            where=(sign_column == 0xb) | (sign_column == 0xd))
+        return result, (digit_column < 10).all(axis=1) & (sign_column > 9)
+
+    def validateValue(self, data, mandatory=False):
+        # Not casting never fails, but still check values are valid.
+        try:
+            self._cast(data)
+        except ValueError:
+            return str(sys.exc_info()[1])
+        return None
+
+    def validateColumn(self, column, mandatory=False):
+        if self._digit_count > 18:
+            return super(PackedDecimalField, self).validateColumn(column,
+                mandatory)
+        _, valid_column = self._parsePackedColumn(column)
+        index_list = numpy.flatnonzero(~valid_column)
+        return self._validateValueList(_getRawValueList(column[index_list]),
+            mandatory, index_list.tolist())
+
+class OverpunchField(BaseField):
+    """
+    Signed overpunch number (ex: COBOL zoned decimal with SIGN TRAILING):
+    digits, the last one being combined with the sign ('{' and 'A' to 'I' for
+    0 to 9 when positive, '}' and 'J' to 'R' when negative). A plain last
+    digit is parsed as positive. Blank values are parsed as 0.
+    """
+    def __init__(self, length, scale=0, truncate=False, cast=False):
+        """
+        scale (int)
+            Number of implied decimal places. When casting, values are
+            integers if scale is 0, Decimal instances otherwise.
+        """
+        super(OverpunchField, self).__init__(length, truncate=truncate,
+            cast=cast)
+        self.scale = scale
+
+    def render(self, data=0):
+        if isinstance(data, _string_type_tuple):
+            return _getRenderedValue(data, self.length)
+        value = _getUnscaledValue(data, self.scale, self.length,
+            self.truncate)
+        rendered = b'%0*i' % (self.length, abs(value))
+        last = int(rendered[-1:])
+        if value < 0:
+            last_char_list = _OVERPUNCH_NEGATIVE
+        else:
+            last_char_list = _OVERPUNCH_POSITIVE
+        return rendered[:-1] + last_char_list[last:last + 1]
+
+    def parse(self, data):
+        if not self.probe(data):
+            data = b'0'
+        return super(OverpunchField, self).parse(data)
+
+    def _cast(self, data):
+        prefix = data[:-1]
+        try:
+            digit, sign = _OVERPUNCH_DICT[data[-1:]]
+        except KeyError:
+            prefix = None
+        if prefix is None or (prefix and not prefix.isdigit()):
+            raise ValueError('Invalid overpunch number: %r' % (data, ))
+        return _getDecimalValue(sign * (int(prefix or b'0') * 10 + digit),
+            self.scale)
+
+    def parseColumn(self, column):
+        """
+        When casting with a scale of 0, returns an int64 array.
+        """
+        if not self.cast or self.length > 18:
+            return super(OverpunchField, self).parseColumn(column)
+        result, valid_column = self._parseOverpunchColumn(column)
+        result = _getDecimalColumn(result, self.scale)
+        # Leave anything else to the generic parser, so it gets the same result
+        # or error.
+        self._parseValueList(result, column, numpy.flatnonzero(~valid_column))
+        return result
+
+    def _parseOverpunchColumn(self, column):
+        """
+        For internal use only.
+        Vectorised parsing of values, ignoring scale.
+        Returns parsed values (undefined for invalid values) and whether each
+        value is valid.
+        """
+        byte_column = _getColumnBytes(column)
+        blank_column = (byte_column == ord(' ')).all(axis=1)
+        result, valid_column = _getNumberColumn(byte_column[:, :-1])
+        # Invalid last chars have digit 10.
+        digit_table = numpy.full(256, 10, dtype=numpy.int64)
+        sign_table = numpy.ones(256, dtype=numpy.int64)
+        for char, (digit, sign) in _OVERPUNCH_DICT.items():
+            digit_table[ord(char)] = digit
+            sign_table[ord(char)] = sign
+        last_column = byte_column[:, -1]
+        digit_column = digit_table[last_column]
+        result = (result * 10 + digit_column) * sign_table[last_column]
+        result[blank_column] = 0
+        return result, (valid_column & (digit_column < 10)) | blank_column
+
+    def validateValue(self, data, mandatory=False):
+        # Not casting never fails, but still check values are valid.
+        if self.probe(data):
+            try:
+                self._cast(data)
+            except ValueError:
+                return str(sys.exc_info()[1])
+        return None
+
+    def validateColumn(self, column, mandatory=False):
+        if self.length > 18:
+            return super(OverpunchField, self).validateColumn(column,
+                mandatory)
+        _, valid_column = self._parseOverpunchColumn(column)
+        index_list = numpy.flatnonzero(~valid_column)
+        return self._validateValueList(_getRawValueList(column[index_list]),
+            mandatory, index_list.tolist())
+
+# Field instances, by class and constructor arguments.
+_field_type_dict = {}
+
+def getFieldType(field_class, *args, **kw):
+    """
+    Returns an instance of given field class, created with given arguments.
+    The same instance is returned to all callers giving the same class and
+    arguments, along with its precomputed state, so schemas declaring many
+    identical fields only create each of them once.
+    Returned instances must not be modified.
+    """
+    key = (field_class, args, tuple(sorted(kw.items())))
+    try:
+        return _field_type_dict[key]
+    except KeyError:
+        pass
+    result = _field_type_dict[key] = field_class(*args, **kw)
+    return result
 
 class FieldList(object):
     """
     A field list is a linear, ordered sequence of fields.
     Those fields must be identified uniquely with a name, and can be optional.
     """
-    def __init__(self, field_list, total_length, separator='', padding_id=None,
-            fixed_value_dict=()):
+    def __init__(self, field_list, total_length, separator=b'',
+            padding_id=None, fixed_value_dict=(), record_class=False):
         """
         Defines a sequence of fields.
 
@@ -200,6 +1294,10 @@ class FieldList(object):
         FieldList class, in which case its content (padding inclued !) and
         fixed values will be reused in place of that element. Its separator
         value is ignored.
+
+        If record_class is True, parsing returns instances of a namedtuple
+        class (available as "record_class" attribute) instead of dicts, which
+        use much less memory. Field names must then be valid identifiers.
         """
         self.separator = separator
         self.total_length = total_length
@@ -211,7 +1309,7 @@ class FieldList(object):
         for field in field_list:
             if isinstance(field, FieldList):
                 extend(field._getFieldList())
-                for key, value in field._getFixedValueDict().iteritems():
+                for key, value in field._getFixedValueDict().items():
                     setdefault(key, value)
             else:
                 append(field)
@@ -222,13 +1320,20 @@ class FieldList(object):
         for field, _, field_id in expanded_field_list:
             if field_id is not None:
                 if field_id in field_id_set:
-                    raise ValueError, 'Field %r already present.' % (
-                        field_id, )
+                    raise ValueError('Field %r already present.' % (
+                        field_id, ))
                 field_id_set.add(field_id)
+                value = fixed_value_dict.get(field_id)
+                if isinstance(value, _text_type) and \
+                        isinstance(field, StringField) and not field.cast \
+                        and field.encoding is not None:
+                    # Such field parses into bytes, which would never be
+                    # equal to the fixed value.
+                    fixed_value_dict[field_id] = value.encode(field.encoding)
             offset += field.getLength()
         if offset > total_length:
-            raise ValueError, 'Maximum length exceeded: %r, limit is %r' % \
-                (offset, total_length)
+            raise ValueError('Maximum length exceeded: %r, limit is %r' % (
+                offset, total_length))
         else:
             to_pad = total_length - offset
             if padding_id is not None:
@@ -236,6 +1341,66 @@ class FieldList(object):
                     (getFieldType(StringField, to_pad), False, padding_id))
                 to_pad = 0
             self.padding_length = to_pad
+        if record_class:
+            field_name_list = [x for _, _, x in self.field_list
+                if x is not None]
+            field_name_list.extend(x for x in fixed_value_dict
+                if x not in field_id_set)
+            self.record_class = _getRecordClass(tuple(field_name_list))
+        else:
+            self.record_class = None
+        self._layout = None
+        self._parser = None
+        self._generator = None
+        self._profiler = None
+        self._profiler_name = None
+
+    def __getstate__(self):
+        # Generated functions cannot be pickled, they will be generated again
+        # on first use. Profiler is not shared with other processes.
+        state = self.__dict__.copy()
+        state['_parser'] = state['_generator'] = state['_profiler'] = None
+        # Record classes are not reachable by name, keep their field names.
+        if self.record_class is not None:
+            state['record_class'] = self.record_class._fields
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.record_class is not None:
+            self.record_class = _getRecordClass(self.record_class)
+
+    def setProfiler(self, profiler, name=None):
+        """
+        Account for parsed and generated records and fields in given Profiler
+        instance (None to stop).
+        name
+            Name of this field list in statistics. Defaults to field names.
+        """
+        if name is None:
+            name = ','.join(str(x) for _, _, x in self.field_list
+                if x is not None)
+        self._profiler = profiler
+        self._profiler_name = name
+        self._parser = self._generator = None
+
+    def _instrumentField(self, field, action, function):
+        """
+        For internal use only.
+        """
+        if self._profiler is None:
+            return function
+        return self._profiler.wrap(PROFILE_FIELD, field.__class__.__name__,
+            action, function, field.getLength())
+
+    def _instrumentRecord(self, action, function):
+        """
+        For internal use only.
+        """
+        if self._profiler is None:
+            return function
+        return self._profiler.wrap(PROFILE_STRUCTURE, self._profiler_name,
+            action, function, self.total_length)
 
     def _getFixedValueDict(self):
         """
@@ -255,11 +1420,117 @@ class FieldList(object):
         mismatch is found.
         Adds missing keys to data_dict.
         """
-        for key, value in self.fixed_value_dict.iteritems():
+        for key, value in self.fixed_value_dict.items():
             actual_value = data_dict.setdefault(key, value)
             if actual_value != value:
-                raise ValueError, '%r: expected %r, got %r' % (key, value,
-                    actual_value)
+                raise ValueError('%r: expected %r, got %r' % (key, value,
+                    actual_value))
+
+    def _compileGenerator(self):
+        """
+        For internal use only.
+        Generate a generate function specialised for this field list: a
+        template of the rendered string is built once here, with fixed values,
+        anonymous fields, default values, separators and padding already
+        rendered, so only fields whose value is given get rendered for each
+        record.
+        """
+        namespace = {
+            'separator': self.separator,
+        }
+        source_list = ['def generate(data_dict):']
+        append = source_list.append
+        fixed_index_dict = {}
+        for index, (key, value) in enumerate(
+                self.fixed_value_dict.items()):
+            fixed_index_dict[key] = index
+            namespace['fixed_key_%i' % index] = key
+            namespace['fixed_value_%i' % index] = value
+            append('    value = data_dict.setdefault(fixed_key_%i, '
+                'fixed_value_%i)' % (index, index))
+            append('    if value != fixed_value_%i:' % (index, ))
+            append("        raise ValueError('%%r: expected %%r, got %%r' %% ("
+                "fixed_key_%i, fixed_value_%i, value))" % (index, index))
+        def renderConstant(render, *args):
+            try:
+                return render(*args)
+            except Exception:
+                return None
+        # Template: rendered strings, and names of variables holding rendered
+        # values.
+        template = []
+        for index, (field, mandatory, field_id) in enumerate(self.field_list):
+            if template:
+                template.append(self.separator)
+            default = renderConstant(field.render)
+            if default is None:
+                namespace['render_%i' % index] = self._instrumentField(field,
+                    'generate', field.render)
+                default_source = 'render_%i()' % (index, )
+            else:
+                namespace['default_%i' % index] = default
+                default_source = 'default_%i' % (index, )
+            if field_id is None:
+                if default is None:
+                    append('    rendered_%i = render_%i()' % (index, index))
+                    template.append(None)
+                else:
+                    template.append(default)
+                continue
+            namespace['field_id_%i' % index] = field_id
+            namespace['render_%i' % index] = self._instrumentField(field,
+                'generate', field.render)
+            append('    value = data_dict.get(field_id_%i)' % (index, ))
+            fixed_index = fixed_index_dict.get(field_id)
+            if fixed_index is not None:
+                fixed_rendered = renderConstant(field.render,
+                    self.fixed_value_dict[field_id])
+                if fixed_rendered is not None:
+                    # Value is very likely the one set by setdefault above.
+                    namespace['fixed_rendered_%i' % index] = fixed_rendered
+                    append('    if value is fixed_value_%i:' % (fixed_index, ))
+                    append('        rendered_%i = fixed_rendered_%i' % (index,
+                        index))
+                    append('    elif value is None:')
+                else:
+                    append('    if value is None:')
+            else:
+                append('    if value is None:')
+            if mandatory:
+                append("        raise ValueError('Field %%r is mandatory' %% ("
+                    "field_id_%i, ))" % (index, ))
+            else:
+                append('        rendered_%i = %s' % (index, default_source))
+            append('    else:')
+            append('        rendered_%i = render_%i(value)' % (index, index))
+            template.append(None)
+        if self.padding_length:
+            if template:
+                template.append(self.separator)
+            template.append(b' ' * self.padding_length)
+        # Merge consecutive constant strings.
+        part_list = []
+        for index, part in enumerate(template):
+            if part is None:
+                part_list.append('rendered_%i' % ((index + 1) // 2, ))
+            elif part_list and part_list[-1][0] == '(':
+                namespace[part_list[-1][1:-1]] += part
+            else:
+                name = 'constant_%i' % (index, )
+                namespace[name] = part
+                part_list.append('(%s)' % (name, ))
+        if part_list:
+            append("    rendered = b''.join((%s, ))" % (
+                ', '.join(part_list), ))
+        else:
+            append("    rendered = separator[:0]")
+        append('    if len(rendered) != %i:' % (self.total_length, ))
+        append("        raise ValueError('Internal consistency error: rendered "
+            "string length %%r, expected %%r' %% (len(rendered), %i))" % (
+            self.total_length, ))
+        append('    return rendered')
+        return self._instrumentRecord('generate',
+            _compileFunction('generate', source_list, namespace))
 
     def generate(self, data_dict):
         """
@@ -271,27 +1542,138 @@ class FieldList(object):
 
         If a field is declared mandatory in field list description but is
         missing in this dict, an exception will be raised.
+
+        data_dict may also be a record (see record_class).
         """
-        self._checkValues(data_dict)
-        result = []
-        append = result.append
-        for field, mandatory, field_id in self.field_list:
-            if field_id is None:
-                data = field.render()
-            elif data_dict.get(field_id) is not None:
-                data = field.render(data_dict[field_id])
-            else:
-                if mandatory:
-                    raise ValueError, 'Field %r is mandatory' % (field_id, )
-                data = field.render()
-            append(data)
-        if self.padding_length:
-            append(' ' * self.padding_length)
-        rendered = self.separator.join(result)
-        if len(rendered) != self.total_length:
-            raise ValueError, 'Internal consistency error: rendered string ' \
-                'length %r, expected %r' % (len(rendered), self.total_length)
-        return rendered
+        if isinstance(data_dict, tuple):
+            data_dict = data_dict._asdict()
+        generator = self._generator
+        if generator is None:
+            generator = self._generator = self._compileGenerator()
+        return generator(data_dict)
+
+    def _getLayout(self):
+        """
+        For internal use only.
+        Returns a list of 5-tuples, one per field, composed of:
+        - the field
+        - wether it is required or not
+        - its name
+        - its offset in a rendered string
+        - wether a separator is expected right after it
+        """
+        layout = self._layout
+        if layout is None:
+            self._layout = layout = []
+            append = layout.append
+            offset = 0
+            separator_len = len(self.separator)
+            for field, mandatory, field_id in self.field_list:
+                field_length = field.getLength()
+                append((field, mandatory, field_id, offset,
+                    bool(separator_len) and \
+                    offset + field_length < self.total_length))
+                offset += field_length
+                if layout[-1][4]:
+                    offset += separator_len
+        return layout
+
+    def _compileParser(self):
+        """
+        For internal use only.
+        Generate a parse function specialised for this field list: field
+        offsets, separator positions and field lookups are resolved once here
+        instead of for every parsed record.
+        """
+        total_length = self.total_length
+        separator_len = len(self.separator)
+        namespace = {
+            'rendered_type_tuple': _rendered_type_tuple,
+            'separator': self.separator,
+            'checkValues': self._checkValues,
+        }
+        if _PY3:
+            # Slicing a memoryview does not copy, so only field data gets
+            # copied, when converted to bytes.
+            slice_format = 'bytes(rendered[%i:%i])'
+        else:
+            slice_format = 'rendered[%i:%i]'
+        source_list = [
+            'def parse(rendered):',
+            '    assert isinstance(rendered, rendered_type_tuple), '
+                'repr(rendered)',
+            '    if len(rendered) != %i:' % (total_length, ),
+            "        raise ValueError('Data length missmatch: expected %%i, got '"
+                " '%%i (%%r)' %% (%i, len(rendered), rendered))" % (
+                total_length, ),
+        ]
+        append = source_list.append
+        item_list = []
+        offset = 0
+        for index, (field, mandatory, field_id, offset, has_separator) in \
+                enumerate(self._getLayout()):
+            next_offset = offset + field.getLength()
+            if field_id is not None:
+                namespace['field_id_%i' % index] = field_id
+                item_list.append('field_id_%i: value_%i' % (index, index))
+                if type(field) is StringField and self._profiler is None:
+                    # Never empty, so never checked for presence.
+                    append("    value_%i = %s.rstrip(b' ')" % (index,
+                        slice_format % (offset, next_offset)))
+                    if field.cast and field.encoding is not None:
+                        namespace['encoding_%i' % index] = field.encoding
+                        append('    value_%i = value_%i.decode('
+                            'encoding_%i)' % (index, index, index))
+                else:
+                    namespace['parse_%i' % index] = self._instrumentField(field,
+                        'parse', field.parse)
+                    append('    field_data = %s' % (slice_format % (offset,
+                        next_offset), ))
+                    append('    value_%i = parse_%i(field_data)' % (index,
+                        index))
+                    if mandatory:
+                        append('    if value_%i is None:' % (index, ))
+                        append("        raise ValueError('Mandatory field %%r "
+                            "empty: %%r' %% (field_id_%i, field_data))" % (
+                            index, ))
+            offset = next_offset
+            if has_separator:
+                append('    if rendered[%i:%i] != separator:' % (offset,
+                    offset + separator_len))
+                append("        raise ValueError('Separator %%r expected, got "
+                    "%%r (in %%r)' %% (separator, rendered[%i:], rendered))" % (
+                    offset, ))
+                offset += separator_len
+        if offset + self.padding_length != total_length:
+            append('    assert False, %i' % (offset, ))
+        if self.record_class is None:
+            append('    data_dict = {%s}' % (', '.join(item_list), ))
+            if self.fixed_value_dict:
+                append('    checkValues(data_dict)')
+            append('    return data_dict')
+        else:
+            namespace['Record'] = self.record_class
+            value_dict = dict(
+                (field_id, 'value_%i' % (index, ))
+                for index, (_, _, field_id) in enumerate(self.field_list)
+                if field_id is not None
+            )
+            for index, (key, value) in enumerate(
+                    self.fixed_value_dict.items()):
+                namespace['fixed_key_%i' % index] = key
+                namespace['fixed_value_%i' % index] = value
+                if key in value_dict:
+                    append('    if %s != fixed_value_%i:' % (value_dict[key],
+                        index))
+                    append("        raise ValueError('%%r: expected %%r, got "
+                        "%%r' %% (fixed_key_%i, fixed_value_%i, %s))" % (index,
+                        index, value_dict[key]))
+                else:
+                    value_dict[key] = 'fixed_value_%i' % (index, )
+            append('    return Record(%s)' % (', '.join(value_dict[x]
+                for x in self.record_class._fields), ))
+        return self._instrumentRecord('parse',
+            _compileFunction('parse', source_list, namespace))
 
     def parse(self, rendered):
         """
@@ -303,63 +1685,743 @@ class FieldList(object):
         Returned value is a dict containing all fields declared in the field
         list description.
         """
-        assert isinstance(rendered, basestring), repr(rendered)
-        if len(rendered) != self.total_length:
-            raise ValueError, 'Data length missmatch: expected %i, got ' \
-                '%i (%r)' % (self.total_length, len(rendered), rendered)
-        data_dict = {}
-        offset = 0
-        separator_len = len(self.separator)
-        for field, mandatory, field_id in self.field_list:
-            field_length = field.getLength()
-            if field_id is not None:
-                field_data = rendered[offset:offset+field_length]
-                parsed_value = field.parse(field_data)
-                if parsed_value is None and mandatory:
-                    raise ValueError('Mandatory field %r empty: %r' % 
-                      (field_id, field_data))
-                data_dict[field_id] = parsed_value
-            offset += field_length
-            next_separator = rendered[offset:offset+separator_len]
-            if next_separator:
-                if next_separator != self.separator:
-                    raise ValueError, 'Separator %r expected, got %r ' \
-                        '(in %r)' % (self.separator, rendered[offset:],
-                            rendered)
-                offset += separator_len
-        assert offset + self.padding_length == self.total_length, offset
-        self._checkValues(data_dict)
-        return data_dict
-
-    def parseStream(self, stream):
-        return self.parse(stream.read(self.total_length))
+        parser = self._parser
+        if parser is None:
+            parser = self._parser = self._compileParser()
+        return parser(rendered)
 
-    def generateStream(self, stream, data_dict):
-        stream.write(self.generate(data_dict))
+    def parseColumns(self, data, separator=b''):
+        """
+        Parse a string of consecutive records, each followed by given
+        separator (optional after the last record), into a mapping of columns.
 
-class FieldListFile(object):
-    def __init__(self, head, item_callback, separator=''):
-        r"""
-        Files parsed/generated by this class follow the following structure:
-            FILE: HEAD SEPARATOR [ITEM SEPARATOR [ITEM SEPARATOR [...]]]
-        Where:
-          SEPARATOR is a fixed string.
-            HEAD is a string which can be parsed by instance given in <head>
-            parameter.
-            ITEM is a string which can be parsed by instance returned by
-            <item_callback>, and there is a known number of such items (also as
-            returned by <item_callback>).
+        Returned value is a dict containing all fields declared in the field
+        list description, each value being a numpy array of parsed values (see
+        BaseField.parseColumn), one per record.
 
-        Chunk (head or item) generator & parser:
-        Instances responsible for individual chunk parsing & generation must
-        implement the following interface:
-            parseStream(stream) -> parsed_value
-            generateStream(stream, parsed_value)
+        Mandatory fields, fixed values and separators are checked for all
+        records, and an exception is raised on the first error.
 
-        Stream:
-        streams given to this class methods must implement the following
-        methods:
-        - read(length) -> data
+        Requires numpy.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for column parsing')
+        total_length = self.total_length
+        field_separator = self.separator
+        separator_len = len(separator)
+        stride = total_length + separator_len
+        data_len = len(data)
+        if data_len % stride == 0:
+            record_count = data_len // stride
+        elif (data_len + separator_len) % stride == 0:
+            record_count = (data_len + separator_len) // stride
+        else:
+            raise ValueError('Data length %i is not a multiple of record '
+                'length %i' % (data_len, stride))
+        buf = numpy.frombuffer(data, dtype=numpy.uint8)
+        def getColumn(offset, length, count=record_count):
+            if not (length and count):
+                return numpy.zeros(count, dtype='S%i' % (max(length, 1), ))
+            return numpy.ndarray((count, ), 'S%i' % (length, ), buf, offset,
+                (stride, ))
+        def checkSeparator(offset, separator, count=record_count):
+            for index in numpy.flatnonzero(
+                    getColumn(offset, len(separator), count) != separator)[:1]:
+                raise ValueError('Separator %r expected in record %i, got %r' % (
+                    separator, index, data[index * stride + offset:
+                    index * stride + offset + len(separator)]))
+        if separator:
+            checkSeparator(total_length, separator,
+                record_count - (data_len % stride != 0))
+        column_dict = {}
+        for field, mandatory, field_id, offset, has_separator in \
+                self._getLayout():
+            field_length = field.getLength()
+            if field_id is not None:
+                raw_column = getColumn(offset, field_length)
+                column = field.parseColumn(raw_column)
+                if mandatory:
+                    kind = column.dtype.kind
+                    if kind == 'M':
+                        null_column = numpy.isnat(column)
+                    elif kind == 'O':
+                        null_column = numpy.array([x is None for x in
+                            column.tolist()], dtype=bool)
+                    else:
+                        null_column = ()
+                    for index in numpy.flatnonzero(null_column)[:1]:
+                        raise ValueError('Mandatory field %r empty in record '
+                            '%i: %r' % (field_id, index, raw_column[index]))
+                column_dict[field_id] = column
+            if has_separator:
+                checkSeparator(offset + field_length, field_separator)
+        for key, value in self.fixed_value_dict.items():
+            column = column_dict.get(key)
+            if column is None:
+                column = column_dict[key] = numpy.array([value] * record_count)
+            for index in numpy.flatnonzero(column != value)[:1]:
+                raise ValueError('%r: expected %r, got %r in record %i' % (key,
+                    value, column[index], index))
+        return column_dict
+
+    def validate(self, data, separator=b'', offset=0):
+        """
+        Check a string of consecutive records, each followed by given
+        separator (optional after the last record), in a single pass,
+        collecting all errors instead of raising on the first one: separators,
+        field values (see BaseField.validateValue), mandatory fields and fixed
+        values. Anonymous fields are not checked, as they are not parsed.
+
+        Returns a list of (offset, record index, field name, reason) 4-tuples,
+        sorted by offset. Offsets are the position in data plus <offset>.
+        Field name is None for errors which are not related to a field
+        (separators, truncated record).
+
+        Uses vectorised checks when numpy is available.
+        """
+        total_length = self.total_length
+        separator_len = len(separator)
+        stride = total_length + separator_len
+        data_len = len(data)
+        record_count = (data_len + separator_len) // stride
+        error_list = []
+        append = error_list.append
+        # Check what follows the last record.
+        if record_count:
+            tail_offset = record_count * stride - separator_len
+            tail = data[tail_offset:tail_offset + separator_len]
+            if tail and _toBytes(tail) != separator:
+                append((offset + tail_offset, record_count - 1, None,
+                    'Separator %r expected, got %r' % (separator,
+                    _toBytes(tail))))
+            tail_offset += separator_len
+        else:
+            tail_offset = 0
+        if tail_offset < data_len:
+            append((offset + tail_offset, record_count, None,
+                'Truncated record: got %i bytes, expected %i' % (
+                data_len - tail_offset, total_length)))
+        if record_count:
+            if numpy is None:
+                self._validateRecordList(data, separator, offset, record_count,
+                    append)
+            else:
+                self._validateColumnList(data, separator, offset, record_count,
+                    append)
+        error_list.sort(key=lambda x: x[0])
+        return error_list
+
+    def _iterValidationLayout(self):
+        """
+        For internal use only.
+        Yields, for each field: field, mandatory, field id, offset, fixed value
+        check (None, or a 2-tuple: fixed value and its rendered version, which
+        is None if it cannot be rendered) and field separator offset (None if
+        not followed by a separator).
+        """
+        fixed_value_dict = self.fixed_value_dict
+        for field, mandatory, field_id, offset, has_separator in \
+                self._getLayout():
+            if field_id in fixed_value_dict:
+                value = fixed_value_dict[field_id]
+                try:
+                    rendered = field.render(value)
+                except Exception:
+                    rendered = None
+                fixed = (value, rendered)
+            else:
+                fixed = None
+            if has_separator:
+                separator_offset = offset + field.getLength()
+            else:
+                separator_offset = None
+            yield field, mandatory, field_id, offset, fixed, separator_offset
+
+    def _checkFixedValue(self, field, field_id, fixed, data):
+        """
+        For internal use only.
+        Returns the reason why given raw value does not match given fixed
+        value, or None if it does (or cannot be parsed, which is reported
+        separately).
+        """
+        value, rendered = fixed
+        if data == rendered:
+            return None
+        try:
+            parsed = field.parse(data)
+        except Exception:
+            return None
+        if parsed == value:
+            return None
+        return '%r: expected %r, got %r' % (field_id, value, parsed)
+
+    def _validateRecordList(self, data, separator, offset, record_count,
+            append):
+        """
+        For internal use only.
+        Pure-Python implementation of validate.
+        """
+        total_length = self.total_length
+        stride = total_length + len(separator)
+        field_separator = self.separator
+        field_separator_len = len(field_separator)
+        layout = list(self._iterValidationLayout())
+        checkFixedValue = self._checkFixedValue
+        for index in xrange(record_count):
+            record_offset = index * stride
+            if separator and index < record_count - 1:
+                actual = _toBytes(data[record_offset + total_length:
+                    record_offset + stride])
+                if actual != separator:
+                    append((offset + record_offset + total_length, index,
+                        None, 'Separator %r expected, got %r' % (separator,
+                        actual)))
+            for field, mandatory, field_id, field_offset, fixed, \
+                    separator_offset in layout:
+                if separator_offset is not None:
+                    separator_offset += record_offset
+                    actual = _toBytes(data[separator_offset:separator_offset +
+                        field_separator_len])
+                    if actual != field_separator:
+                        append((offset + separator_offset, index, None,
+                            'Separator %r expected, got %r' % (
+                            field_separator, actual)))
+                if field_id is None:
+                    continue
+                field_offset += record_offset
+                field_data = _toBytes(data[field_offset:field_offset +
+                    field.getLength()])
+                reason = field.validateValue(field_data, mandatory)
+                if reason is None and fixed is not None:
+                    reason = checkFixedValue(field, field_id, fixed,
+                        field_data)
+                if reason is not None:
+                    append((offset + field_offset, index, field_id, reason))
+
+    def _validateColumnList(self, data, separator, offset, record_count,
+            append):
+        """
+        For internal use only.
+        Vectorised implementation of validate.
+        """
+        total_length = self.total_length
+        stride = total_length + len(separator)
+        buf = numpy.frombuffer(data, dtype=numpy.uint8)
+        def getColumn(column_offset, length, count=record_count):
+            if not (length and count):
+                return numpy.zeros(count, dtype='S%i' % (max(length, 1), ))
+            return numpy.ndarray((count, ), 'S%i' % (length, ), buf,
+                column_offset, (stride, ))
+        def checkSeparator(column_offset, separator, count=record_count):
+            column = getColumn(column_offset, len(separator), count)
+            index_list = numpy.flatnonzero(column != separator)
+            for index, value in zip(index_list.tolist(),
+                    _getRawValueList(column[index_list])):
+                append((offset + index * stride + column_offset, index, None,
+                    'Separator %r expected, got %r' % (separator, value)))
+        if separator:
+            checkSeparator(total_length, separator, record_count - 1)
+        checkFixedValue = self._checkFixedValue
+        for field, mandatory, field_id, field_offset, fixed, \
+                separator_offset in self._iterValidationLayout():
+            if separator_offset is not None:
+                checkSeparator(separator_offset, self.separator)
+            if field_id is None:
+                continue
+            column = getColumn(field_offset, field.getLength())
+            failed_set = set()
+            for index, reason in field.validateColumn(column, mandatory):
+                failed_set.add(index)
+                append((offset + index * stride + field_offset, index,
+                    field_id, reason))
+            if fixed is None:
+                continue
+            if fixed[1] is None:
+                index_list = numpy.arange(record_count)
+            else:
+                index_list = numpy.flatnonzero(column != fixed[1])
+            # Values are checked with their trailing null bytes, see
+            # _getRawValueList.
+            for index, field_data in zip(index_list.tolist(),
+                    _getRawValueList(column[index_list])):
+                if index in failed_set:
+                    continue
+                reason = checkFixedValue(field, field_id, fixed, field_data)
+                if reason is not None:
+                    append((offset + index * stride + field_offset, index,
+                        field_id, reason))
+
+    def parseStream(self, stream):
+        return self.parse(stream.read(self.total_length))
+
+    def generateStream(self, stream, data_dict):
+        stream.write(self.generate(data_dict))
+
+    def generateMany(self, stream, data_dict_iterable, separator=b'',
+            leading_separator=False, block_size=BLOCK_SIZE):
+        """
+        Generate records from an iterable of data mappings (see generate),
+        separated by given separator (also preceding first record if
+        leading_separator is true), and write them to stream in blocks of
+        about <block_size> bytes.
+        Returns the number of generated records.
+        """
+        generate = self.generate
+        chunk_list = []
+        append = chunk_list.append
+        write = stream.write
+        block_record_count = max(1, block_size // (self.total_length +
+            len(separator)))
+        record_count = 0
+        try:
+            for data_dict in data_dict_iterable:
+                if separator and (record_count or leading_separator):
+                    append(separator)
+                append(generate(data_dict))
+                record_count += 1
+                if not record_count % block_record_count:
+                    write(b''.join(chunk_list))
+                    del chunk_list[:]
+        finally:
+            if chunk_list:
+                write(b''.join(chunk_list))
+        return record_count
+
+class LazyRecord(Mapping):
+    """
+    Read-only mapping of a parsed record, parsing each field value on first
+    access. See LazyFieldList.
+    """
+    def __init__(self, parser, rendered, value_dict):
+        self._parser = parser
+        self._rendered = rendered
+        self._value_dict = value_dict
+
+    def __getitem__(self, key):
+        try:
+            return self._value_dict[key]
+        except KeyError:
+            pass
+        value = self._value_dict[key] = self._parser._parseValue(
+            self._rendered, key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._parser._getKeySet()
+
+    def __iter__(self):
+        return iter(self._parser._getKeySet())
+
+    def __len__(self):
+        return len(self._parser._getKeySet())
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__,
+            _toBytes(self._rendered))
+
+class LazyFieldList(object):
+    """
+    Parser for FieldList records, producing LazyRecord instances which only
+    parse fields when they are accessed.
+    Implements the chunk interface, so it can be used in place of a FieldList
+    in a FieldListFile.
+    """
+    def __init__(self, field_list, field_id_list=None,
+            validate=VALIDATE_ON_PARSE):
+        """
+        field_list (FieldList)
+            Record format.
+        field_id_list (list of field names)
+            Fields to make available in records. Other fields are never
+            parsed nor validated. By default, all fields are available.
+        validate
+            When mandatory fields and fixed values of available fields are
+            checked:
+            - VALIDATE_ON_PARSE: when parsing a record, as FieldList does
+            - VALIDATE_ON_ACCESS: when first accessing them
+            - None: never
+            Separators are checked when parsing, unless validate is None.
+        """
+        self._field_list = field_list
+        self._validate = validate
+        fixed_value_dict = field_list._getFixedValueDict()
+        layout = field_list._getLayout()
+        field_dict = {}
+        for field, mandatory, field_id, offset, _ in layout:
+            if field_id is not None:
+                field_dict[field_id] = (field, mandatory, offset,
+                    offset + field.getLength())
+        if field_id_list is None:
+            field_id_list = list(field_dict)
+            field_id_list.extend(x for x in fixed_value_dict
+                if x not in field_dict)
+        self._key_set = key_set = frozenset(field_id_list)
+        # Keys which are not fields: fixed values.
+        self._constant_dict = {}
+        self._field_dict = {}
+        for field_id in key_set:
+            if field_id in field_dict:
+                self._field_dict[field_id] = field_dict[field_id]
+            elif field_id in fixed_value_dict:
+                self._constant_dict[field_id] = fixed_value_dict[field_id]
+            else:
+                raise ValueError('Unknown field %r' % (field_id, ))
+        self._fixed_value_dict = dict((x, y)
+            for x, y in fixed_value_dict.items() if x in self._field_dict)
+        separator = field_list.separator
+        self._separator_slice_list = [
+            (offset + field.getLength(),
+                offset + field.getLength() + len(separator))
+            for field, _, _, offset, has_separator in layout
+            if has_separator
+        ]
+        if validate == VALIDATE_ON_PARSE:
+            self._check_key_list = [x for x, y in self._field_dict.items()
+                if y[1] or x in self._fixed_value_dict]
+        else:
+            self._check_key_list = ()
+
+    def _getKeySet(self):
+        """
+        For internal use only.
+        """
+        return self._key_set
+
+    def _parseValue(self, rendered, key):
+        """
+        For internal use only.
+        Parse value of given field from rendered record.
+        """
+        try:
+            field, mandatory, offset, end = self._field_dict[key]
+        except KeyError:
+            return self._constant_dict[key]
+        field_data = _toBytes(rendered[offset:end])
+        value = field.parse(field_data)
+        if self._validate is not None:
+            if value is None and mandatory:
+                raise ValueError('Mandatory field %r empty: %r' % (key,
+                    field_data))
+            fixed_value_dict = self._fixed_value_dict
+            if key in fixed_value_dict and value != fixed_value_dict[key]:
+                raise ValueError('%r: expected %r, got %r' % (key,
+                    fixed_value_dict[key], value))
+        return value
+
+    def parse(self, rendered):
+        total_length = self._field_list.total_length
+        if len(rendered) != total_length:
+            raise ValueError('Data length missmatch: expected %i, got '
+                '%i (%r)' % (total_length, len(rendered), rendered))
+        if self._validate is not None:
+            separator = self._field_list.separator
+            for offset, end in self._separator_slice_list:
+                if rendered[offset:end] != separator:
+                    raise ValueError('Separator %r expected, got %r (in %r)' % (
+                        separator, rendered[offset:], rendered))
+        value_dict = {}
+        parseValue = self._parseValue
+        for key in self._check_key_list:
+            value_dict[key] = parseValue(rendered, key)
+        return LazyRecord(self, rendered, value_dict)
+
+    def parseStream(self, stream):
+        return self.parse(stream.read(self._field_list.total_length))
+
+    def generateStream(self, stream, data_dict):
+        """
+        See FieldList.generateStream. LazyRecord instances are accepted, but
+        only fields available in them will be generated.
+        """
+        if isinstance(data_dict, LazyRecord):
+            data_dict = dict(data_dict)
+        self._field_list.generateStream(stream, data_dict)
+
+class FieldListDispatcher(object):
+    """
+    Parser & generator for records of several types (each described by a
+    FieldList), where record type is given by a discriminator field at a
+    fixed position, shared by all types.
+    Only discriminator field is read before picking the FieldList used to
+    parse the whole record.
+    Implements the chunk interface, so it can be used as a FieldListFile item.
+    """
+    def __init__(self, field, offset, field_list_dict, field_id=None):
+        """
+        field (BaseField)
+            Discriminator field.
+        offset (int)
+            Position of discriminator field in records.
+        field_list_dict (dict)
+            Keys: discriminator values, as accepted by field's render method.
+            Values: FieldList instances.
+        field_id
+            Name of discriminator field in records, used to pick FieldList
+            when generating. Required to generate records.
+        """
+        self._offset = offset
+        self._end = end = offset + field.getLength()
+        self._field_id = field_id
+        self._field_list_dict = dict(field_list_dict)
+        # Rendered discriminator values lookup table: FieldList parse method
+        # and length of record after discriminator.
+        self._type_dict = type_dict = {}
+        for value, field_list in field_list_dict.items():
+            if field_list.total_length < end:
+                raise ValueError('Record type %r too short for discriminator '
+                    'field' % (value, ))
+            type_dict[field.render(value)] = (field_list.parse,
+                field_list.total_length - end)
+
+    def _getType(self, discriminator):
+        try:
+            return self._type_dict[discriminator]
+        except KeyError:
+            raise ValueError('Unknown record type %r' % (discriminator, ))
+
+    def _getDiscriminator(self, prefix):
+        """
+        For internal use only.
+        Returns discriminator from given record prefix, read from a stream.
+        """
+        if len(prefix) < self._end:
+            raise ValueError('Truncated record: expected at least %i bytes, '
+                'got %i: %r' % (self._end, len(prefix), _toBytes(prefix)))
+        return _toBytes(prefix[self._offset:])
+
+    def parse(self, rendered):
+        return self._getType(_toBytes(rendered[self._offset:self._end]))[0](
+            rendered)
+
+    def parseStream(self, stream):
+        prefix = stream.read(self._end)
+        parse, remaining = self._getType(self._getDiscriminator(prefix))
+        return parse(b''.join((prefix, stream.read(remaining))))
+
+    def iterParseStream(self, stream, separator=b''):
+        """
+        Parse records of any declared type, in any order, each followed by
+        given separator (optional after the last record), until the end of
+        stream. Yields parsed records.
+        """
+        read = stream.read
+        end = self._end
+        type_dict = self._type_dict
+        getType = self._getType
+        getDiscriminator = self._getDiscriminator
+        separator_len = len(separator)
+        while True:
+            prefix = read(end)
+            if not prefix:
+                break
+            discriminator = getDiscriminator(prefix)
+            try:
+                parse, remaining = type_dict[discriminator]
+            except KeyError:
+                parse, remaining = getType(discriminator)
+            yield parse(b''.join((prefix, read(remaining))))
+            if separator_len:
+                actual_separator = read(separator_len)
+                if not actual_separator:
+                    break
+                if actual_separator != separator:
+                    tell = getattr(stream, 'tell', None)
+                    if tell is None:
+                        at = ''
+                    else:
+                        at = ' at %i' % (tell() - len(actual_separator), )
+                    raise ValueError('Unexpected separator value%s: %r' % (at,
+                        _toBytes(actual_separator)))
+
+    def generateStream(self, stream, data_dict):
+        field_id = self._field_id
+        if field_id is None:
+            raise ValueError('Cannot generate records without field_id')
+        value = data_dict[field_id]
+        try:
+            field_list = self._field_list_dict[value]
+        except KeyError:
+            raise ValueError('Unknown record type %r' % (value, ))
+        field_list.generateStream(stream, data_dict)
+
+# Per-process state of parallel parsing workers.
+_parallel_worker_state = None
+
+def _initParallelWorker(path, item, separator):
+    """
+    For internal use only.
+    """
+    global _parallel_worker_state
+    _parallel_worker_state = (open(path, 'rb'), item, separator)
+
+def _parseParallelChunk(args):
+    """
+    For internal use only.
+    Parse <item_count> consecutive items starting at <offset>, each followed by
+    a separator unless it is the last one and <has_last_separator> is false.
+    """
+    offset, item_count, has_last_separator = args
+    stream, item, separator = _parallel_worker_state
+    item_length = item.total_length
+    separator_len = len(separator)
+    stride = item_length + separator_len
+    stream.seek(offset)
+    data = stream.read(item_count * stride - (not has_last_separator and
+        separator_len))
+    parse = item.parse
+    item_list = []
+    append = item_list.append
+    view = _getView(data)
+    for item_offset in xrange(0, len(data), stride):
+        item_end = item_offset + item_length
+        append(parse(view[item_offset:item_end]))
+        if separator_len and item_end < len(data) and \
+                view[item_end:item_end + separator_len] != separator:
+            raise ValueError('Unexpected separator value at %i: %r' % (
+                offset + item_end, data[item_end:item_end + separator_len]))
+    if len(item_list) != item_count:
+        raise ValueError('File too short: expected %i items at %i, got %i' % (
+            item_count, offset, len(item_list)))
+    return item_list
+
+def _getChunkLength(chunk):
+    """
+    For internal use only.
+    Returns the length of chunks parsed by given instance, which must have a
+    known length.
+    """
+    if isinstance(chunk, FieldList):
+        return chunk.total_length
+    if isinstance(chunk, LazyFieldList):
+        return chunk._field_list.total_length
+    raise TypeError('Chunks of unknown length are not supported: %r' % (
+        chunk, ))
+
+def _skip(stream, length):
+    """
+    For internal use only.
+    Move <length> bytes forward in stream, by seeking if it can, otherwise
+    by reading (which, for ChecksumedFile instances, updates checksum).
+    """
+    if length <= 0:
+        return
+    skip = getattr(stream, 'skip', None)
+    if skip is not None:
+        skip(length)
+        return
+    try:
+        stream.seek(length - 1, 1)
+    except (AttributeError, IOError, OSError):
+        read = stream.read
+        while length > 0:
+            data = read(min(length, BLOCK_SIZE))
+            if not data:
+                raise ValueError('Stream too short to skip %i bytes' % (
+                    length, ))
+            length -= len(data)
+    else:
+        # Seeking past stream end is not an error, so check the last skipped
+        # byte exists.
+        if not stream.read(1):
+            raise ValueError('Stream too short to skip %i bytes' % (length, ))
+
+def _getStreamState(stream):
+    """
+    For internal use only.
+    """
+    getState = getattr(stream, 'getState', None)
+    if getState is None:
+        return stream.tell()
+    return getState()
+
+def _setStreamState(stream, state):
+    """
+    For internal use only.
+    """
+    setState = getattr(stream, 'setState', None)
+    if setState is None:
+        stream.seek(state)
+    else:
+        setState(state)
+
+class Checkpoint(object):
+    """
+    Parsing state saved by FieldListFile.iterParseStream, allowing to resume
+    parsing from there.
+
+    stream_state
+        Stream position: the value returned by stream's getState method (see
+        ChecksumedFile and BlockReader) if it has one, otherwise the value
+        returned by its tell method.
+    position_list
+        (parsed head, item index) for each structure level, from outermost to
+        innermost.
+
+    Checkpoints can be pickled (provided parsed heads can be), but checksum
+    state is lost in the process and has to be recomputed when resuming,
+    by reading from the beginning of the stream without parsing.
+    """
+    def __init__(self, stream_state, position_list):
+        self.stream_state = stream_state
+        self.position_list = position_list
+
+    def restore(self, stream):
+        """
+        Restore stream position (and checksum, if applicable).
+        """
+        _setStreamState(stream, self.stream_state)
+
+class _Checkpointer(object):
+    """
+    For internal use only.
+    Counts parsed items, and produces a Checkpoint every <interval> items.
+    """
+    def __init__(self, interval):
+        self._interval = interval
+        self._count = 0
+
+    def __call__(self, stream, position_list):
+        self._count += 1
+        if self._count % self._interval:
+            return None
+        return Checkpoint(_getStreamState(stream),
+            [tuple(x) for x in position_list])
+
+class _ItemCount(object):
+    """
+    For internal use only.
+    Stands for an item list which is not available, for item callbacks which
+    only need to know its length.
+    """
+    def __init__(self, length):
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+class FieldListFile(object):
+    def __init__(self, head, item_callback, separator=b'', item_filter=None):
+        r"""
+        Files parsed/generated by this class follow the following structure:
+            FILE: HEAD SEPARATOR [ITEM SEPARATOR [ITEM SEPARATOR [...]]]
+        Where:
+          SEPARATOR is a fixed string.
+            HEAD is a string which can be parsed by instance given in <head>
+            parameter.
+            ITEM is a string which can be parsed by instance returned by
+            <item_callback>, and there is a known number of such items (also as
+            returned by <item_callback>).
+
+        Chunk (head or item) generator & parser:
+        Instances responsible for individual chunk parsing & generation must
+        implement the following interface:
+            parseStream(stream) -> parsed_value
+            generateStream(stream, parsed_value)
+
+        Stream:
+        streams given to this class methods must implement the following
+        methods:
+        - read(length) -> data
         - write(data)
         They might implement tell() for more detailed exception messages. If
         it's not implemented, it must not be available at all.
@@ -373,11 +2435,21 @@ class FieldListFile(object):
             - instance implementing  the chunk interface
         separator (string)
             (see above definition)
+        item_filter (callable)
+            Callable receiving a parsed head and returning wether its items
+            should be parsed. When it returns false, items are skipped without
+            being parsed nor read into memory (they must either have a known
+            length, or be FieldListFile instances, see _skipItems): their
+            parsed value is None, and they produce no iterParseStream event.
+            Skipped data is still read by ChecksumedFile instances, so
+            checksum is preserved.
+            To only parse some fields of items, see LazyFieldList.
         """
         self._head = head
         self._item_callback = item_callback
         self._separator = separator
         self._separator_len = len(separator)
+        self._item_filter = item_filter
 
     def eatSeparator(self, stream):
         separator = stream.read(self._separator_len)
@@ -388,11 +2460,86 @@ class FieldListFile(object):
             else:
                 at = ' at %i' % (tell() - len(separator), )
             raise ValueError('Unexpected separator value%s: %r' % (at,
-                separator))
+                _toBytes(separator)))
 
     def addSeparator(self, stream):
         stream.write(self._separator)
 
+    def setProfiler(self, profiler, name=None):
+        """
+        Account for parseStream and generateStream calls (including nested
+        structures, from which this one is called) in given Profiler instance
+        (None to stop).
+        Chunks are not instrumented by this call, see their own setProfiler
+        method.
+        name
+            Name of this structure in statistics. Defaults to class name.
+        """
+        # Instrumented methods shadow class methods on this instance only.
+        for method_id in ('parseStream', 'generateStream'):
+            self.__dict__.pop(method_id, None)
+        if profiler is not None:
+            if name is None:
+                name = self.__class__.__name__
+            self.parseStream = profiler.wrapStream(PROFILE_STRUCTURE, name,
+                'parse', self.parseStream)
+            self.generateStream = profiler.wrapStream(PROFILE_STRUCTURE, name,
+                'generate', self.generateStream)
+
+    def iterParseFileParallel(self, path, process_count=None,
+            chunk_item_count=65536, offset=0):
+        """
+        Parse file at given path, using a pool of processes to parse items.
+        Items must be FieldList instances, so that all items have the same
+        length.
+        Head is parsed in current process, then items are split in chunks of
+        <chunk_item_count> items, parsed by <process_count> processes (by
+        default, as many as there are CPUs).
+        <offset> is the position of this structure in file.
+
+        Returns the parsed head and an iterator over parsed items, in file
+        order. Workers are stopped once this iterator is exhausted or closed.
+        """
+        with open(path, 'rb') as stream:
+            stream.seek(offset)
+            parsed_head, item_count, item = self._parseStreamHead(stream)
+            item_offset = stream.tell()
+        if not item_count or not self._filterItems(parsed_head):
+            return parsed_head, iter(())
+        if not isinstance(item, FieldList):
+            raise TypeError('Items must be FieldList instances, got %r' % (
+                item, ))
+        stride = item.total_length + self._separator_len
+        task_list = [
+            (
+                item_offset + first_item * stride,
+                min(chunk_item_count, item_count - first_item),
+                first_item + chunk_item_count < item_count,
+            )
+            for first_item in xrange(0, item_count, chunk_item_count)
+        ]
+        def iterItems():
+            pool = multiprocessing.Pool(process_count, _initParallelWorker,
+                (path, item, self._separator))
+            try:
+                for item_list in pool.imap(_parseParallelChunk, task_list):
+                    for parsed_item in item_list:
+                        yield parsed_item
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        return parsed_head, iterItems()
+
+    def parseFileParallel(self, path, *args, **kw):
+        """
+        Same as iterParseFileParallel, but returns a list of parsed items, or
+        None when there is none (like parseStream).
+        """
+        parsed_head, item_iterator = self.iterParseFileParallel(path, *args,
+            **kw)
+        return parsed_head, list(item_iterator) or None
+
     def _parseStreamItems(self, stream, item, item_count):
         item_list = []
         if item_count:
@@ -406,31 +2553,337 @@ class FieldListFile(object):
         return item_list
 
     def _generateStreamItems(self, stream, item, item_list):
-        if item_list:
-            addSeparator = self.addSeparator
-            item_generate = item.generateStream
-            for item_data in item_list[:-1]:
-                item_generate(stream, item_data)
-                addSeparator(stream)
-            item_generate(stream, item_list[-1])
+        """
+        Generate items from given iterable, each one preceded by a separator.
+        Returns the number of generated items.
+        """
+        generateMany = getattr(item, 'generateMany', None)
+        if generateMany is not None:
+            return generateMany(stream, item_list, separator=self._separator,
+                leading_separator=True)
+        addSeparator = self.addSeparator
+        item_generate = item.generateStream
+        item_count = 0
+        for item_data in item_list:
+            addSeparator(stream)
+            item_generate(stream, item_data)
+            item_count += 1
+        return item_count
+
+    def _getHead(self):
+        """
+        For internal use only.
+        """
+        return self._head
 
-    def parseStream(self, stream, eat_last_separator=False):
+    def validate(self, data, offset=0):
+        """
+        Check data following this structure in a single pass, collecting
+        errors instead of raising on the first one (see FieldList.validate).
+        Heads must be FieldList instances: they are parsed to know the number
+        and type of items, so when a head is invalid the error is reported and
+        the rest of data is not checked. Items must be FieldList or
+        FieldListFile instances.
+        A separator may follow the structure.
+
+        Returns a list of (offset, item index, field name, reason) 4-tuples,
+        sorted by offset. Offsets are the position in data plus <offset>. Item
+        index is the position of the item in its enclosing structure, or None
+        for heads.
+        """
+        return self._validateStream(BytesIO(data), offset)
+
+    def validateStream(self, stream):
+        """
+        Same as validate, on the rest of given stream, which is read by
+        blocks of items so it does not need to fit in memory. Offsets are
+        positions in stream, when it implements tell().
+        """
+        try:
+            offset = stream.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            offset = 0
+        return self._validateStream(stream, offset)
+
+    def _validateStream(self, stream, offset):
+        """
+        For internal use only.
+        Validate the rest of stream, starting at <offset>.
+        """
+        error_list = []
+        position = self._validate(stream, offset, error_list)
+        if position is not None:
+            trailing = _toBytes(stream.read(self._separator_len))
+            if trailing == self._separator:
+                position += len(trailing)
+                trailing_length = 0
+            else:
+                trailing_length = len(trailing)
+            while True:
+                data = stream.read(BLOCK_SIZE)
+                if not data:
+                    break
+                trailing_length += len(data)
+            if trailing_length:
+                error_list.append((position, None, None,
+                    'Unexpected trailing data: %i bytes' % (
+                    trailing_length, )))
+        error_list.sort(key=lambda x: x[0])
+        return error_list
+
+    def _validateSeparator(self, stream, position, index, append):
+        """
+        For internal use only.
+        """
+        actual = _toBytes(stream.read(self._separator_len))
+        if actual != self._separator:
+            append((position, index, None,
+                'Separator %r expected, got %r' % (self._separator, actual)))
+        return position + self._separator_len
+
+    def _validate(self, stream, position, error_list):
+        """
+        For internal use only.
+        Validate structure read from stream, starting at <position>.
+        Returns the position following it, or None if its end cannot be
+        known.
+        """
+        head = self._head
+        if not isinstance(head, FieldList):
+            raise TypeError('Heads must be FieldList instances, got %r' % (
+                head, ))
+        head_data = _toBytes(stream.read(head.total_length))
+        if len(head_data) != head.total_length:
+            error_list.append((position, None, None,
+                'Truncated head: got %i bytes, expected %i' % (
+                len(head_data), head.total_length)))
+            return None
+        head_error_list = head.validate(head_data, offset=position)
+        if not head_error_list:
+            try:
+                parsed_head = head.parse(head_data)
+            except ValueError:
+                head_error_list = [(position, None, None,
+                    str(sys.exc_info()[1]))]
+        if head_error_list:
+            error_list.extend((x, None, y, z) for x, _, y, z in head_error_list)
+            return None
+        item_count, item = self._item_callback(parsed_head)
+        position += head.total_length
+        if not item_count:
+            return position
+        append = error_list.append
+        if isinstance(item, FieldListFile):
+            for index in xrange(item_count):
+                position = self._validateSeparator(stream, position, index,
+                    append)
+                position = item._validate(stream, position, error_list)
+                if position is None:
+                    return None
+            return position
+        if not isinstance(item, FieldList):
+            raise TypeError('Items must be FieldList or FieldListFile '
+                'instances, got %r' % (item, ))
+        position = self._validateSeparator(stream, position, 0, append)
+        separator = self._separator
+        separator_len = self._separator_len
+        stride = item.total_length + separator_len
+        chunk_item_count = max(1, BLOCK_SIZE // stride)
+        for first_index in xrange(0, item_count, chunk_item_count):
+            count = min(chunk_item_count, item_count - first_index)
+            # Include the separator following the last item of the chunk,
+            # unless it is the last item.
+            length = count * stride
+            if first_index + count == item_count:
+                length -= separator_len
+            data = _toBytes(stream.read(length))
+            data_len = len(data)
+            if data_len < length:
+                # Only validate complete items, truncation is reported below.
+                count = (data_len + separator_len) // stride
+                data = data[:max(0, count * stride - separator_len)]
+            for error_offset, index, field_id, reason in item.validate(data,
+                    separator, position):
+                append((error_offset, first_index + index, field_id, reason))
+            if data_len < length:
+                append((position + data_len, None, None,
+                    'Data too short for %i items' % (item_count, )))
+                return None
+            position += length
+        return position
+
+    def _getSeparator(self):
+        """
+        For internal use only.
+        """
+        return self._separator
+
+    def _skipItems(self, stream, item, item_count):
+        """
+        For internal use only.
+        Skip <item_count> items and the separators between them, without
+        parsing them. Items must have a known length, in which case they are
+        skipped at once, or be FieldListFile instances, in which case only
+        their heads are parsed.
+        """
+        if isinstance(item, FieldListFile):
+            eatSeparator = self.eatSeparator
+            item_skip = item._skipStream
+            for index in xrange(item_count):
+                if index:
+                    eatSeparator(stream)
+                item_skip(stream)
+        else:
+            _skip(stream, item_count * (_getChunkLength(item) +
+                self._separator_len) - self._separator_len)
+
+    def _skipStream(self, stream):
+        """
+        For internal use only.
+        Parse head, skip items (see _skipItems) and return parsed head.
+        """
+        parsed_head, item_count, item = self._parseStreamHead(stream)
+        if item_count:
+            self._skipItems(stream, item, item_count)
+        return parsed_head
+
+    def _parseStreamHead(self, stream):
+        """
+        For internal use only.
+        Parse head and, if there are items, the separator following it.
+        Returns parsed head, item count and item chunk instance.
+        """
         parsed_head = self._head.parseStream(stream)
         item_count, item = self._item_callback(parsed_head)
         if item_count:
             self.eatSeparator(stream)
+        return parsed_head, item_count, item
+
+    def _filterItems(self, parsed_head):
+        """
+        For internal use only.
+        Returns wether items following given parsed head must be parsed.
+        """
+        item_filter = self._item_filter
+        return item_filter is None or item_filter(parsed_head)
+
+    def parseStream(self, stream, eat_last_separator=False):
+        parsed_head, item_count, item = self._parseStreamHead(stream)
+        if item_count and self._filterItems(parsed_head):
             item_list = self._parseStreamItems(stream, item, item_count)
         else:
+            if item_count:
+                self._skipItems(stream, item, item_count)
             item_list = None
         if eat_last_separator:
             self.eatSeparator(stream)
         return parsed_head, item_list
 
+    def iterParseStream(self, stream, eat_last_separator=False,
+            checkpoint_interval=None, checkpoint=None):
+        """
+        Lazy equivalent of parseStream: parsed chunks are yielded in file order
+        as they are read, as 3-tuples composed of:
+        - the nesting depth (0 for this structure's head and items, 1 for the
+          heads and items of its items when they are FieldListFile instances,
+          and so on)
+        - the event type: PARSED_HEAD, PARSED_ITEM or CHECKPOINT
+        - the parsed value, or a Checkpoint instance
+        Items which are FieldListFile instances do not produce PARSED_ITEM
+        events themselves: their own head and items are produced instead, one
+        level deeper.
+        Only the chunk being parsed is held, so memory usage does not depend on
+        the number of items.
+
+        checkpoint_interval (int)
+            If given, a CHECKPOINT event is produced after every
+            <checkpoint_interval> items (at any depth).
+        checkpoint (Checkpoint)
+            If given, parsing resumes right after the item preceding this
+            checkpoint, without producing events for heads parsed before it.
+            Stream must be able to restore the position (and checksum) saved
+            in checkpoint, see Checkpoint.
+        """
+        if checkpoint_interval:
+            checkpointer = _Checkpointer(checkpoint_interval)
+        else:
+            checkpointer = None
+        if checkpoint is None:
+            resume = None
+        else:
+            checkpoint.restore(stream)
+            resume = checkpoint.position_list
+        return self._iterParseStream(stream, eat_last_separator, 0, [],
+            checkpointer, resume)
+
+    def _iterParseStream(self, stream, eat_last_separator, depth,
+            position_list, checkpointer, resume):
+        """
+        For internal use only.
+        position_list
+            [parsed head, item index] of enclosing structures, to which the
+            position in this structure is appended while it is being parsed.
+        resume
+            Positions in this structure and nested ones to resume parsing
+            from, or None.
+        """
+        eatSeparator = self.eatSeparator
+        if resume:
+            (parsed_head, resume_index), resume = resume[0], resume[1:]
+            item_count, item = self._item_callback(parsed_head)
+        else:
+            parsed_head = self._head.parseStream(stream)
+            item_count, item = self._item_callback(parsed_head)
+            yield depth, PARSED_HEAD, parsed_head
+            resume_index = None
+            if item_count:
+                eatSeparator(stream)
+                if not self._filterItems(parsed_head):
+                    self._skipItems(stream, item, item_count)
+                    item_count = 0
+        position = [parsed_head, resume_index]
+        position_list.append(position)
+        if item_count:
+            item_iter_parse = getattr(item, '_iterParseStream', None)
+            if item_iter_parse is None:
+                item_parse = item.parseStream
+                # When resuming, item at resume_index was already parsed.
+                for index in xrange(0 if resume_index is None else
+                        resume_index + 1, item_count):
+                    if index:
+                        eatSeparator(stream)
+                    parsed_item = item_parse(stream)
+                    position[1] = index
+                    yield depth, PARSED_ITEM, parsed_item
+                    if checkpointer is not None:
+                        checkpoint = checkpointer(stream, position_list)
+                        if checkpoint is not None:
+                            yield depth, CHECKPOINT, checkpoint
+            else:
+                depth += 1
+                if resume_index is None:
+                    first_index = 0
+                else:
+                    # Item at resume_index was being parsed, finish it.
+                    for event in item_iter_parse(stream, False, depth,
+                            position_list, checkpointer, resume):
+                        yield event
+                    first_index = resume_index + 1
+                for index in xrange(first_index, item_count):
+                    if index:
+                        eatSeparator(stream)
+                    position[1] = index
+                    for event in item_iter_parse(stream, False, depth,
+                            position_list, checkpointer, None):
+                        yield event
+        position_list.pop()
+        if eat_last_separator:
+            eatSeparator(stream)
+
     def _generateStream(self, stream, parsed_head, item_list, item,
             add_last_separator):
         self._head.generateStream(stream, parsed_head)
         if item_list:
-            self.addSeparator(stream)
             self._generateStreamItems(stream, item, item_list)
         if add_last_separator:
             self.addSeparator(stream)
@@ -439,14 +2892,90 @@ class FieldListFile(object):
         assert isinstance(args, (tuple, list)), args
         if len(args) == 1:
             args = (args[0], None)
+        if isinstance(args[0], tuple):
+            # Record head: callback may need to update it.
+            args = (args[0]._asdict(), args[1])
         return args
 
-    def generateStream(self, stream, args, add_last_separator=False):
+    def _prepareGenerateStream(self, args):
+        """
+        For internal use only.
+        Returns head, item list and item chunk instance to generate given
+        parsed value.
+        """
         head_dict, item_list = self._getGenerateStreamParameters(args)
         _, item = self._item_callback(head_dict, item_list)
+        return head_dict, item_list, item
+
+    def generateStream(self, stream, args, add_last_separator=False):
+        head_dict, item_list, item = self._prepareGenerateStream(args)
         self._generateStream(stream, head_dict, item_list, item,
             add_last_separator)
 
+    def generateStreamFromIterable(self, stream, args,
+            add_last_separator=False, two_pass=False):
+        """
+        Same as generateStream, but items may be given as any iterable (ex: a
+        generator, a database cursor) and are written as they are produced,
+        so they never need to be all held in memory.
+
+        As the head may depend on the number of items, which is only known
+        once all items are produced:
+        - if two_pass is false, stream must implement tell() and seek(): the
+          head is generated first, then overwritten once all items are
+          generated
+        - if two_pass is true, items are iterated over twice, first to count
+          them then to generate them, so the iterable must support it (ex: a
+          list, or an object re-executing a query on each __iter__ call).
+          This allows generating to non-seekable streams, like
+          ChecksumedFile.
+        In both cases, the item list given to item_callback only supports
+        len().
+
+        Returns the number of generated items.
+        """
+        head_dict, item_iterable = self._getGenerateStreamParameters(args)
+        if item_iterable is None:
+            # Like generateStream, which item_callback may expect.
+            self._item_callback(head_dict, None)
+            self._head.generateStream(stream, head_dict)
+            item_count = 0
+        elif two_pass:
+            item_count = 0
+            for _ in item_iterable:
+                item_count += 1
+            _, item = self._item_callback(head_dict, _ItemCount(item_count))
+            self._head.generateStream(stream, head_dict)
+            if item_count:
+                generated_count = self._generateStreamItems(stream, item,
+                    item_iterable)
+                if generated_count != item_count:
+                    raise ValueError('Item count changed between passes: '
+                        '%i, then %i' % (item_count, generated_count))
+        else:
+            seek = stream.seek
+            head_offset = stream.tell()
+            _, item = self._item_callback(head_dict, _ItemCount(0))
+            self._head.generateStream(stream, head_dict)
+            head_end_offset = stream.tell()
+            if item is None:
+                item_count = 0
+            else:
+                item_count = self._generateStreamItems(stream, item,
+                    item_iterable)
+            if item_count:
+                self._item_callback(head_dict, _ItemCount(item_count))
+                end_offset = stream.tell()
+                seek(head_offset)
+                self._head.generateStream(stream, head_dict)
+                if stream.tell() != head_end_offset:
+                    raise ValueError('Head length changed when updating it '
+                        'with item count')
+                seek(end_offset)
+        if add_last_separator:
+            self.addSeparator(stream)
+        return item_count
+
 class HeadFile(FieldListFile):
     """
     Special case of a FieldListFile: contains just a head.
@@ -480,8 +3009,225 @@ class ConstItemTypeFile(FieldListFile):
     def _callback(self, head_dict, item_list=None):
         if item_list is not None:
             head_dict[self._item_count_key] = len(item_list)
+        elif isinstance(head_dict, tuple):
+            return getattr(head_dict, self._item_count_key), self._item
         return head_dict[self._item_count_key], self._item
 
+class _ZlibChecksum(object):
+    """
+    For internal use only.
+    hashlib-like interface to zlib checksum functions.
+    """
+    def __init__(self, name, function, value):
+        self.name = name
+        self._function = function
+        self._value = value
+
+    def update(self, data):
+        self._value = self._function(data, self._value)
+
+    def digest(self):
+        return struct.pack('>I', self._value & 0xffffffff)
+
+    def hexdigest(self):
+        return '%08x' % (self._value & 0xffffffff, )
+
+    def copy(self):
+        return self.__class__(self.name, self._function, self._value)
+
+def _newHash(name):
+    """
+    For internal use only.
+    Returns a new hash object for given algorithm name: any hashlib algorithm,
+    'crc32' or 'adler32'.
+    """
+    if name == 'crc32':
+        return _ZlibChecksum(name, zlib.crc32, 0)
+    if name == 'adler32':
+        return _ZlibChecksum(name, zlib.adler32, 1)
+    return hashlib.new(name)
+
+def _runHashPipeline(queue, hash_list, error_list):
+    """
+    For internal use only.
+    HashPipeline background thread main loop.
+    Does not reference the pipeline, so it can be garbage-collected (which
+    stops this thread).
+    """
+    while True:
+        chunk = queue.get()
+        try:
+            if chunk is None:
+                return
+            if not error_list:
+                for hash_object in hash_list:
+                    hash_object.update(chunk)
+        except Exception:
+            error_list.append(sys.exc_info()[1])
+        finally:
+            queue.task_done()
+
+# Pipelines with a background thread, see _stopHashPipelines.
+_hash_pipeline_set = weakref.WeakSet()
+
+def _stopHashPipelines():
+    """
+    For internal use only.
+    Stop background threads of pipelines still alive at exit, before
+    interpreter shutdown makes them fail.
+    """
+    for pipeline in list(_hash_pipeline_set):
+        thread = pipeline._thread
+        pipeline.abort()
+        thread.join()
+atexit.register(_stopHashPipelines)
+
+class HashPipeline(object):
+    """
+    hashlib-like object updating several hashes at once, coalescing small
+    updates into chunks of at least <chunk_size> bytes.
+    Chunks can be hashed in a background thread: as hashlib releases the GIL
+    while hashing large buffers, hashing then overlaps with parsing.
+    digest and hexdigest methods apply to the first hash.
+    """
+    def __init__(self, hash_list, chunk_size=BLOCK_SIZE, threaded=True):
+        """
+        hash_list (list)
+            hashlib-like objects.
+        chunk_size (int)
+            Minimum length of data given to hash objects, except on flush.
+        threaded (bool)
+            Whether to hash chunks in a background thread.
+        """
+        self._queue = None
+        self._thread = None
+        self._hash_list = hash_list
+        self._chunk_size = chunk_size
+        self._chunk_list = []
+        self._chunk_len = 0
+        if threaded:
+            self._error_list = []
+            # Bounds memory usage when hashing is slower than reading.
+            self._queue = Queue(4)
+            thread = threading.Thread(target=_runHashPipeline,
+                args=(self._queue, hash_list, self._error_list))
+            thread.daemon = True
+            thread.start()
+            self._thread = thread
+            _hash_pipeline_set.add(self)
+
+    def __del__(self):
+        # Must not block, as background thread may already be stopped (ex:
+        # during interpreter shutdown). Nothing can access hashes anymore, so
+        # there is no point in hashing pending data.
+        self.abort()
+
+    def update(self, data):
+        chunk_list = self._chunk_list
+        chunk_len = self._chunk_len + len(data)
+        if data.__class__ is not bytes and (
+            chunk_list or chunk_len < self._chunk_size
+        ):
+            # Either hashed later, while caller may reuse its buffer (ex:
+            # bytearray, memoryview), or joined with pending data.
+            data = _copyBytes(data)
+        chunk_list.append(data)
+        self._chunk_len = chunk_len
+        if chunk_len >= self._chunk_size:
+            self._push()
+
+    def _push(self):
+        chunk_list = self._chunk_list
+        if len(chunk_list) == 1:
+            chunk = chunk_list[0]
+            if self._queue is not None and chunk.__class__ is not bytes:
+                # Hashed in background thread, while caller may reuse its
+                # buffer.
+                chunk = _copyBytes(chunk)
+        else:
+            chunk = b''.join(chunk_list)
+        del chunk_list[:]
+        self._chunk_len = 0
+        if self._queue is None:
+            for hash_object in self._hash_list:
+                hash_object.update(chunk)
+        else:
+            self._queue.put(chunk)
+
+    def flush(self):
+        """
+        Hash all pending data, and wait for it to be hashed.
+        """
+        if self._chunk_list:
+            self._push()
+        if self._queue is not None:
+            self._queue.join()
+            if self._error_list:
+                raise self._error_list[0]
+
+    def close(self):
+        """
+        Stop background thread, if any. Pending data is hashed first.
+        """
+        queue = self._queue
+        if queue is not None:
+            self.flush()
+            self._queue = None
+            queue.put(None)
+
+    def abort(self):
+        """
+        Stop background thread, if any, without waiting for it. Pending data
+        is dropped, so hashes become meaningless.
+        """
+        del self._chunk_list[:]
+        self._chunk_len = 0
+        queue = self._queue
+        if queue is not None:
+            self._queue = None
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+                queue.task_done()
+            try:
+                queue.put_nowait(None)
+            except Full:
+                # Background thread is not consuming, it is either busy and
+                # will find the queue empty, or stopped.
+                pass
+
+    def getHashList(self):
+        """
+        Returns hash objects, with all data given so far hashed.
+        """
+        self.flush()
+        return self._hash_list
+
+    def digest(self):
+        return self.getHashList()[0].digest()
+
+    def hexdigest(self):
+        return self.getHashList()[0].hexdigest()
+
+class ChecksumedFileState(object):
+    """
+    State of a ChecksumedFile, see ChecksumedFile.getState.
+    Hash objects cannot be pickled, so they are dropped when pickling. The
+    checksum then gets recomputed when restoring state.
+    """
+    def __init__(self, offset, hash, ahead, start):
+        self.offset = offset
+        self.hash = hash
+        self.ahead = ahead
+        self.start = start
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['hash'] = None
+        return state
+
 class ChecksumedFile(object):
     """
     Virtual class.
@@ -493,7 +3239,7 @@ class ChecksumedFile(object):
     * is desired hash algorithm name).
 
     Limitations:
-    - cannot seek
+    - cannot seek, except to restore a state saved by getState
     """
     def __init__(self, stream):
         """
@@ -501,8 +3247,91 @@ class ChecksumedFile(object):
             Some stream. Typically, an opened file object.
         """
         self._stream = stream
-        self._hash = self._hash_class()
+        self._hash = self._newHash()
         self._ahead = None
+        try:
+            self._start = stream.tell()
+        except (AttributeError, IOError, OSError):
+            self._start = None
+
+    def _newHash(self):
+        return self._hash_class()
+
+    def _dropHash(self):
+        """
+        For internal use only.
+        Called before current hash object gets replaced.
+        """
+        pass
+
+    def setProfiler(self, profiler, name=None):
+        """
+        Account for hashed data in given Profiler instance (None to stop).
+        To also account for data hashed through a BlockReader, call this before
+        creating it.
+        name
+            Name of this file in statistics. Defaults to class name.
+        """
+        self.__dict__.pop('update', None)
+        if profiler is not None:
+            if name is None:
+                name = self.__class__.__name__
+            self.update = profiler.wrap(PROFILE_HASH, name, 'update',
+                self.update)
+
+    def _copyHash(self):
+        return self._hash.copy()
+
+    def _restoreHash(self, hash_copy):
+        self._hash = hash_copy.copy()
+
+    def getState(self):
+        """
+        Returns current position and checksum state, to be given to setState.
+        """
+        return ChecksumedFileState(self.tell(), self._copyHash(), self._ahead,
+            self._start)
+
+    def setState(self, state):
+        """
+        Move to position and restore checksum state saved by getState,
+        possibly on another instance wrapping a stream over the same data.
+        If checksum state was lost (see ChecksumedFileState), it is recomputed
+        by reading data from the position this instance was created at,
+        assuming all read data was checksumed.
+        """
+        stream = self._stream
+        if state.hash is None:
+            stream.seek(state.start)
+            self._dropHash()
+            self._hash = self._newHash()
+            update = self._hash.update
+            remaining = state.offset - state.start - len(state.ahead or '')
+            while remaining > 0:
+                data = stream.read(min(remaining, BLOCK_SIZE))
+                if not data:
+                    raise ValueError('Stream too short to restore state')
+                update(data)
+                remaining -= len(data)
+        else:
+            self._restoreHash(state.hash)
+        stream.seek(state.offset)
+        self._ahead = state.ahead
+
+    def skip(self, length):
+        """
+        Move <length> bytes forward, updating checksum with skipped data,
+        which is read by large blocks.
+        """
+        read = self._stream.read
+        update = self.update
+        while length > 0:
+            data = read(min(length, BLOCK_SIZE))
+            if not data:
+                raise ValueError('Stream too short to skip %i bytes' % (
+                    length, ))
+            update(data)
+            length -= len(data)
 
     def updateAhead(self, data):
         if self._ahead is not None:
@@ -517,6 +3346,12 @@ class ChecksumedFile(object):
         """
         self._ahead = replacement
 
+    def _getStream(self):
+        """
+        For internal use only.
+        """
+        return self._stream
+
     def update(self, data):
         update = self._hash.update
         if self._ahead is not None:
@@ -590,6 +3425,598 @@ class ChecksumedFile(object):
     def tellAhead(self):
         return self.tell() + len(self._ahead)
 
+class MultiChecksumedFile(ChecksumedFile):
+    """
+    ChecksumedFile computing several checksums in a single pass, through a
+    HashPipeline (so hashing happens in a background thread by default).
+    """
+    def __init__(self, stream, algorithm_list, chunk_size=BLOCK_SIZE,
+            threaded=True):
+        """
+        stream
+            Some stream. Typically, an opened file object.
+        algorithm_list (list of strings)
+            Names of hash algorithms: any hashlib algorithm, 'crc32' or
+            'adler32'.
+        chunk_size, threaded
+            See HashPipeline.
+        """
+        self._algorithm_list = list(algorithm_list)
+        self._chunk_size = chunk_size
+        self._threaded = threaded
+        super(MultiChecksumedFile, self).__init__(stream)
+
+    def _newHash(self):
+        return HashPipeline([_newHash(x) for x in self._algorithm_list],
+            self._chunk_size, self._threaded)
+
+    def _copyHash(self):
+        return [x.copy() for x in self._hash.getHashList()]
+
+    def _dropHash(self):
+        self._hash.abort()
+
+    def _restoreHash(self, hash_copy):
+        self._dropHash()
+        self._hash = HashPipeline([x.copy() for x in hash_copy],
+            self._chunk_size, self._threaded)
+
+    def _getHash(self, algorithm):
+        hash_list = self._hash.getHashList()
+        if algorithm is None:
+            return hash_list[0]
+        return hash_list[self._algorithm_list.index(algorithm)]
+
+    def getDigest(self, algorithm=None):
+        """
+        algorithm
+            Name of algorithm, defaults to the first one.
+        """
+        return self._getHash(algorithm).digest()
+
+    def getHexDigest(self, algorithm=None):
+        """
+        algorithm
+            Name of algorithm, defaults to the first one.
+        """
+        return self._getHash(algorithm).hexdigest()
+
+    def getHexDigestDict(self):
+        """
+        Returns hexadecimal digests, by algorithm name.
+        """
+        return dict(zip(self._algorithm_list,
+            [x.hexdigest() for x in self._hash.getHashList()]))
+
+    def close(self):
+        """
+        Stop hashing thread. Wrapped stream is not closed.
+        """
+        self._hash.close()
+
+class BlockReader(object):
+    """
+    Read-only stream wrapper, reading from wrapped stream in large blocks and
+    serving smaller reads from memory.
+    On Python 3, returned data is a memoryview, which FieldList instances
+    parse without copying whole records.
+
+    When wrapping a ChecksumedFile, data is read from the stream it wraps and
+    the checksum is updated with consumed data once per block, so checksum
+    only accounts for all consumed data after detach() is called.
+    Can be used as a context manager, calling detach() on exit.
+    """
+    def __init__(self, stream, block_size=BLOCK_SIZE):
+        """
+        stream
+            Some stream, typically an opened file object or a ChecksumedFile.
+        block_size (int)
+            Minimum length of reads done on wrapped stream.
+        """
+        self._wrapped = stream
+        if isinstance(stream, ChecksumedFile):
+            self._update = stream.update
+            stream = stream._getStream()
+        else:
+            self._update = None
+        self._stream = stream
+        self._block_size = block_size
+        self._setBuffer(b'')
+        # Position of next read in buffer.
+        self._offset = 0
+        # Position in buffer up to which checksum was updated.
+        self._updated = 0
+        # Position of buffer in wrapped stream, if known.
+        self._buffer_offset = None
+        tell = getattr(stream, 'tell', None)
+        if tell is not None:
+            try:
+                self._buffer_offset = tell()
+            except (IOError, OSError):
+                pass
+            else:
+                self.tell = self._tell
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+
+    def _setBuffer(self, data):
+        self._buffer = data
+        # On Python 3, reads return memoryview slices of the buffer, to avoid
+        # copying data.
+        self._view = _getView(data)
+
+    def _updateChecksum(self):
+        offset = self._offset
+        if self._update is not None and self._updated < offset:
+            self._update(self._buffer[self._updated:offset])
+        self._updated = offset
+
+    def _fill(self, length):
+        """
+        Replace buffer with its unconsumed part followed by enough data read
+        from wrapped stream to serve a read of given length (or everything
+        left in wrapped stream if length is negative).
+        """
+        self._updateChecksum()
+        offset = self._offset
+        chunk_list = [self._buffer[offset:]]
+        read = self._stream.read
+        if length < 0:
+            chunk_list.append(read())
+        else:
+            block_size = self._block_size
+            missing = length - len(chunk_list[0])
+            while missing > 0:
+                data = read(max(missing, block_size))
+                if not data:
+                    break
+                chunk_list.append(data)
+                missing -= len(data)
+        self._setBuffer(b''.join(chunk_list))
+        if self._buffer_offset is not None:
+            self._buffer_offset += offset
+        self._offset = self._updated = 0
+
+    def read(self, length=-1):
+        offset = self._offset
+        end = offset + length
+        if length < 0 or end > len(self._buffer):
+            self._fill(length)
+            offset = 0
+            end = len(self._buffer) if length < 0 else length
+        result = self._view[offset:end]
+        self._offset = offset + len(result)
+        return result
+
+    def _tell(self):
+        return self._buffer_offset + self._offset
+
+    def skip(self, length):
+        """
+        Move <length> bytes forward. Data beyond current buffer is not
+        buffered: wrapped stream is moved forward (see ChecksumedFile.skip).
+        """
+        offset = self._offset + length
+        buffer_len = len(self._buffer)
+        if offset <= buffer_len:
+            self._offset = offset
+            return
+        self._offset = buffer_len
+        self._updateChecksum()
+        if self._update is None:
+            _skip(self._stream, offset - buffer_len)
+        else:
+            self._wrapped.skip(offset - buffer_len)
+        if self._buffer_offset is not None:
+            self._buffer_offset += offset
+        self._setBuffer(b'')
+        self._offset = self._updated = 0
+
+    def getState(self):
+        """
+        Returns current position, and checksum state when wrapping a
+        ChecksumedFile (see ChecksumedFile.getState), to be given to
+        setState.
+        """
+        self._updateChecksum()
+        if self._update is None:
+            return self._tell()
+        state = self._wrapped.getState()
+        state.offset = self._tell()
+        return state
+
+    def setState(self, state):
+        """
+        Restore position (and checksum) saved by getState.
+        """
+        if self._update is None:
+            self._stream.seek(state)
+            offset = state
+        else:
+            self._wrapped.setState(state)
+            offset = state.offset
+        self._setBuffer(b'')
+        self._offset = self._updated = 0
+        self._buffer_offset = offset
+
+    def detach(self):
+        """
+        Update checksum with consumed data, rewind wrapped stream to the first
+        unconsumed byte if it is possible (otherwise, unconsumed data is lost)
+        and return the wrapped stream.
+        """
+        self._updateChecksum()
+        if self._buffer_offset is not None:
+            offset = self._offset
+            if offset < len(self._buffer):
+                seek = getattr(self._stream, 'seek', None)
+                if seek is None:
+                    offset = len(self._buffer)
+                else:
+                    seek(self._buffer_offset + offset)
+            self._buffer_offset += offset
+        self._setBuffer(b'')
+        self._offset = self._updated = 0
+        return self._wrapped
+
+class _MappedItemList(object):
+    """
+    For internal use only.
+    Lazy sequence of fixed-length items from a memory-mapped file, parsed on
+    access.
+    """
+    def __init__(self, mapped, item, offset, stride, length, last_offset,
+            separator):
+        self._mapped = mapped
+        self._item = item
+        self._offset = offset
+        self._stride = stride
+        self._length = length
+        self._last_offset = last_offset
+        self._separator = separator
+
+    def __len__(self):
+        return self._length
+
+    def _parse(self, offset):
+        mapped = self._mapped
+        item_length = self._item.total_length
+        end = offset + item_length
+        separator = self._separator
+        if separator and offset != self._last_offset and \
+                mapped[end:end + len(separator)] != separator:
+            raise ValueError('Unexpected separator value at %i: %r' % (end,
+                _toBytes(mapped[end:end + len(separator)])))
+        return self._item.parse(mapped[offset:end])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            return self.__class__(self._mapped, self._item,
+                self._offset + start * self._stride, self._stride * step,
+                len(xrange(start, stop, step)), self._last_offset,
+                self._separator)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._parse(self._offset + index * self._stride)
+
+    def __iter__(self):
+        parse = self._parse
+        offset = self._offset
+        stride = self._stride
+        for index in xrange(self._length):
+            yield parse(offset + index * stride)
+
+class MappedFile(object):
+    """
+    Read-only, random access to a file following a FieldListFile structure
+    whose items are FieldList instances, and hence all have the same length.
+
+    The file is memory-mapped, its head is parsed on instanciation and items
+    are only parsed when accessed.
+    Can be used as a context manager, calling close() on exit.
+    """
+    def __init__(self, file_object, structure, offset=0):
+        """
+        file_object
+            Opened file object, implementing fileno().
+        structure (FieldListFile)
+            Structure of the file.
+        offset (int)
+            Position of structure in file.
+        """
+        self._mapped = mapped = mmap.mmap(file_object.fileno(), 0,
+            access=mmap.ACCESS_READ)
+        mapped.seek(offset)
+        self._head, item_count, item = structure._parseStreamHead(mapped)
+        if item_count:
+            if not isinstance(item, FieldList):
+                raise TypeError('Items must be FieldList instances, got %r' % (
+                    item, ))
+            separator = structure._getSeparator()
+            item_offset = mapped.tell()
+            stride = item.total_length + len(separator)
+            last_offset = item_offset + (item_count - 1) * stride
+            if last_offset + item.total_length > len(mapped):
+                raise ValueError('File too short for %i items' % (
+                    item_count, ))
+        else:
+            item_offset = stride = 0
+            last_offset = separator = None
+        # On Python 3, slicing a memoryview of the mapping avoids copying
+        # items.
+        self._view = _getView(mapped)
+        self._item_list = _MappedItemList(self._view, item, item_offset,
+            stride, item_count, last_offset, separator)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def getHead(self):
+        return self._head
+
+    def getItemList(self):
+        """
+        Returns a sequence of parsed items, supporting len(), indexing and
+        slicing (which does not parse anything by itself).
+        """
+        return self._item_list
+
+    def close(self):
+        if _PY3:
+            self._view.release()
+        self._mapped.close()
+
+class BlockIndex(object):
+    """
+    Index of the items (called blocks here) of a file following a
+    FieldListFile structure, giving their position in file and the value of
+    chosen fields of their heads, so they can be accessed directly.
+
+    Blocks must be FieldListFile instances whose heads are FieldList
+    instances, or FieldList instances. The index is built in a single pass
+    only parsing block heads, the items of each block being skipped (see
+    FieldListFile._skipItems).
+    It can be updated when the file grows, and saved to a sidecar file, which
+    is appended to when saving an updated index.
+    """
+    _magic = b'xfwidx1\n'
+    _entry_offset = struct.Struct('<Q')
+    _header = struct.Struct('<8sI')
+
+    def __init__(self, stream, structure, key_list=(), offset=0):
+        """
+        stream
+            Seekable stream to index, typically an opened file object.
+        structure (FieldListFile)
+            Structure of the file.
+        key_list (list of field names)
+            Fields of block heads to index, so blocks can be looked up by
+            their value (see find).
+        offset (int)
+            Position of structure in stream.
+        """
+        self._stream = stream
+        self._structure = structure
+        self._offset = offset
+        self._key_list = key_list = list(key_list)
+        stream.seek(offset)
+        _, _, self._item = structure._parseStreamHead(stream)
+        if isinstance(self._item, FieldListFile):
+            head = self._item._getHead()
+        else:
+            head = self._item
+        if not isinstance(head, FieldList):
+            raise TypeError('Block heads must be FieldList instances, got '
+                '%r' % (head, ))
+        field_dict = dict((x[2], x) for x in head._getLayout())
+        self._key_slice_list = key_slice_list = []
+        for field_id in key_list:
+            try:
+                field, _, _, field_offset, _ = field_dict[field_id]
+            except KeyError:
+                raise ValueError('Unknown field %r' % (field_id, ))
+            key_slice_list.append((field, field_offset,
+                field_offset + field.getLength()))
+        self._key_length = sum(x.getLength() for x, _, _ in key_slice_list)
+        self._offset_array = array(_OFFSET_TYPECODE)
+        self._key_data = bytearray()
+        # Parsed key values, by block number.
+        self._key_value_list = []
+
+    def __len__(self):
+        return len(self._offset_array)
+
+    def _readBlockHead(self, stream):
+        """
+        For internal use only.
+        Read a block head, skip block items and return head raw data.
+        """
+        item = self._item
+        if isinstance(item, FieldListFile):
+            head = item._getHead()
+            raw = stream.read(head.total_length)
+            item_count, block_item = item._item_callback(head.parse(raw))
+            if item_count:
+                item.eatSeparator(stream)
+                item._skipItems(stream, block_item, item_count)
+        else:
+            raw = stream.read(item.total_length)
+            if len(raw) != item.total_length:
+                raise ValueError('Stream too short for block')
+        return raw
+
+    def update(self):
+        """
+        Index blocks which are not indexed yet (all of them on first call).
+        Returns the number of newly-indexed blocks.
+        """
+        stream = self._stream
+        structure = self._structure
+        stream.seek(self._offset)
+        _, item_count, _ = structure._parseStreamHead(stream)
+        start = len(self)
+        if start >= item_count:
+            return 0
+        readBlockHead = self._readBlockHead
+        if start:
+            stream.seek(self._offset_array[-1])
+            readBlockHead(stream)
+        append = self._offset_array.append
+        key_slice_list = self._key_slice_list
+        extend = self._key_data.extend
+        for index in xrange(start, item_count):
+            if index:
+                structure.eatSeparator(stream)
+            append(stream.tell())
+            raw = readBlockHead(stream)
+            for _, key_offset, key_end in key_slice_list:
+                extend(raw[key_offset:key_end])
+        return item_count - start
+
+    def getOffset(self, index):
+        """
+        Returns the position in stream of given block.
+        """
+        return self._offset_array[index]
+
+    def getKey(self, index):
+        """
+        Returns the values of indexed fields of given block head, as a tuple.
+        """
+        return self._getKeyValueList()[index]
+
+    def _getKeyValueList(self):
+        """
+        For internal use only.
+        Parse key values of blocks indexed since last call.
+        """
+        key_value_list = self._key_value_list
+        key_length = self._key_length
+        key_data = self._key_data
+        key_slice_list = self._key_slice_list
+        for index in xrange(len(key_value_list), len(self)):
+            key_offset = index * key_length
+            value_list = []
+            for field, start, end in key_slice_list:
+                end = key_offset + end - start
+                value_list.append(field.parse(bytes(key_data[key_offset:end])))
+                key_offset = end
+            key_value_list.append(tuple(value_list))
+        return key_value_list
+
+    def find(self, **kw):
+        """
+        Returns the numbers of blocks whose indexed head fields have given
+        values.
+        """
+        try:
+            position_list = [(self._key_list.index(x), y)
+                for x, y in kw.items()]
+        except ValueError:
+            raise ValueError('Fields not indexed: %r' % (sorted(
+                set(kw).difference(self._key_list)), ))
+        return [
+            index
+            for index, key in enumerate(self._getKeyValueList())
+            if all(key[x] == y for x, y in position_list)
+        ]
+
+    def parseBlock(self, index):
+        """
+        Parse given block.
+        """
+        self._stream.seek(self._offset_array[index])
+        return self._item.parseStream(self._stream)
+
+    def parseBlockHead(self, index):
+        """
+        Parse the head of given block, or the whole block if it is a FieldList.
+        """
+        self._stream.seek(self._offset_array[index])
+        item = self._item
+        if isinstance(item, FieldListFile):
+            item = item._getHead()
+        return item.parseStream(self._stream)
+
+    def _getEntryLength(self):
+        return self._entry_offset.size + self._key_length
+
+    def save(self, path):
+        """
+        Save index to given sidecar file. If it already contains a (previous
+        version of this) index, only new blocks are appended to it.
+        """
+        entry_length = self._getEntryLength()
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if size:
+            with open(path, 'rb') as sidecar:
+                self._checkHeader(sidecar.read(self._header.size))
+            start = (size - self._header.size) // entry_length
+            if start > len(self):
+                raise ValueError('Sidecar has more blocks than this index')
+            mode = 'r+b'
+        else:
+            start = 0
+            mode = 'wb'
+        key_length = self._key_length
+        key_data = self._key_data
+        pack = self._entry_offset.pack
+        with open(path, mode) as sidecar:
+            if start:
+                sidecar.seek(self._header.size + start * entry_length)
+            else:
+                sidecar.write(self._header.pack(self._magic, key_length))
+            sidecar.write(b''.join(
+                pack(offset) + bytes(key_data[index * key_length:
+                    (index + 1) * key_length])
+                for index, offset in enumerate(self._offset_array[start:],
+                    start)
+            ))
+            sidecar.truncate()
+
+    def _checkHeader(self, header):
+        if len(header) != self._header.size:
+            raise ValueError('Not an index file')
+        magic, key_length = self._header.unpack(header)
+        if magic != self._magic:
+            raise ValueError('Not an index file')
+        if key_length != self._key_length:
+            raise ValueError('Index file has a different key length: %i, '
+                'expected %i' % (key_length, self._key_length))
+
+    def load(self, path):
+        """
+        Load index from given sidecar file, replacing current content. Call
+        update to index blocks added to the file since the index was saved.
+        """
+        with open(path, 'rb') as sidecar:
+            data = sidecar.read()
+        self._checkHeader(data[:self._header.size])
+        entry_length = self._getEntryLength()
+        offset_size = self._entry_offset.size
+        unpack_from = self._entry_offset.unpack_from
+        self._offset_array = offset_array = array(_OFFSET_TYPECODE)
+        self._key_data = key_data = bytearray()
+        self._key_value_list = []
+        for entry_offset in xrange(self._header.size, len(data) -
+                entry_length + 1, entry_length):
+            offset_array.append(unpack_from(data, entry_offset)[0])
+            key_data.extend(data[entry_offset + offset_size:
+                entry_offset + entry_length])
+
 _globals = globals()
 append = __all__.append
 try:
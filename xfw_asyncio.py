@@ -0,0 +1,336 @@
+##############################################################################
+#
+# Copyright (c) 2009-2011 Nexedi SA and Contributors. All Rights Reserved.
+#                    Pelletier Vincent <vincent@nexedi.com>
+#
+# WARNING: This program as such is intended to be used by professional
+# programmers who take the whole responsability of assessing all potential
+# consequences resulting from its eventual inadequacies and bugs
+# End users who are looking for a ready-to-use solution with commercial
+# garantees and support are strongly adviced to contract a Free Software
+# Service Company
+#
+# This program is Free Software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+##############################################################################
+"""
+asyncio interface to xfw, for Python 3.6 and later: parse and generate
+FieldListFile structures over asyncio.StreamReader and asyncio.StreamWriter
+instances.
+
+Chunks must have a known length, so heads and items must be FieldList (or
+LazyFieldList) instances, or FieldListFile instances themselves composed of
+such chunks.
+"""
+import xfw
+
+__all__ = [
+    'AsyncReader', 'AsyncWriter',
+    'iterParseStream', 'parseStream', 'generateStream',
+]
+
+def _getChunkLength(chunk):
+    if isinstance(chunk, xfw.FieldList):
+        return chunk.total_length
+    if isinstance(chunk, xfw.LazyFieldList):
+        return chunk._field_list.total_length
+    raise TypeError('Chunks of unknown length are not supported: %r' % (
+        chunk, ))
+
+class AsyncReader(object):
+    """
+    Wraps an asyncio.StreamReader, reading from it by large blocks, and
+    serving synchronous reads from memory to xfw parsers.
+    """
+    def __init__(self, reader, hash_object=None, block_size=xfw.BLOCK_SIZE):
+        """
+        reader (asyncio.StreamReader)
+            Stream to read from.
+        hash_object
+            hashlib-like object (ex: xfw.HashPipeline instance) to update with
+            consumed data, in blocks. It only accounts for all consumed data
+            after flush() is called, which parse functions of this module do
+            before returning.
+        block_size (int)
+            Minimum length of reads from reader.
+        """
+        self._reader = reader
+        self._hash = hash_object
+        self._block_size = block_size
+        self._buffer = b''
+        self._offset = 0
+        self._updated = 0
+        self._buffer_offset = 0
+
+    def getAvailableLength(self):
+        return len(self._buffer) - self._offset
+
+    async def fill(self, length):
+        """
+        Read from reader until <length> bytes are available (or until
+        reader's end).
+        """
+        missing = length - len(self._buffer) + self._offset
+        if missing <= 0:
+            return
+        self.flush()
+        offset = self._offset
+        chunk_list = [self._buffer[offset:]]
+        while missing > 0:
+            data = await self._reader.read(max(missing, self._block_size))
+            if not data:
+                break
+            chunk_list.append(data)
+            missing -= len(data)
+        self._buffer = b''.join(chunk_list)
+        self._buffer_offset += offset
+        self._offset = self._updated = 0
+
+    def read(self, length):
+        """
+        Only returns available data, see fill.
+        """
+        offset = self._offset
+        result = self._buffer[offset:offset + length]
+        self._offset = offset + len(result)
+        return result
+
+    def tell(self):
+        return self._buffer_offset + self._offset
+
+    def flush(self):
+        """
+        Update hash object with consumed data.
+        """
+        offset = self._offset
+        if self._hash is not None and self._updated < offset:
+            self._hash.update(self._buffer[self._updated:offset])
+        self._updated = offset
+
+class AsyncWriter(object):
+    """
+    Wraps an asyncio.StreamWriter, accumulating synchronous writes from xfw
+    generators in memory and writing them by large blocks.
+    """
+    def __init__(self, writer, hash_object=None, block_size=xfw.BLOCK_SIZE):
+        """
+        writer (asyncio.StreamWriter)
+            Stream to write to.
+        hash_object
+            hashlib-like object to update with written data.
+        block_size (int)
+            Minimum length of writes to writer, except on flush.
+        """
+        self._writer = writer
+        self._hash = hash_object
+        self._block_size = block_size
+        self._chunk_list = []
+        self._chunk_len = 0
+
+    def write(self, data):
+        self._chunk_list.append(data)
+        self._chunk_len += len(data)
+
+    async def flush(self, force=True):
+        """
+        Write accumulated data and wait for writer to drain.
+        If force is false, only do so if at least one block is accumulated.
+        """
+        if not self._chunk_list or (not force and
+                self._chunk_len < self._block_size):
+            return
+        data = b''.join(self._chunk_list)
+        del self._chunk_list[:]
+        self._chunk_len = 0
+        if self._hash is not None:
+            self._hash.update(data)
+        self._writer.write(data)
+        await self._writer.drain()
+
+async def _skip(reader, length):
+    """
+    Consume <length> bytes from reader, by blocks.
+    """
+    while length > 0:
+        chunk_length = min(length, xfw.BLOCK_SIZE)
+        await reader.fill(chunk_length)
+        data = reader.read(chunk_length)
+        if not data:
+            raise ValueError('Stream too short to skip %i bytes' % (length, ))
+        length -= len(data)
+
+async def _skipItems(structure, reader, item, item_count):
+    """
+    Asynchronous equivalent of FieldListFile._skipItems.
+    """
+    separator_len = len(structure._getSeparator())
+    if isinstance(item, xfw.FieldListFile):
+        eatSeparator = structure.eatSeparator
+        for index in range(item_count):
+            if index:
+                await reader.fill(separator_len)
+                eatSeparator(reader)
+            await _skipStream(item, reader)
+    else:
+        await _skip(reader, item_count * (_getChunkLength(item) +
+            separator_len) - separator_len)
+
+async def _skipStream(structure, reader):
+    """
+    Asynchronous equivalent of FieldListFile._skipStream.
+    """
+    parsed_head, item_count, item = await _parseStreamHead(structure, reader)
+    if item_count:
+        await _skipItems(structure, reader, item, item_count)
+    return parsed_head
+
+async def _parseStreamHead(structure, reader):
+    """
+    Asynchronous equivalent of FieldListFile._parseStreamHead.
+    Only waits for data which is part of the structure, so parsing completes
+    even if reader's end is not reached.
+    """
+    head = structure._getHead()
+    await reader.fill(_getChunkLength(head))
+    parsed_head = head.parseStream(reader)
+    item_count, item = structure._item_callback(parsed_head)
+    if item_count:
+        await reader.fill(len(structure._getSeparator()))
+        structure.eatSeparator(reader)
+    return parsed_head, item_count, item
+
+async def _iterParseStream(structure, reader, eat_last_separator, depth):
+    separator_len = len(structure._getSeparator())
+    parsed_head, item_count, item = await _parseStreamHead(structure, reader)
+    yield depth, xfw.PARSED_HEAD, parsed_head
+    if item_count and not structure._filterItems(parsed_head):
+        await _skipItems(structure, reader, item, item_count)
+        item_count = 0
+    if item_count:
+        eatSeparator = structure.eatSeparator
+        if isinstance(item, xfw.FieldListFile):
+            for index in range(item_count):
+                if index:
+                    await reader.fill(separator_len)
+                    eatSeparator(reader)
+                async for event in _iterParseStream(item, reader, False,
+                        depth + 1):
+                    yield event
+        else:
+            item_parse = item.parseStream
+            # No separator precedes the first item.
+            length = _getChunkLength(item)
+            stride = length + separator_len
+            getAvailableLength = reader.getAvailableLength
+            for index in range(item_count):
+                if getAvailableLength() < length:
+                    await reader.fill(length)
+                if index:
+                    eatSeparator(reader)
+                yield depth, xfw.PARSED_ITEM, item_parse(reader)
+                length = stride
+    if eat_last_separator:
+        await reader.fill(separator_len)
+        structure.eatSeparator(reader)
+
+async def iterParseStream(structure, reader, eat_last_separator=False):
+    """
+    Asynchronous equivalent of FieldListFile.iterParseStream.
+    structure (FieldListFile)
+        Structure to parse.
+    reader (AsyncReader)
+        Stream to parse.
+    """
+    async for event in _iterParseStream(structure, reader, eat_last_separator,
+            0):
+        yield event
+    reader.flush()
+
+async def _parseStream(structure, reader, eat_last_separator):
+    separator_len = len(structure._getSeparator())
+    parsed_head, item_count, item = await _parseStreamHead(structure, reader)
+    if item_count and structure._filterItems(parsed_head):
+        item_list = []
+        append = item_list.append
+        eatSeparator = structure.eatSeparator
+        if isinstance(item, xfw.FieldListFile):
+            for index in range(item_count):
+                if index:
+                    await reader.fill(separator_len)
+                    eatSeparator(reader)
+                append(await _parseStream(item, reader, False))
+        else:
+            item_parse = item.parseStream
+            # No separator precedes the first item.
+            length = _getChunkLength(item)
+            stride = length + separator_len
+            getAvailableLength = reader.getAvailableLength
+            for index in range(item_count):
+                if getAvailableLength() < length:
+                    await reader.fill(length)
+                if index:
+                    eatSeparator(reader)
+                append(item_parse(reader))
+                length = stride
+    else:
+        if item_count:
+            await _skipItems(structure, reader, item, item_count)
+        item_list = None
+    if eat_last_separator:
+        await reader.fill(separator_len)
+        structure.eatSeparator(reader)
+    return parsed_head, item_list
+
+async def parseStream(structure, reader, eat_last_separator=False):
+    """
+    Asynchronous equivalent of FieldListFile.parseStream.
+    structure (FieldListFile)
+        Structure to parse.
+    reader (AsyncReader)
+        Stream to parse.
+    """
+    result = await _parseStream(structure, reader, eat_last_separator)
+    reader.flush()
+    return result
+
+async def _generateStream(structure, writer, args):
+    head_dict, item_list, item = structure._prepareGenerateStream(args)
+    structure._getHead().generateStream(writer, head_dict)
+    if item_list:
+        addSeparator = structure.addSeparator
+        if isinstance(item, xfw.FieldListFile):
+            for item_data in item_list:
+                addSeparator(writer)
+                await _generateStream(item, writer, item_data)
+        else:
+            item_generate = item.generateStream
+            flush = writer.flush
+            for item_data in item_list:
+                addSeparator(writer)
+                item_generate(writer, item_data)
+                await flush(False)
+
+async def generateStream(structure, writer, args, add_last_separator=False):
+    """
+    Asynchronous equivalent of FieldListFile.generateStream.
+    structure (FieldListFile)
+        Structure to generate.
+    writer (AsyncWriter)
+        Stream to generate to.
+    """
+    await _generateStream(structure, writer, args)
+    if add_last_separator:
+        structure.addSeparator(writer)
+    await writer.flush()